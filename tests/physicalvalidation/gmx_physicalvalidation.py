@@ -8,14 +8,36 @@ import json
 import argparse
 import re
 import math
+import time
+import hashlib
+import copy
+import pickle
+import threading
+import multiprocessing
 from collections import OrderedDict
 
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+import numpy as np
+
+import physical_validation
 from physical_validation import integrator, ensemble, kinetic_energy
 from physical_validation.util.gromacs_interface import GromacsInterface
 from physical_validation.data.gromacs_parser import GromacsParser
+from physical_validation.data import TrajectoryData
+from physical_validation.util import profiling
 
 
-def mkdir_bk(dirname, verbose=False, nobackup=False):
+def mkdir_bk(dirname, verbose=False, nobackup=False, keep=False):
+    if os.path.exists(dirname) and keep:
+        return
     if os.path.exists(dirname) and nobackup:
         shutil.rmtree(dirname)
     elif os.path.exists(dirname):
@@ -44,7 +66,7 @@ def file_bk(filename, verbose=False):
         os.rename(filename, filename.replace(basename, bk_file))
 
 
-def basic_run_cmds(directory, grompp_args=None, mdrun_args=None):
+def gmx_run_cmd(grompp_args=None, mdrun_args=None):
     grompp = '$GROMPPCMD -f system.mdp -p system.top -c system.gro -o system.tpr'
     if grompp_args:
         for arg in grompp_args:
@@ -53,21 +75,863 @@ def basic_run_cmds(directory, grompp_args=None, mdrun_args=None):
     if mdrun_args:
         for arg in mdrun_args:
             mdrun += ' ' + arg
+    return grompp + ' && ' + mdrun
+
+
+def basic_run_cmds(directory, grompp_args=None, mdrun_args=None):
     return [
         'oldpath=$PWD',
         'cd ' + directory,
-        grompp + ' && ' + mdrun,
+        gmx_run_cmd(grompp_args, mdrun_args),
         'cd $oldpath'
     ]
 
 
+def script_gmx(gmx):
+    # executables given by name are looked up in the PATH by the shell
+    if os.path.dirname(gmx):
+        return os.path.abspath(gmx)
+    return gmx
+
+
+script_header = '# This file was created by the physical validation suite for GROMACS.\n'
+job_file = 'run_simulations.jobs'
+run_script_file = 'run_simulation.sh'
+# number of atoms per core down to which simulations typically scale well,
+# used for the resource hints of the job scripts
+atoms_per_core = 1000
+
+
+def write_serial_script(script_file, target_path, runs, gmx):
+    # a single script running all simulations one after the other
+    with open(script_file, 'w') as f:
+        f.write(script_header)
+        f.write('\n# Define run variables\n')
+        f.write('WORKDIR=' + os.path.abspath(target_path) + '\n')
+        f.write('GROMPPCMD="' + script_gmx(gmx) + ' grompp"\n')
+        f.write('MDRUNCMD="' + script_gmx(gmx) + ' mdrun"\n')
+        f.write('\n# Run systems\n')
+        f.write('startpath=$PWD\n')
+        f.write('cd $WORKDIR\n')
+        for run in runs:
+            for cmd in basic_run_cmds(directory=os.path.relpath(os.path.abspath(run['dir']),
+                                                                os.path.abspath(target_path)),
+                                      grompp_args=run['grompp_args'],
+                                      mdrun_args=run['mdrun_args']):
+                f.write(cmd + '\n')
+            f.write('\n')
+        f.write('cd $startpath\n')
+
+
+def resource_hints(run_dir, ncores=None):
+    # cores, atoms and steps of a run, derived from its input files
+    nsteps = run_steps(run_dir)
+    with open(os.path.join(run_dir, 'system.gro')) as gro:
+        gro.readline()
+        natoms = int(gro.readline())
+    cores = max(1, natoms // atoms_per_core)
+    if ncores:
+        cores = min(cores, ncores)
+    return {'cores': cores, 'atoms': natoms, 'steps': nsteps}
+
+
+def write_run_script(run, target_path, gmx, hints, mpicmd=None):
+    # script running a single simulation, independent of the working
+    # directory it is called from. The number of threads can be set by
+    # the caller using the NTHREADS environment variable.
+    mdrun_args = list(run['mdrun_args']) if run['mdrun_args'] else []
+    if not any(arg in mdrun_args for arg in ['-nt', '-ntmpi', '-ntomp']):
+        mdrun_args.append('${NTHREADS:+' + ('-ntomp' if mpicmd else '-nt') + ' $NTHREADS}')
+    mdruncmd = script_gmx(gmx) + ' mdrun'
+    if mpicmd:
+        mdruncmd = mpicmd + ' ' + mdruncmd
+    filename = os.path.join(run['dir'], run_script_file)
+    with open(filename, 'w') as f:
+        f.write('#!/bin/sh\n')
+        f.write(script_header)
+        f.write('# Runs ' + os.path.relpath(run['dir'], target_path) +
+                ' (system ' + run['system'] + ')\n')
+        f.write('# Resource hints: ' +
+                ' '.join(key + '=' + str(hints[key]) for key in ['cores', 'atoms', 'steps']) +
+                '\n')
+        f.write('GROMPPCMD="' + script_gmx(gmx) + ' grompp"\n')
+        f.write('MDRUNCMD="' + mdruncmd + '"\n')
+        f.write('cd "$(dirname "$0")" || exit 1\n')
+        f.write(gmx_run_cmd(run['grompp_args'], mdrun_args) + '\n')
+    os.chmod(filename, 0o755)
+
+
+def write_job_scripts(target_path, runs, gmx, kind, njobs=1, ncores=None, mpicmd=None,
+                      nobackup=False):
+    # writes a script per run, a job list, and either a runner executing
+    # the jobs concurrently (kind 'manifest') or an array job script
+    # executing a single job selected by its index (kind 'array').
+    # Returns the file name of the runner / array job script.
+    target_path = os.path.abspath(target_path)
+    hints = {}
+    costs = {}
+    for run in runs:
+        hints[run['dir']] = resource_hints(run['dir'], ncores)
+        costs[run['dir']] = float(hints[run['dir']]['atoms'] * hints[run['dir']]['steps'])
+        write_run_script(run, target_path, gmx, hints[run['dir']], mpicmd)
+    # long runs first, such that the short runs fill up at the end
+    timings = read_timings(os.path.join(target_path, 'physicalvalidation_timings.json'))
+    runs = schedule_runs(runs, costs,
+                         {os.path.join(target_path, d): t for d, t in timings.items()})
+
+    # one line per run: directory, cores, atoms, steps (tab-separated)
+    jobs = os.path.join(target_path, job_file)
+    if not nobackup:
+        file_bk(jobs)
+    with open(jobs, 'w') as f:
+        for run in runs:
+            h = hints[run['dir']]
+            f.write('\t'.join([os.path.relpath(os.path.abspath(run['dir']), target_path),
+                               str(h['cores']), str(h['atoms']), str(h['steps'])]) + '\n')
+
+    if kind == 'manifest':
+        script_file = os.path.join(target_path, 'run_simulations.sh')
+        lines = [
+            '# Runs the simulations listed in ' + job_file + ', NJOBS at a time.',
+            '# NCORES cores are shared equally between the concurrent simulations,',
+            '# unless NTHREADS is set. The output of every simulation is written to',
+            '# run_simulation.log in its directory.',
+            'WORKDIR=' + target_path,
+            'NJOBS=${NJOBS:-' + str(njobs) + '}',
+            'NCORES=${NCORES:-' + (str(ncores) if ncores else
+                                   '$(getconf _NPROCESSORS_ONLN 2>/dev/null || echo 1)') + '}',
+            'NTHREADS=${NTHREADS:-$(( NCORES / NJOBS > 0 ? NCORES / NJOBS : 1 ))}',
+            'export NTHREADS',
+            'cut -f1 "$WORKDIR/' + job_file + '" | xargs -P "$NJOBS" -I{} sh -c \\',
+            '    \'sh "$1/' + run_script_file + '" > "$1/run_simulation.log" 2>&1 || '
+            'echo "FAILED: $1"\' sh "$WORKDIR/{}"'
+        ]
+    else:
+        script_file = os.path.join(target_path, 'run_simulations_array.sh')
+        lines = [
+            '# Runs a single simulation listed in ' + job_file + ' (one job per line:',
+            '# directory, cores, atoms, steps), selected by its index (1-' + str(len(runs)) + ')',
+            '# given as argument or as array task id by the scheduler. The number of',
+            '# threads defaults to the cores hint of the job, unless NTHREADS is set.',
+            'WORKDIR=' + target_path,
+            'TASK=${1:-${SLURM_ARRAY_TASK_ID:-${PBS_ARRAY_INDEX:-${PBS_ARRAYID:-'
+            '${SGE_TASK_ID:-${LSB_JOBINDEX:-}}}}}}',
+            'JOB=$(sed -n "${TASK}p" "$WORKDIR/' + job_file + '")',
+            'if [ -z "$TASK" ] || [ -z "$JOB" ]; then',
+            '    echo "Usage: $0 index (1-' + str(len(runs)) + ')" >&2',
+            '    exit 1',
+            'fi',
+            'NTHREADS=${NTHREADS:-$(echo "$JOB" | cut -f2)}',
+            'export NTHREADS',
+            'exec sh "$WORKDIR/$(echo "$JOB" | cut -f1)/' + run_script_file + '"'
+        ]
+    if not nobackup:
+        file_bk(script_file)
+    with open(script_file, 'w') as f:
+        f.write('#!/bin/sh\n')
+        f.write(script_header)
+        for line in lines:
+            f.write(line + '\n')
+    os.chmod(script_file, 0o755)
+    return script_file
+
+
+def process_times():
+    # wall time, and cpu time of this process and its terminated children
+    t = os.times()
+    return time.time(), t[0] + t[1] + t[2] + t[3]
+
+
+def elapsed_since(start):
+    wall, cpu = process_times()
+    return {'wall': wall - start[0], 'cpu': cpu - start[1]}
+
+
+def peak_rss():
+    # peak resident set size of this process in kB, None if unavailable
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        # bytes on macOS
+        rss //= 1024
+    return rss
+
+
+def child_stage(gmx_interface, start, returncode):
+    # timing of the last grompp or mdrun call
+    stage = {'wall': time.time() - start,
+             'cpu': None,
+             'peak_rss': None,
+             'returncode': returncode}
+    usage = gmx_interface.resource_usage
+    if usage is not None:
+        stage['cpu'] = usage.ru_utime + usage.ru_stime
+        stage['peak_rss'] = usage.ru_maxrss
+    return stage
+
+
+def core_slices(ncores, njobs):
+    # split the core budget in equal, non-overlapping slices
+    # returns list of (number of threads, pinning offset)
+    nthreads = max(1, ncores // njobs)
+    return [(nthreads, (n * nthreads) % ncores) for n in range(njobs)]
+
+
+def thread_args(mdrun_args, nthreads, offset, mpicmd=None):
+    args = list(mdrun_args) if mdrun_args else []
+    # don't override user choices
+    if not any(arg in args for arg in ['-nt', '-ntmpi', '-ntomp']):
+        if mpicmd:
+            args += ['-ntomp', str(nthreads)]
+        else:
+            args += ['-nt', str(nthreads)]
+    if '-pin' not in args:
+        args += ['-pin', 'on', '-pinoffset', str(offset)]
+    return args
+
+
+def file_hash(filename):
+    h = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def gmx_version(gmx_interface):
+    # cached, see gromacs_interface.probe
+    if gmx_interface is None:
+        return None
+    return gmx_interface.version
+
+
+manifest_file = 'physicalvalidation_manifest.json'
+
+
+analysis_files = ['mdout.mdp', 'system.top', 'system.gro', 'system.edr', 'system.trr']
+
+
+def code_hash():
+    # hash of the analysis code: this driver (containing the test classes)
+    # and the sources of the physical_validation package
+    h = hashlib.sha256()
+    package_dir = os.path.dirname(os.path.abspath(physical_validation.__file__))
+    sources = [os.path.abspath(__file__)]
+    for root, dirs, files in os.walk(package_dir):
+        dirs.sort()
+        sources.extend(os.path.join(root, f) for f in sorted(files) if f.endswith('.py'))
+    for filename in sources:
+        h.update(os.path.basename(filename).encode())
+        h.update(file_hash(filename).encode())
+    return h.hexdigest()
+
+
+def result_key(test_name, test_args, system_dir, file_hashes, code=None):
+    # identifies the result of a test: test class and arguments, files
+    # of all analyzed simulations, and version and sources of the analysis
+    # code (see code_hash).
+    # file_hashes: dict caching hashes of files by (path, size, mtime)
+    test = all_tests[test_name]
+    files = {}
+    for d in test.analyze_dirs(system_dir, test_args):
+        for f in analysis_files:
+            filename = os.path.join(d, f)
+            if not os.path.exists(filename):
+                files[os.path.relpath(filename, system_dir)] = None
+                continue
+            stat = os.stat(filename)
+            key = (filename, stat.st_size, stat.st_mtime)
+            if key not in file_hashes:
+                file_hashes[key] = file_hash(filename)
+            files[os.path.relpath(filename, system_dir)] = file_hashes[key]
+    key = {
+        'test': test.__name__,
+        'args': vars(test.parser().parse_args(test_args)),
+        'files': files,
+        'version': physical_validation.__version__,
+        'code': code
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+def read_results(filename):
+    if not os.path.exists(filename):
+        return {}
+    with open(filename) as f:
+        try:
+            return json.load(f)
+        except ValueError:
+            return {}
+
+
+def write_results(filename, results):
+    def convert(obj):
+        # numpy types
+        if hasattr(obj, 'tolist'):
+            return obj.tolist()
+        raise TypeError(repr(obj) + ' is not JSON serializable')
+    tmp = filename + '.' + str(os.getpid())
+    with open(tmp, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True, default=convert)
+    os.rename(tmp, filename)
+
+
+def write_junit(filename, report):
+    # JUnit XML report: one test suite per system, one test case per test
+    import xml.etree.ElementTree as ET
+    suites = ET.Element('testsuites', name='physical_validation')
+    totals = {'tests': 0, 'failures': 0, 'errors': 0, 'time': 0.0}
+    for system_name, system in report['systems'].items():
+        suite = ET.SubElement(suites, 'testsuite', name=system_name)
+        counts = {'tests': 0, 'failures': 0, 'errors': 0, 'time': 0.0}
+        for test in system['tests']:
+            elapsed = 0.0
+            if not test['cached']:
+                elapsed = test['parsing']['wall'] + test['analysis']['wall']
+            case = ET.SubElement(suite, 'testcase', classname=system_name,
+                                 name=' '.join([test['test']] + list(test['args'])),
+                                 time='{:.3f}'.format(elapsed))
+            counts['tests'] += 1
+            counts['time'] += elapsed
+            if 'error' in test:
+                counts['errors'] += 1
+                ET.SubElement(case, 'error', message=test['error'])
+                continue
+            properties = ET.SubElement(case, 'properties')
+            for key in ['result', 'tolerance']:
+                ET.SubElement(properties, 'property', name=key, value=str(test[key]))
+            if not test['passed']:
+                counts['failures'] += 1
+                failure = ET.SubElement(case, 'failure',
+                                        message=test['message'].split('\n')[0])
+                failure.text = test['message']
+        for key in counts:
+            totals[key] += counts[key]
+            suite.set(key, '{:.3f}'.format(counts[key]) if key == 'time' else str(counts[key]))
+    for key in totals:
+        suites.set(key, '{:.3f}'.format(totals[key]) if key == 'time' else str(totals[key]))
+    ET.ElementTree(suites).write(filename, encoding='utf-8', xml_declaration=True)
+
+
+def run_manifest(run, version):
+    # everything determining the outcome of a run
+    return {
+        'files': {f: file_hash(os.path.join(run['dir'], f))
+                  for f in ['system.mdp', 'system.top', 'system.gro']},
+        'grompp_args': list(run['grompp_args']) if run['grompp_args'] else [],
+        'mdrun_args': list(run['mdrun_args']) if run['mdrun_args'] else [],
+        'gmx_version': version
+    }
+
+
+def write_manifest(run_dir, manifest, complete):
+    with open(os.path.join(run_dir, manifest_file), 'w') as f:
+        json.dump({'inputs': manifest, 'complete': complete}, f, indent=2, sort_keys=True)
+
+
+def run_state(run, manifest):
+    # 'complete': finished previously with identical inputs
+    # 'interrupted': started previously with identical inputs, checkpoint available
+    # 'new': needs to be (re-)ran from scratch
+    filename = os.path.join(run['dir'], manifest_file)
+    if not os.path.exists(filename):
+        return 'new'
+    with open(filename) as f:
+        try:
+            previous = json.load(f)
+        except ValueError:
+            return 'new'
+    if previous.get('inputs') != manifest:
+        return 'new'
+    if previous.get('complete') and all(
+            os.path.exists(os.path.join(run['dir'], 'system.' + suffix))
+            for suffix in ['edr', 'trr']):
+        return 'complete'
+    if all(os.path.exists(os.path.join(run['dir'], 'system.' + suffix))
+           for suffix in ['cpt', 'tpr']):
+        return 'interrupted'
+    return 'new'
+
+
+def run_simulation(gmx_interface, run, mdrun_args, mpicmd=None,
+                   log='physicalvalidation_gmx.log'):
+    # runs with a manifest are recorded as incomplete until mdrun finished
+    manifest = run.get('manifest')
+    if manifest is not None:
+        write_manifest(run['dir'], manifest, complete=False)
+    # continue interrupted runs from checkpoint
+    resume = run.get('state') == 'interrupted'
+    stages = {}
+    # send messages from GROMACS to log in run directory
+    with open(os.path.join(run['dir'], log), 'a' if resume else 'w') as gmx_log:
+        if not resume:
+            returncode, stages['grompp'] = run_grompp(gmx_interface, run, gmx_log)
+            if returncode != 0:
+                return 'grompp', returncode, stages
+        else:
+            mdrun_args = list(mdrun_args) if mdrun_args else []
+            mdrun_args += ['-cpi', 'system.cpt']
+        start = time.time()
+        returncode = gmx_interface.mdrun(tpr='system.tpr',
+                                         deffnm='system',
+                                         cwd=run['dir'],
+                                         args=mdrun_args,
+                                         stdout=gmx_log,
+                                         stderr=gmx_log,
+                                         mpicmd=mpicmd)
+        stages['mdrun'] = child_stage(gmx_interface, start, returncode)
+    if manifest is not None and returncode == 0:
+        write_manifest(run['dir'], manifest, complete=True)
+    return 'mdrun', returncode, stages
+
+
+def run_steps(run_dir):
+    options = GromacsInterface.read_mdp(os.path.join(run_dir, 'system.mdp'))
+    try:
+        return max(int(options['nsteps']), 1)
+    except (KeyError, ValueError):
+        return 1
+
+
+def run_grompp(gmx_interface, run, gmx_log):
+    start = time.time()
+    returncode = gmx_interface.grompp(mdp='system.mdp',
+                                      top='system.top',
+                                      gro='system.gro',
+                                      tpr='system.tpr',
+                                      cwd=run['dir'],
+                                      args=run['grompp_args'],
+                                      stdout=gmx_log,
+                                      stderr=gmx_log,
+                                      reuse=True)
+    return returncode, child_stage(gmx_interface, start, returncode)
+
+
+def group_runs(runs):
+    # groups the runs which can be ran as a single multi-simulation:
+    # subsystems of the same system (located in the same directory) with
+    # identical mdrun arguments, number of atoms and number of steps, such
+    # that no simulation idles while waiting for a longer one. Interrupted
+    # runs are continued separately from their checkpoint.
+    # Returns list of groups of at least two runs, and list of the
+    # remaining runs.
+    groups = OrderedDict()
+    singles = []
+    for run in runs:
+        if run.get('state') == 'interrupted':
+            singles.append(run)
+            continue
+        hints = resource_hints(run['dir'])
+        key = (run['system'], os.path.dirname(os.path.abspath(run['dir'])),
+               tuple(run['mdrun_args']) if run['mdrun_args'] else (),
+               hints['atoms'], hints['steps'])
+        groups.setdefault(key, []).append(run)
+    for group in list(groups.values()):
+        if len(group) < 2:
+            singles.extend(group)
+    return [group for group in groups.values() if len(group) > 1], singles
+
+
+def run_multisim(gmx_interface, group, mdrun_args, mpicmd=None,
+                 log='physicalvalidation_gmx.log'):
+    # runs grompp in every directory of the group, and then a single
+    # `mdrun -multidir` for all directories grompp succeeded in. The output
+    # of mdrun is written to the log of the first directory.
+    # Returns list of (run, program, returncode, stages).
+    results = []
+    ready = []
+    for run in group:
+        manifest = run.get('manifest')
+        if manifest is not None:
+            write_manifest(run['dir'], manifest, complete=False)
+        with open(os.path.join(run['dir'], log), 'w') as gmx_log:
+            returncode, stage = run_grompp(gmx_interface, run, gmx_log)
+        if returncode != 0:
+            results.append((run, 'grompp', returncode, {'grompp': stage}))
+        else:
+            ready.append((run, {'grompp': stage}))
+    if not ready:
+        return results
+
+    parent = os.path.dirname(os.path.abspath(ready[0][0]['dir']))
+    dirs = [os.path.relpath(os.path.abspath(run['dir']), parent) for run, _ in ready]
+    main_log = os.path.join(ready[0][0]['dir'], log)
+    for run, _ in ready[1:]:
+        with open(os.path.join(run['dir'], log), 'a') as gmx_log:
+            gmx_log.write('\nmdrun ran as multi-simulation of ' + ', '.join(dirs) +
+                          ', see ' + main_log + '\n')
+    start = time.time()
+    with open(main_log, 'a') as gmx_log:
+        returncode = gmx_interface.mdrun_multi(dirs, tpr='system.tpr', deffnm='system',
+                                               cwd=parent, args=mdrun_args,
+                                               stdout=gmx_log, stderr=gmx_log,
+                                               mpicmd=mpicmd)
+    stage = child_stage(gmx_interface, start, returncode)
+    stage['multidir'] = len(ready)
+    for run, stages in ready:
+        stages['mdrun'] = stage
+        manifest = run.get('manifest')
+        if manifest is not None and returncode == 0:
+            write_manifest(run['dir'], manifest, complete=True)
+        results.append((run, 'mdrun', returncode, stages))
+    return results
+
+
+def run_multisims(gmx_interface, groups, mpicmd=None,
+                  log='physicalvalidation_gmx.log'):
+    # runs the groups one after the other, every group using all MPI
+    # ranks started by `mpicmd`.
+    # Returns list of runs which failed, and dict of the timings of all
+    # runs, see run_simulations.
+    failed = []
+    records = {}
+    for n, group in enumerate(groups):
+        print('\rRunning multi-simulations... [{:d}/{:d}] '.format(n, len(groups)), end='')
+        sys.stdout.flush()  # py2 compatibility
+        start = time.time()
+        try:
+            results = run_multisim(gmx_interface, group, group[0]['mdrun_args'],
+                                   mpicmd=mpicmd, log=log)
+        except Exception as err:
+            results = [(run, type(err).__name__ + ': ' + str(err), None, {}) for run in group]
+        elapsed = time.time() - start
+        for run, program, returncode, stages in results:
+            if returncode != 0:
+                failed.append((run, program, returncode))
+            records[run['dir']] = {'wall': elapsed,
+                                   'returncode': returncode,
+                                   'stages': stages,
+                                   'multidir': len(group)}
+    print('\rRunning multi-simulations... [{:d}/{:d}] '.format(len(groups), len(groups)), end='')
+    return failed, records
+
+
+def estimate_cost(gmx_interface, run_dir):
+    # the cost of a run is assumed to scale with the number of steps
+    # times the number of atoms
+    nsteps = run_steps(run_dir)
+    options = GromacsInterface.read_mdp(os.path.join(run_dir, 'system.mdp'))
+    include = '-I' + run_dir
+    if 'include' in options:
+        include += ' ' + options['include']
+    try:
+        molecules = gmx_interface.read_system_from_top(os.path.join(run_dir, 'system.top'),
+                                                       define=options.get('define'),
+                                                       include=include)
+        natoms = sum(m['nmolecs'] * m['natoms'] for m in molecules)
+    except (IOError, OSError, ValueError, KeyError, IndexError):
+        # fall back to the atom count in the gro file
+        with open(os.path.join(run_dir, 'system.gro')) as gro:
+            gro.readline()
+            natoms = int(gro.readline())
+    return float(nsteps * natoms)
+
+
+def read_timings(filename):
+    if filename is None or not os.path.exists(filename):
+        return {}
+    with open(filename) as f:
+        return json.load(f)
+
+
+def write_timings(filename, timings):
+    with open(filename, 'w') as f:
+        json.dump(timings, f, indent=2, sort_keys=True)
+
+
+def schedule_runs(runs, costs, timings=None):
+    # longest-processing-time-first: sort runs by descending estimated
+    # run time. Worker slices take the next run from the front of the
+    # list whenever they are idle, which packs the long runs first and
+    # fills up with the short runs.
+    # The estimated cost is converted to seconds using the average cost
+    # per second of previous runs. Runs which were timed before with an
+    # identical cost estimate use their measured time.
+    # `costs` and `timings` are keyed by the run directory.
+    if timings is None:
+        timings = {}
+    recorded = [t for t in timings.values() if t['cost'] > 0 and t['time'] > 0]
+    rate = 1.0
+    if recorded:
+        rate = (sum(t['time'] for t in recorded) /
+                sum(t['cost'] for t in recorded))
+
+    def estimate(run):
+        cost = costs[run['dir']]
+        timing = timings.get(run['dir'])
+        if timing is not None and timing['cost'] == cost:
+            return timing['time']
+        return cost * rate
+
+    return sorted(runs, key=estimate, reverse=True)
+
+
+def run_simulations(gmx_interface, runs, njobs=1, ncores=None, mpicmd=None,
+                    log='physicalvalidation_gmx.log'):
+    # runs up to `njobs` simulations concurrently, each on its own slice
+    # of `ncores` cores. Every worker thread owns one slice, and takes
+    # the next run from the queue once its previous run finished.
+    # Returns list of runs which failed, as (run, program, returncode),
+    # and dict of the wall times and per-stage timings of all runs, keyed
+    # by directory.
+    nruns = len(runs)
+    njobs = max(1, min(njobs, nruns))
+    if ncores is None and njobs > 1:
+        try:
+            ncores = multiprocessing.cpu_count()
+        except NotImplementedError:
+            ncores = njobs
+    slices = core_slices(ncores, njobs) if ncores else [None] * njobs
+
+    todo = queue.Queue()
+    for run in runs:
+        todo.put(run)
+    done = queue.Queue()
+
+    def worker(core_slice):
+        while True:
+            try:
+                run = todo.get(block=False)
+            except queue.Empty:
+                return
+            mdrun_args = run['mdrun_args']
+            if core_slice is not None:
+                mdrun_args = thread_args(mdrun_args, core_slice[0], core_slice[1], mpicmd)
+            start = time.time()
+            try:
+                program, returncode, stages = run_simulation(gmx_interface, run, mdrun_args,
+                                                             mpicmd=mpicmd, log=log)
+            except Exception as err:
+                program, returncode, stages = type(err).__name__ + ': ' + str(err), None, {}
+            done.put((run, program, returncode, stages, time.time() - start))
+
+    workers = [threading.Thread(target=worker, args=(core_slice,))
+               for core_slice in slices]
+    for w in workers:
+        w.daemon = True
+        w.start()
+
+    failed = []
+    records = {}
+    print('\rRunning (sub)systems... [{:d}/{:d}] '.format(0, nruns), end='')
+    sys.stdout.flush()  # py2 compatibility
+    for n in range(nruns):
+        run, program, returncode, stages, elapsed = done.get()
+        if returncode != 0:
+            failed.append((run, program, returncode))
+        records[run['dir']] = {'wall': elapsed,
+                               'returncode': returncode,
+                               'stages': stages}
+        print('\rRunning (sub)systems... [{:d}/{:d}] '
+              '(finished {:s} in {:.1f}s) '.format(n + 1, nruns, os.path.relpath(run['dir']),
+                                                  elapsed), end='')
+        sys.stdout.flush()  # py2 compatibility
+    for w in workers:
+        w.join()
+
+    return failed, records
+
+
+class BaseData(object):
+    # Parsed data of the base simulation of a system, re-used by all tests
+    # of that system. Used like a dictionary with keys 'reduced' (no
+    # trajectory) and 'full'. If `cache_dir` is given, the parsed data is
+    # shared between processes through files in `cache_dir`: The
+    # trajectory arrays are stored as .npy files and memory-mapped when
+    # loaded, the remaining data is pickled. The first process requesting
+    # data which was not parsed yet holds `lock` until it stored the data,
+    # such that every system is parsed only once. Stored data is only
+    # re-used if the simulation files in `cache_dir` did not change since.
+    keys = ['reduced', 'full']
+
+    def __init__(self, cache_dir=None, lock=None):
+        self.__data = {key: None for key in self.keys}
+        self.__cache_dir = cache_dir
+        self.__lock = lock
+        self.__locked = False
+
+    def __filename(self, key, field=None):
+        name = 'physicalvalidation_' + key
+        if field is None:
+            return os.path.join(self.__cache_dir, name + '.pkl')
+        return os.path.join(self.__cache_dir, name + '_' + field + '.npy')
+
+    def __stamp(self):
+        # size and modification time of the parsed simulation files
+        stamp = []
+        for f in analysis_files:
+            filename = os.path.join(self.__cache_dir, f)
+            if os.path.exists(filename):
+                stat = os.stat(filename)
+                stamp.append((f, stat.st_size, stat.st_mtime))
+        return stamp
+
+    def __load(self, key):
+        # returns None if the stored data is outdated
+        with open(self.__filename(key), 'rb') as f:
+            stamp, data = pickle.load(f)
+        if stamp != self.__stamp():
+            return None
+        arrays = {}
+        for field in TrajectoryData.trajectories():
+            if os.path.exists(self.__filename(key, field)):
+                arrays[field] = np.load(self.__filename(key, field), mmap_mode='r')
+        if arrays:
+            data.trajectory = TrajectoryData(**arrays)
+        return data
+
+    def __store(self, key, data):
+        stripped = copy.copy(data)
+        if data.trajectory is not None:
+            stripped.trajectory = TrajectoryData()
+            for field in TrajectoryData.trajectories():
+                if data.trajectory[field] is not None:
+                    np.save(self.__filename(key, field), data.trajectory[field])
+                elif os.path.exists(self.__filename(key, field)):
+                    # left over from outdated data
+                    os.remove(self.__filename(key, field))
+        # write to temporary file first, other processes only see complete data
+        tmp = self.__filename(key) + '.' + str(os.getpid())
+        try:
+            with open(tmp, 'wb') as f:
+                pickle.dump((self.__stamp(), stripped), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp, self.__filename(key))
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def __getitem__(self, key):
+        if self.__data[key] is not None or self.__cache_dir is None:
+            return self.__data[key]
+        if self.__lock is not None and not self.__locked:
+            self.__lock.acquire()
+            self.__locked = True
+        if os.path.exists(self.__filename(key)):
+            self.__data[key] = self.__load(key)
+            if self.__data[key] is not None:
+                self.release()
+        # if None, the caller is expected to parse and set the data
+        return self.__data[key]
+
+    def __setitem__(self, key, data):
+        self.__data[key] = data
+        if self.__cache_dir is not None:
+            self.__store(key, data)
+            self.release()
+
+    def release(self):
+        if self.__locked:
+            self.__locked = False
+            self.__lock.release()
+
+    def clear(self):
+        # remove cache files
+        if self.__cache_dir is None:
+            return
+        for key in self.keys:
+            for filename in ([self.__filename(key)] +
+                             [self.__filename(key, field)
+                              for field in TrajectoryData.trajectories()]):
+                if os.path.exists(filename):
+                    os.remove(filename)
+
+
+class TimedParser(object):
+    # wraps a GromacsParser, accumulating the time spent parsing
+    def __init__(self, parser):
+        self.parser = parser
+        self.timing = {'wall': 0, 'cpu': 0}
+
+    def get_simulation_data(self, *args, **kwargs):
+        start = process_times()
+        try:
+            return self.parser.get_simulation_data(*args, **kwargs)
+        finally:
+            for key, value in elapsed_since(start).items():
+                self.timing[key] += value
+
+
+# analysis state of the current process, see init_analysis
+analysis_state = {}
+
+
+def init_analysis(gmx, cache_dirs=None, locks=None, profile=False):
+    # cache_dirs and locks: dicts keyed by system name, used to share
+    # the base data between processes
+    # profile: profile the analysis in worker processes, the timers are
+    # returned per test (see analyze_test)
+    analysis_state['parser'] = GromacsParser(exe=gmx)
+    analysis_state['base_data'] = {}
+    analysis_state['cache_dirs'] = cache_dirs if cache_dirs else {}
+    analysis_state['locks'] = locks if locks else {}
+    analysis_state['profile'] = profile
+    if profile:
+        profiling.enable()
+
+
+def analyze_test(task):
+    # analyze a single (system, test, args) combination
+    # returns the result dictionary (or the exception), the captured output
+    # and the timings of the parsing and analysis stages
+    system_name, target_dir, test_name, test_args, verbosity = task
+    base_data = analysis_state['base_data']
+    if system_name not in base_data:
+        base_data[system_name] = BaseData(analysis_state['cache_dirs'].get(system_name),
+                                          analysis_state['locks'].get(system_name))
+    parser = TimedParser(analysis_state['parser'])
+    if analysis_state['profile']:
+        profiling.reset()
+    start = process_times()
+    stdout = sys.stdout
+    sys.stdout = StringIO()
+    try:
+        result = all_tests[test_name].analyze_parser(parser, target_dir,
+                                                     system_name, base_data[system_name],
+                                                     verbosity, test_args)
+    except Exception as err:
+        result = err
+    finally:
+        base_data[system_name].release()
+        output = sys.stdout.getvalue()
+        sys.stdout = stdout
+    total = elapsed_since(start)
+    timing = {'parsing': parser.timing,
+              'analysis': {key: total[key] - parser.timing[key] for key in total},
+              'peak_rss': peak_rss()}
+    if analysis_state['profile']:
+        timing['profile'] = profiling.results()
+    return result, output, timing
+
+
+def analyze_tests(tasks, gmx, njobs=1, cache_dirs=None):
+    # analyze tasks (see analyze_test), using a process pool if njobs > 1
+    # yields the results in the order of `tasks`
+    if njobs <= 1:
+        init_analysis(gmx)
+        for task in tasks:
+            yield analyze_test(task)
+        return
+    locks = {system_name: multiprocessing.Lock() for system_name in cache_dirs}
+    pool = multiprocessing.Pool(njobs, initializer=init_analysis,
+                                initargs=(gmx, cache_dirs, locks, profiling.is_enabled()))
+    try:
+        for result in pool.imap(analyze_test, tasks):
+            yield result
+    finally:
+        pool.close()
+        pool.join()
+
+
 class Test(object):
     @classmethod
     def parser(cls):
         raise NotImplementedError
 
     @classmethod
-    def prepare_parser(cls, input_dir, target_dir, system_name, nobackup, args):
+    def prepare_parser(cls, input_dir, target_dir, system_name, nobackup, args, resume=False):
         raise NotImplementedError
 
     @classmethod
@@ -75,13 +939,18 @@ class Test(object):
         raise NotImplementedError
 
     @classmethod
-    def prepare(cls, input_dir, target_dir, system_name, nobackup):
+    def prepare(cls, input_dir, target_dir, system_name, nobackup, resume=False):
         raise NotImplementedError
 
     @classmethod
     def analyze(cls, gmx_parser, system_dir, system_name, base_data, verbosity):
         raise NotImplementedError
 
+    @classmethod
+    def analyze_dirs(cls, system_dir, args):
+        # directories of the simulations analyzed by the test
+        return [os.path.join(system_dir, 'base')]
+
 
 class IntegratorTest(Test):
     @classmethod
@@ -102,10 +971,10 @@ class IntegratorTest(Test):
         return parser
 
     @classmethod
-    def prepare_parser(cls, input_dir, target_dir, system_name, nobackup, args):
+    def prepare_parser(cls, input_dir, target_dir, system_name, nobackup, args, resume=False):
         args = cls.parser().parse_args(args)
         return cls.prepare(input_dir, target_dir, system_name, nobackup,
-                           n_iterations=args.n_iterations)
+                           n_iterations=args.n_iterations, resume=resume)
 
     @classmethod
     def analyze_parser(cls, gmx_parser, system_dir, system_name, base_data, verbosity, args):
@@ -114,7 +983,15 @@ class IntegratorTest(Test):
                            tolerance=args.tolerance, n_iterations=args.n_iterations)
 
     @classmethod
-    def prepare(cls, input_dir, target_dir, system_name, nobackup, n_iterations=None):
+    def analyze_dirs(cls, system_dir, args):
+        args = cls.parser().parse_args(args)
+        return ([os.path.join(system_dir, 'base')] +
+                [os.path.join(system_dir, 'integrator_' + str(n))
+                 for n in range(1, args.n_iterations + 1)])
+
+    @classmethod
+    def prepare(cls, input_dir, target_dir, system_name, nobackup, n_iterations=None,
+                resume=False):
         # Standard value
         if n_iterations is None:
             n_iterations = cls.parser().get_default('n_iterations')
@@ -140,7 +1017,7 @@ class IntegratorTest(Test):
         directories = []
         for n in range(1, n_iterations+1):
             current_dir = os.path.join(target_dir, 'integrator_' + str(n))
-            mkdir_bk(current_dir, nobackup=nobackup)
+            mkdir_bk(current_dir, nobackup=nobackup, keep=resume)
             # update timesteps, length and intervals
             options['dt'] = str(float(options['dt'])*0.5)
             for key in ['nsteps', 'nstcalcenergy', 'nstenergy']:  # , 'nstlist']:
@@ -240,10 +1117,10 @@ class EnsembleTest(Test):
         return parser
 
     @classmethod
-    def prepare_parser(cls, input_dir, target_dir, system_name, nobackup, args):
+    def prepare_parser(cls, input_dir, target_dir, system_name, nobackup, args, resume=False):
         args = cls.parser().parse_args(args)
         return cls.prepare(input_dir, target_dir, system_name, nobackup,
-                           dtemp=args.dtemp, dpress=args.dpress)
+                           dtemp=args.dtemp, dpress=args.dpress, resume=resume)
 
     @classmethod
     def analyze_parser(cls, gmx_parser, system_dir, system_name, base_data, verbosity, args):
@@ -252,7 +1129,16 @@ class EnsembleTest(Test):
                            tolerance=args.tolerance, dtemp=args.dtemp, dpress=args.dpress)
 
     @classmethod
-    def prepare(cls, input_dir, target_dir, system_name, nobackup, dtemp=None, dpress=None):
+    def analyze_dirs(cls, system_dir, args):
+        args = cls.parser().parse_args(args)
+        nsystems = max(len(args.dtemp or []), len(args.dpress or []))
+        return ([os.path.join(system_dir, 'base')] +
+                [os.path.join(system_dir, 'ensemble_' + str(n))
+                 for n in range(1, nsystems + 1)])
+
+    @classmethod
+    def prepare(cls, input_dir, target_dir, system_name, nobackup, dtemp=None, dpress=None,
+                resume=False):
         # No standard values (system-dependent!)
         if not dtemp and not dpress:
             raise ValueError('Ensemble test for system ' + system_name +
@@ -305,7 +1191,7 @@ class EnsembleTest(Test):
         directories = []
         for n, (dt, dp) in enumerate(zip(dtemp, dpress)):
             current_dir = os.path.join(target_dir, 'ensemble_' + str(n+1))
-            mkdir_bk(current_dir, nobackup=nobackup)
+            mkdir_bk(current_dir, nobackup=nobackup, keep=resume)
             # change temperature & pressure
             options[ref_t_key] = str(ref_t + dt)
             if not no_press:
@@ -420,8 +1306,8 @@ class MaxwellBoltzmannTest(Test):
         return parser
 
     @classmethod
-    def prepare_parser(cls, input_dir, target_dir, system_name, nobackup, args):
-        return cls.prepare(input_dir, target_dir, system_name, nobackup)
+    def prepare_parser(cls, input_dir, target_dir, system_name, nobackup, args, resume=False):
+        return cls.prepare(input_dir, target_dir, system_name, nobackup, resume=resume)
 
     @classmethod
     def analyze_parser(cls, gmx_parser, system_dir, system_name, base_data, verbosity, args):
@@ -430,7 +1316,7 @@ class MaxwellBoltzmannTest(Test):
                            alpha=args.tolerance)
 
     @classmethod
-    def prepare(cls, input_dir, target_dir, system_name, nobackup):
+    def prepare(cls, input_dir, target_dir, system_name, nobackup, resume=False):
         # no additional sims needed, base is enough
         # could check energy writing settings
         return []
@@ -505,14 +1391,14 @@ class EquipartitionTest(Test):
         return parser
 
     @classmethod
-    def prepare(cls, input_dir, target_dir, system_name, nobackup):
+    def prepare(cls, input_dir, target_dir, system_name, nobackup, resume=False):
         # no additional sims needed, base is enough
         # could check position, velocity & energy writing settings
         return []
 
     @classmethod
-    def prepare_parser(cls, input_dir, target_dir, system_name, nobackup, args):
-        return cls.prepare(input_dir, target_dir, system_name, nobackup)
+    def prepare_parser(cls, input_dir, target_dir, system_name, nobackup, args, resume=False):
+        return cls.prepare(input_dir, target_dir, system_name, nobackup, resume=resume)
 
     @classmethod
     def analyze_parser(cls, gmx_parser, system_dir, system_name, base_data, verbosity, args):
@@ -547,7 +1433,7 @@ class EquipartitionTest(Test):
                 mdp=os.path.join(current_dir, 'mdout.mdp'),
                 top=os.path.join(current_dir, 'system.top'),
                 edr=os.path.join(current_dir, 'system.edr'),
-                gro=os.path.join(current_dir, 'system.trr')
+                trr=os.path.join(current_dir, 'system.trr')
             )
         base_result = base_data['full']
 
@@ -592,27 +1478,65 @@ class KinConstraintsTest(Test):
             prog=cls.__name__
         )
         parser.add_argument('-t', '--tolerance', type=float, default=0.1,
-                            help='Tolerance - TODO. Default: 0.1.')
+                            help=('The maximal root-mean-square relative velocity along\n'
+                                  'constrained bonds, relative to the root-mean-square\n'
+                                  'relative velocity per dimension. Default: 0.1.'))
+        parser.add_argument('--chunk_frames', type=int, default=None,
+                            help=('Number of trajectory frames analyzed at once.\n'
+                                  'Default: All frames.'))
 
         return parser
 
     @classmethod
-    def prepare(cls, input_dir, target_dir, system_name, nobackup):
+    def prepare(cls, input_dir, target_dir, system_name, nobackup, resume=False):
         # no additional sims needed, base is enough
         # could check if there are any constraints in the system
         return []
 
     @classmethod
-    def prepare_parser(cls, input_dir, target_dir, system_name, nobackup, args):
-        return cls.prepare(input_dir, target_dir, system_name, nobackup)
+    def prepare_parser(cls, input_dir, target_dir, system_name, nobackup, args, resume=False):
+        return cls.prepare(input_dir, target_dir, system_name, nobackup, resume=resume)
 
     @classmethod
     def analyze_parser(cls, gmx_parser, system_dir, system_name, base_data, verbosity, args):
-        raise NotImplementedError
+        args = cls.parser().parse_args(args)
+        return cls.analyze(gmx_parser, system_dir, system_name, base_data, verbosity,
+                           tolerance=args.tolerance, chunk_frames=args.chunk_frames)
 
     @classmethod
-    def analyze(cls, gmx_parser, system_dir, system_name, base_data, verbosity):
-        raise NotImplementedError
+    def analyze(cls, gmx_parser, system_dir, system_name, base_data, verbosity,
+                tolerance=None, chunk_frames=None):
+        # Standard value
+        if tolerance is None:
+            tolerance = cls.parser().get_default('tolerance')
+
+        # base data
+        if base_data['full'] is None:
+            current_dir = os.path.join(system_dir, 'base')
+            base_data['full'] = gmx_parser.get_simulation_data(
+                mdp=os.path.join(current_dir, 'mdout.mdp'),
+                top=os.path.join(current_dir, 'system.top'),
+                edr=os.path.join(current_dir, 'system.edr'),
+                trr=os.path.join(current_dir, 'system.trr')
+            )
+        base_result = base_data['full']
+
+        res = kinetic_energy.constraints(base_result, tolerance=tolerance,
+                                         chunk_frames=chunk_frames,
+                                         verbosity=verbosity)
+
+        test = res <= tolerance
+        if test:
+            message = 'KinConstraintsTest PASSED (rel. velocity = {:g}, tolerance = {:f})'.format(
+                res, tolerance)
+        else:
+            message = 'KinConstraintsTest FAILED (rel. velocity = {:g}, tolerance = {:f})'.format(
+                res, tolerance)
+
+        return {'test': test,
+                'result': res,
+                'tolerance': tolerance,
+                'message': message}
 
 
 all_tests = OrderedDict([
@@ -749,6 +1673,17 @@ def main(args):
                              'This requires that the systems have been prepared using this program.\n' +
                              'Default: If none of \'-p\', \'-r\' or \'-a\' is given,\n' +
                              '         the systems are prepared, ran and analyzed in one call.'))
+    parser.add_argument('--script', type=str, choices=['serial', 'manifest', 'array'],
+                        default='serial',
+                        help=('Kind of run script written with -p:\n' +
+                              '  serial: a single script running all simulations in sequence.\n' +
+                              '  manifest: a list of jobs and a runner executing them concurrently\n' +
+                              '            (see --jobs and --ncores, or NJOBS and NCORES at run time).\n' +
+                              '  array: a list of jobs and an array job script running a single job\n' +
+                              '         selected by its index, e.g. as SLURM, PBS, SGE or LSF job array.\n' +
+                              'Except for serial, every run directory also contains its own run script,\n' +
+                              'and the job list contains resource hints (cores, atoms, steps) per run.\n' +
+                              'Default: serial.'))
     parser.add_argument('-s', '--system', action='append', dest='systems',
                         metavar='system',
                         help=('Specify which system to run.\n' +
@@ -759,6 +1694,44 @@ def main(args):
                               'Note: \'system\' can be a regular expression matching more than one system.'))
     parser.add_argument('--mpicmd', type=str, metavar='cmd', default=None,
                         help='MPI command used to invoke run command')
+    parser.add_argument('--multidir', default=False, action='store_true',
+                        help=('Run the subsystems of a system which have the same size, number of\n' +
+                              'steps and mdrun arguments (e.g. ensemble runs) as a single\n' +
+                              'multi-simulation (mdrun -multidir) using --mpicmd. If gmx is not\n' +
+                              'built with MPI support or --mpicmd is not set, these subsystems\n' +
+                              'are instead ran concurrently (see --jobs).'))
+    parser.add_argument('-j', '--jobs', type=int, metavar='n', default=1,
+                        help=('Number of simulations ran concurrently. Default: 1.\n' +
+                              'If larger than 1, the available cores (see --ncores) are split\n' +
+                              'in equal slices, and every simulation is restricted to its slice\n' +
+                              'using -nt (or -ntomp if --mpicmd is given) and -pinoffset.'))
+    parser.add_argument('--analysis_jobs', type=int, metavar='n', default=1,
+                        help=('Number of processes used to analyze the tests. Default: 1.\n' +
+                              'If larger than 1, every test of every system is analyzed separately,\n' +
+                              'and the parsed simulation data is shared between the tests of a\n' +
+                              'system through files in the system directories.'))
+    parser.add_argument('--ncores', type=int, metavar='n', default=None,
+                        help=('Number of cores available for running simulations.\n' +
+                              'Default: All cores of the machine if --jobs is larger than 1,\n' +
+                              '         otherwise GROMACS chooses.'))
+    parser.add_argument('--resume', default=False, action='store_true',
+                        help=('Reuse the results of previous invocations in the working directory.\n' +
+                              'Existing directories are not backed up, runs which completed with\n' +
+                              'identical input files, grompp / mdrun arguments and GROMACS version\n' +
+                              'are skipped, and interrupted runs are continued from their checkpoint.'))
+    parser.add_argument('--report', type=str, metavar='file.json', default=None,
+                        help=('Write a JSON report containing the wall and cpu times of the preparation,\n' +
+                              'grompp, mdrun, parsing and analysis stages, the peak memory usage\n' +
+                              'and the results of all tests.'))
+    parser.add_argument('--junit', type=str, metavar='file.xml', default=None,
+                        help='Write the test results as JUnit XML report.')
+    parser.add_argument('--force', default=False, action='store_true',
+                        help=('Re-analyze all tests. By default, tests whose arguments and analyzed\n' +
+                              'files did not change since the last analysis are not re-analyzed.'))
+    parser.add_argument('--profile', default=False, action='store_true',
+                        help=('Profile the data parsing and the analysis functions, and print the\n' +
+                              'number of calls and cumulative time per function at the end.\n' +
+                              'The timings are also added to the report (see --report).'))
     parser.add_argument('--wd', '--working_dir', type=str,
                         metavar='dir', default=None,
                         help='Working directory (default: current directory)')
@@ -792,6 +1765,9 @@ def main(args):
 
     args = parser.parse_args(args)
 
+    if args.profile:
+        profiling.enable()
+
     # the input files are expected to be located where this script is
     source_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'systems')
     # target directory can be current or user chosen
@@ -822,16 +1798,25 @@ def main(args):
         if args.bindir:
             gmx = os.path.join(args.bindir, gmx)
     gmx_interface = None
-    gmx_parser = None
     if do_run or do_analysis:
         gmx_interface = GromacsInterface(exe=gmx)
-        gmx_parser = GromacsParser(exe=gmx)
+
+    # machine-readable report of timings and results
+    report = {
+        'physical_validation': physical_validation.__version__,
+        'systems': OrderedDict(
+            (system_name, {'prepare': None, 'runs': [], 'tests': []})
+            for system_name in systems
+        )
+    }
+    return_value = 0
 
     if do_prepare:
         nsystems = len(systems)
         n = 0
         runs = []  # this will contain all information needed to run the system
         for system_name, system in systems.items():
+            start = process_times()
             n += 1
             print('\rPreparing run files for systems... [{:d}/{:d}] '.format(n, nsystems), end='')
             sys.stdout.flush()  # py2 compatibility
@@ -840,9 +1825,9 @@ def main(args):
             # prepare the base system
             input_dir = os.path.join(source_path, system_dir, 'input')
             target_dir = os.path.join(target_path, system_dir)
-            mkdir_bk(target_dir, nobackup=args.nobackup)
+            mkdir_bk(target_dir, nobackup=args.nobackup, keep=args.resume)
             basedir = os.path.join(target_dir, 'base')
-            mkdir_bk(basedir, nobackup=args.nobackup)
+            mkdir_bk(basedir, nobackup=args.nobackup, keep=args.resume)
             for suffix in ['mdp', 'gro', 'top']:
                 shutil.copy2(os.path.join(input_dir, 'system.' + suffix),
                              basedir)
@@ -852,73 +1837,125 @@ def main(args):
                 for test_args in test['args']:
                     system_dirs.extend(
                         all_tests[test_name].prepare_parser(input_dir, target_dir, system_name,
-                                                            args.nobackup, test_args)
+                                                            args.nobackup, test_args,
+                                                            resume=args.resume)
                     )
 
             # save run information
             for d in system_dirs:
                 runs.append({
                     'dir': d,
+                    'system': system_name,
                     'grompp_args': system['grompp_args'],
                     'mdrun_args': system['mdrun_args']
                 })
+            report['systems'][system_name]['prepare'] = elapsed_since(start)
         # end of loop over systems
         print('-- done.')
 
         if write_script:
             print('Writing run script... ', end='')
             sys.stdout.flush()  # py2 compatibility
-            script_file = os.path.join(target_path, 'run_simulations.sh')
-            if not args.nobackup:
-                file_bk(script_file)
-            with open(script_file, 'w') as f:
-                f.write('# This file was created by the physical validation suite for GROMACS.\n')
-                f.write('\n# Define run variables\n')
-                f.write('WORKDIR=' + os.path.abspath(target_path) + '\n')
-                f.write('GROMPPCMD="' + os.path.abspath(gmx) + ' grompp"\n')
-                f.write('MDRUNCMD="' + os.path.abspath(gmx) + ' mdrun"\n')
-                f.write('\n# Run systems\n')
-                f.write('startpath=$PWD\n')
-                f.write('cd $WORKDIR\n')
-                for run in runs:
-                    for cmd in basic_run_cmds(directory=os.path.relpath(os.path.abspath(run['dir']),
-                                                                        os.path.abspath(target_path)),
-                                              grompp_args=run['grompp_args'],
-                                              mdrun_args=run['mdrun_args']):
-                        f.write(cmd + '\n')
-                    f.write('\n')
-                f.write('cd $startpath\n')
+            if args.script == 'serial':
+                script_file = os.path.join(target_path, 'run_simulations.sh')
+                if not args.nobackup:
+                    file_bk(script_file)
+                write_serial_script(script_file, target_path, runs, gmx)
+            else:
+                script_file = write_job_scripts(target_path, runs, gmx, args.script,
+                                                njobs=args.jobs, ncores=args.ncores,
+                                                mpicmd=args.mpicmd, nobackup=args.nobackup)
             print('-- done.')
             print('Run script written to ' + script_file)
+            if args.script == 'manifest':
+                print('The simulations are listed in ' + os.path.join(target_path, job_file) +
+                      ', and ran concurrently by the run script.')
+                print('Set NJOBS and NCORES to adapt the number of concurrent simulations and '
+                      'the cores they share.')
+            elif args.script == 'array':
+                print('Submit the script as array job with indices 1-{:d}, or run it with the '
+                      'index as argument.'.format(len(runs)))
+                print('The jobs and their resource hints are listed in ' +
+                      os.path.join(target_path, job_file) + '.')
             print('Adapt script as necessary and run simulations. Make sure to preserve the folder structure!')
             print('Once all simulations have ran, analyze the results using `make check-phys-analyze` or '
                   'using the `-a` flag of `gmx_physicalvalidation.py`.')
         # end if write_script
 
         if do_run:
-            nruns = len(runs)
-            # send messages from GROMACS to log
-            gmx_log = open(os.path.join(target_path, 'physicalvalidation_gmx.log'), 'w')
-            for n, run in enumerate(runs):
-                print('\rRunning (sub)systems... [{:d}/{:d}] '.format(n+1, nruns), end='')
-                sys.stdout.flush()  # py2 compatibility
-                gmx_interface.grompp(mdp='system.mdp',
-                                     top='system.top',
-                                     gro='system.gro',
-                                     tpr='system.tpr',
-                                     cwd=run['dir'],
-                                     args=run['grompp_args'],
-                                     stdout=gmx_log,
-                                     stderr=gmx_log)
-                gmx_interface.mdrun(tpr='system.tpr',
-                                    deffnm='system',
-                                    cwd=run['dir'],
-                                    args=run['mdrun_args'],
-                                    stdout=gmx_log,
-                                    stderr=gmx_log,
-                                    mpicmd=args.mpicmd)
-            gmx_log.close()
-            print('-- done.')
+            # every run records its inputs, such that a later invocation
+            # using --resume can tell which runs are up to date
+            version = gmx_version(gmx_interface)
+            for run in runs:
+                run['manifest'] = run_manifest(run, version)
+
+        if do_run and args.resume:
+            # skip runs which completed with identical inputs, and
+            # continue interrupted runs
+            for run in runs:
+                run['state'] = run_state(run, run['manifest'])
+            nskipped = sum(run['state'] == 'complete' for run in runs)
+            nresumed = sum(run['state'] == 'interrupted' for run in runs)
+            for run in runs:
+                if run['state'] == 'complete':
+                    report['systems'][run['system']]['runs'].append({
+                        'dir': os.path.relpath(run['dir'], target_path),
+                        'skipped': True
+                    })
+            runs = [run for run in runs if run['state'] != 'complete']
+            print('Skipping {:d} completed and resuming {:d} interrupted (sub)systems.'.format(
+                nskipped, nresumed))
+
+        if do_run:
+            # order runs by estimated cost, calibrated using previous timings
+            timings_file = os.path.join(target_path, 'physicalvalidation_timings.json')
+            timings = read_timings(timings_file)
+            costs = {}
+            for run in runs:
+                costs[run['dir']] = estimate_cost(gmx_interface, run['dir'])
+            runs = schedule_runs(runs, costs,
+                                 {os.path.join(target_path, d): t for d, t in timings.items()})
+            # launch groups of similar subsystems as multi-simulations, or
+            # run them concurrently if gmx does not support multi-simulations
+            groups = []
+            singles = runs
+            njobs = args.jobs
+            if args.multidir:
+                groups, singles = group_runs(runs)
+                if groups and not (args.mpicmd and gmx_interface.supports_multisim):
+                    print('NOTE: ' + ('--mpicmd is not set' if not args.mpicmd else
+                                      gmx + ' does not support multi-simulations') +
+                          ', running related (sub)systems concurrently instead.')
+                    njobs = max(njobs, max(len(group) for group in groups))
+                    groups = []
+                    singles = runs
+            failed, run_records = [], {}
+            if groups:
+                failed, run_records = run_multisims(gmx_interface, groups, mpicmd=args.mpicmd)
+                print('-- done.')
+            if singles:
+                single_failed, single_records = run_simulations(gmx_interface, singles,
+                                                                njobs=njobs, ncores=args.ncores,
+                                                                mpicmd=args.mpicmd)
+                failed += single_failed
+                run_records.update(single_records)
+                print('-- done.')
+            for d, record in run_records.items():
+                # the wall time of multi-simulations is not representative
+                # of the single runs
+                if record['returncode'] == 0 and 'multidir' not in record:
+                    timings[os.path.relpath(d, target_path)] = {'cost': costs[d],
+                                                                'time': record['wall']}
+            write_timings(timings_file, timings)
+            for run in runs:
+                record = {'dir': os.path.relpath(run['dir'], target_path),
+                          'skipped': False}
+                record.update(run_records[run['dir']])
+                report['systems'][run['system']]['runs'].append(record)
+            for run, program, returncode in failed:
+                print('WARNING: ' + program + ' failed in ' + run['dir'] +
+                      ' (return code ' + str(returncode) + '), see ' +
+                      os.path.join(run['dir'], 'physicalvalidation_gmx.log'))
         # end if do_run
     # end if do_prepare
 
@@ -932,43 +1969,110 @@ def main(args):
         print(' ' * indent + '=' * len(title))
         print()
         passed = True
+        # every test of every system is analyzed separately, the parsed data
+        # of the base simulations is shared between the tests of a system
+        tasks = []
+        cache_dirs = {}
         for system_name, system in systems.items():
-            system_dir = system['dir']
-            # save system data if re-used for different test
-            # massively reduces run time of multiple tests
-            system_data = {
-                'reduced': None,
-                'full': None
-            }
-            # system directory
-            target_dir = os.path.join(target_path, system_dir)
-
-            print('Analyzing system ' + system_name)
-
-            # call analyze method of chosen tests
+            target_dir = os.path.join(target_path, system['dir'])
+            cache_dirs[system_name] = os.path.join(target_dir, 'base')
             for test_name, test in system['tests'].items():
                 for test_args in test['args']:
-                    try:
-                        result = all_tests[test_name].analyze_parser(gmx_parser, target_dir,
-                                                                     system_name, system_data,
-                                                                     args.verbosity, test_args)
-                    except Exception as err:
-                        print('    ' + all_tests[test_name].__name__ + ' FAILED (Exception in evaluation)')
-                        print('    '*2 + type(err).__name__ + ': ' + str(err))
-                        passed = False
-                    else:
-                        for line in result['message'].split('\n'):
-                            print('    ' + line)
-
-                        passed = passed and result['test']
-            # end loop over tests
+                    tasks.append((system_name, target_dir, test_name, test_args,
+                                  args.verbosity))
+        for system_name in cache_dirs:
+            # don't re-use data of previous invocations
+            BaseData(cache_dirs[system_name]).clear()
+
+        # re-use results of unchanged tests
+        cache_file = os.path.join(target_path, 'physicalvalidation_results.json')
+        cache = read_results(cache_file)
+        file_hashes = {}
+        code = code_hash()
+
+        def task_key(task):
+            _, target_dir, test_name, test_args, _ = task
+            return result_key(test_name, test_args, target_dir, file_hashes, code)
+
+        if args.force:
+            # keys are only needed to store the new results
+            keys = [None] * len(tasks)
+            cached = [False] * len(tasks)
+        else:
+            keys = [task_key(task) for task in tasks]
+            cached = [key in cache for key in keys]
+        if any(cached):
+            print('Re-using {:d} cached result(s). Use --force to re-analyze all tests.'.format(
+                sum(cached)))
+            print()
+
+        def all_results():
+            results = analyze_tests([task for task, c in zip(tasks, cached) if not c],
+                                    gmx, njobs=args.analysis_jobs, cache_dirs=cache_dirs)
+            for task, key, c in zip(tasks, keys, cached):
+                if c:
+                    yield cache[key], '', None
+                else:
+                    result, output, timing = next(results)
+                    if not isinstance(result, Exception):
+                        cache[key if key is not None else task_key(task)] = result
+                    yield result, output, timing
+            # let the pool shut down
+            for _ in results:
+                pass
+
+        current_system = None
+        for (system_name, _, test_name, test_args, _), (result, output, timing) in zip(
+                tasks, all_results()):
+            if system_name != current_system:
+                if current_system is not None:
+                    print()
+                print('Analyzing system ' + system_name)
+                current_system = system_name
+            sys.stdout.write(output)
+            record = {'test': test_name,
+                      'args': test_args,
+                      'cached': timing is None}
+            if timing is not None:
+                record.update(timing)
+                if 'profile' in timing:
+                    profiling.merge(timing['profile'])
+            if isinstance(result, Exception):
+                print('    ' + all_tests[test_name].__name__ + ' FAILED (Exception in evaluation)')
+                print('    '*2 + type(result).__name__ + ': ' + str(result))
+                passed = False
+                record['error'] = type(result).__name__ + ': ' + str(result)
+            else:
+                for line in result['message'].split('\n'):
+                    print('    ' + line)
+
+                passed = passed and result['test']
+                record.update({'passed': result['test'],
+                               'result': result['result'],
+                               'tolerance': result['tolerance'],
+                               'message': result['message']})
+            report['systems'][system_name]['tests'].append(record)
+        # end loop over tests
+        if current_system is not None:
             print()
-        # end loop over systems
-        return int(not passed)
+        for system_name in cache_dirs:
+            BaseData(cache_dirs[system_name]).clear()
+        write_results(cache_file, cache)
+        return_value = int(not passed)
     # end if do_analysis
 
-    # assuming everything is ok if we ended up here
-    return 0
+    report['peak_rss'] = peak_rss()
+    if args.profile:
+        report['profile'] = profiling.results()
+        print('Profile')
+        profiling.report()
+        print()
+    if args.report:
+        write_results(args.report, report)
+    if args.junit:
+        write_junit(args.junit, report)
+
+    return return_value
 
 
 if __name__ == "__main__":
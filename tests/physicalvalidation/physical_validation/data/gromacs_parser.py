@@ -43,6 +43,7 @@ from .trajectory_data import TrajectoryData
 # from . import SimulationData, UnitData, EnsembleData, SystemData, ObservableData, TrajectoryData
 from ..util.gromacs_interface import GromacsInterface
 from ..util import error as pv_error
+from ..util import profiling
 
 
 class GromacsParser(parser.Parser):
@@ -68,7 +69,7 @@ class GromacsParser(parser.Parser):
             time_str='ps',
             time_conversion=1.0)
 
-    def __init__(self, exe=None, includepath=None):
+    def __init__(self, exe=None, includepath=None, backend=None):
         r"""
         Create a GromacsParser object
 
@@ -85,9 +86,14 @@ class GromacsParser(parser.Parser):
             Default: None - no additional topology location. Lookup will be restricted to current
                      directory and location of the `top` file given to `get_simulation_data()`,
                      plus any include locations added to the `mdp` file.
+        backend: object, optional
+            Backend running the GROMACS tools, see
+            `physical_validation.util.gromacs_interface.SubprocessBackend`.
+            Default: None - GROMACS tools are ran as subprocesses.
         """
         super(GromacsParser, self).__init__()
-        self.__interface = GromacsInterface(exe=exe, includepath=includepath)
+        self.__interface = GromacsInterface(exe=exe, includepath=includepath,
+                                            backend=backend)
         # gmx energy codes
         self.__gmx_energy_names = {'kinetic_energy': 'Kinetic-En.',
                                    'potential_energy': 'Potential',
@@ -97,9 +103,10 @@ class GromacsParser(parser.Parser):
                                    'temperature': 'Temperature',
                                    'constant_of_motion': 'Conserved-En.'}
 
+    @profiling.profiled()
     def get_simulation_data(self,
                             mdp=None, top=None, edr=None,
-                            trr=None, gro=None):
+                            trr=None, gro=None, molecules=None):
         r"""
 
         Parameters
@@ -114,6 +121,12 @@ class GromacsParser(parser.Parser):
             A string pointing to a .trr file
         gro: str, optional
             A string pointing to a .gro file (Note: if also trr is given, gro is ignored)
+        molecules: str, List[str] or array-like of int, optional
+            Restrict the system and trajectory data to a subset of the molecules, given
+            either as moleculetype name(s) or as molecule indices. Only the selected atoms
+            are decoded from the trajectory. Requires `mdp` and `top`. Observables read
+            from the `edr` file always refer to the entire system.
+            Default: None (all molecules).
 
         Returns
         -------
@@ -125,23 +138,12 @@ class GromacsParser(parser.Parser):
         result = SimulationData()
         result.units = self.units()
 
-        # trajectories (might be used later for the box...)
-        trajectory_dict = None
-        if trr is not None:
-            if gro is not None:
-                warnings.warn('`trr` and `gro` given. Ignoring `gro`.')
-
-            trajectory_dict = self.__interface.read_trr(trr)
-            result.trajectory = TrajectoryData(
-                trajectory_dict['position'],
-                trajectory_dict['velocity'])
-        elif gro is not None:
-            trajectory_dict = self.__interface.read_gro(gro)
-            result.trajectory = TrajectoryData(
-                trajectory_dict['position'],
-                trajectory_dict['velocity'])
+        if molecules is not None and (mdp is None or top is None):
+            raise pv_error.InputError(['molecules'],
+                                      'Selecting molecules requires `mdp` and `top`.')
 
         # simulation parameters & system
+        atoms = None
         if mdp is not None and top is not None:
             mdp_options = self.__interface.read_mdp(mdp)
             define = None
@@ -150,7 +152,7 @@ class GromacsParser(parser.Parser):
                 define = mdp_options['define']
             if 'include' in mdp_options:
                 include = mdp_options['include']
-            molecules = self.__interface.read_system_from_top(top, define=define, include=include)
+            topology = self.__interface.read_system_from_top(top, define=define, include=include)
 
             if 'dt' in mdp_options:
                 result.dt = float(mdp_options['dt'])
@@ -174,7 +176,8 @@ class GromacsParser(parser.Parser):
             next_molec = 0
             molec_bonds = []
             molec_bonds_constrained = []
-            for molecule in molecules:
+            molecule_names = []
+            for molecule in topology:
                 natoms += molecule['nmolecs'] * molecule['natoms']
                 for n in range(0, molecule['nmolecs']):
                     molecule_idx.append(next_molec)
@@ -200,6 +203,7 @@ class GromacsParser(parser.Parser):
                 constraints_per_molec.extend([constraints] * molecule['nmolecs'])
                 molec_bonds.extend([all_bonds] * molecule['nmolecs'])
                 molec_bonds_constrained.extend([constrained_bonds] * molecule['nmolecs'])
+                molecule_names.extend([molecule['name']] * molecule['nmolecs'])
 
             system = SystemData()
             system.natoms = natoms
@@ -219,8 +223,60 @@ class GromacsParser(parser.Parser):
                     system.ndof_reduction_tra = 0
             system.bonds = molec_bonds
             system.constrained_bonds = molec_bonds_constrained
+            system.molecule_names = molecule_names
+
+            if molecules is not None:
+                try:  # py2/3 compatibility
+                    basestring
+                except NameError:
+                    basestring = str
+                if isinstance(molecules, basestring):
+                    molecules = [molecules]
+                molecules = np.asarray(molecules)
+                if molecules.dtype.kind in 'SU':
+                    selection = np.flatnonzero(np.isin(system.molecule_names, molecules))
+                else:
+                    selection = np.unique(molecules.astype(int))
+                    nmolecs = len(system.molecule_idx)
+                    if selection.size > 0 and (selection[0] < 0 or selection[-1] >= nmolecs):
+                        raise pv_error.InputError(['molecules'],
+                                                  'Molecule indices need to be in [0, ' +
+                                                  str(nmolecs) + ').')
+                if selection.size == 0:
+                    raise pv_error.InputError(['molecules'],
+                                              'Selection does not contain any molecule. '
+                                              'Available molecule types: ' +
+                                              ', '.join(np.unique(system.molecule_names)) + '.')
+                atoms = system.molecule_atoms(selection)
+                system = system.select_molecules(selection)
             result.system = system
 
+        # trajectories (might be used later for the box...)
+        trajectory_dict = None
+        if trr is not None:
+            if gro is not None:
+                warnings.warn('`trr` and `gro` given. Ignoring `gro`.')
+
+            # single precision trajectories are stored as float32
+            dtype = np.float64 if self.__interface.double else np.float32
+            trajectory_dict = self.__interface.read_trr(trr, fields=['position', 'velocity', 'box'],
+                                                        atoms=atoms, dtype=dtype)
+            result.trajectory = TrajectoryData(
+                trajectory_dict['position'],
+                trajectory_dict['velocity'],
+                box=trajectory_dict['box'])
+        elif gro is not None:
+            trajectory_dict = self.__interface.read_gro(gro)
+            if atoms is not None:
+                for key in ['position', 'velocity']:
+                    if trajectory_dict[key] is not None:
+                        trajectory_dict[key] = trajectory_dict[key][atoms]
+            result.trajectory = TrajectoryData(
+                trajectory_dict['position'],
+                trajectory_dict['velocity'],
+                box=trajectory_dict['box'])
+
+        if mdp is not None and top is not None:
             thermostat = ('tcoupl' in mdp_options and
                           mdp_options['tcoupl'] and
                           mdp_options['tcoupl'] != 'no')
@@ -250,9 +306,13 @@ class GromacsParser(parser.Parser):
                                               'Ensemble definition ambiguous: Different p-ref values found.')
             else:
                 if trajectory_dict is not None:
-                    box = trajectory_dict['box'][0]
-                    # Different box shapes?
-                    volume = box[0]*box[1]*box[2]
+                    box = np.asarray(trajectory_dict['box'][0], dtype=np.float64)
+                    if box.ndim == 2:
+                        # box vectors
+                        volume = abs(np.linalg.det(box))
+                    else:
+                        # box lengths
+                        volume = box[0]*box[1]*box[2]
                 else:
                     warnings.warn('Constant volume simulation with undefined volume.')
 
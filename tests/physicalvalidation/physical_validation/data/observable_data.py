@@ -82,6 +82,9 @@ class ObservableData(object):
         self.temperature = temperature
         self.constant_of_motion = constant_of_motion
 
+        self.__init_accessors()
+
+    def __init_accessors(self):
         self.__getters = {
             'kinetic_energy': ObservableData.kinetic_energy.__get__,
             'potential_energy': ObservableData.potential_energy.__get__,
@@ -102,6 +105,17 @@ class ObservableData(object):
             'constant_of_motion': ObservableData.constant_of_motion.__set__
         }
 
+    def __getstate__(self):
+        # the accessors are bound to the class properties and can't be pickled
+        state = self.__dict__.copy()
+        del state['_ObservableData__getters']
+        del state['_ObservableData__setters']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__init_accessors()
+
     def get(self, key):
         return self[key]
 
@@ -58,6 +58,8 @@ class SystemData(object):
     * molecule_idx: a list with the indices first atoms of every molecule (this assumes
       that the atoms are sorted by molecule)
     * nconstraints_per_molecule: a list with the number of constraints in every molecule
+    * molecule_names: a list with the name of the molecule type of every molecule
+      (optional, used to select groups of molecules)
 
     Only used internally:
 
@@ -82,7 +84,8 @@ class SystemData(object):
     def __init__(self,
                  natoms=None, nconstraints=None,
                  ndof_reduction_tra=None, ndof_reduction_rot=None,
-                 mass=None, molecule_idx=None, nconstraints_per_molecule=None):
+                 mass=None, molecule_idx=None, nconstraints_per_molecule=None,
+                 molecule_names=None):
         self.__natoms = None
         self.__nconstraints = None
         self.__ndof_reduction_tra = None
@@ -90,6 +93,7 @@ class SystemData(object):
         self.__mass = None
         self.__molecule_idx = None
         self.__nconstraints_per_molecule = None
+        self.__molecule_names = None
         self.__ndof_per_molecule = None
         self.__bonds = None
         self.__constrained_bonds = None
@@ -108,6 +112,8 @@ class SystemData(object):
             self.molecule_idx = molecule_idx
         if nconstraints_per_molecule is not None:
             self.nconstraints_per_molecule = nconstraints_per_molecule
+        if molecule_names is not None:
+            self.molecule_names = molecule_names
 
     @property
     def natoms(self):
@@ -227,6 +233,28 @@ class SystemData(object):
 
         self.__nconstraints_per_molecule = nconstraints_per_molecule
 
+    @property
+    def molecule_names(self):
+        """nd-array: List of the molecule type name of every molecule
+
+        Setter accepts array-like objects.
+
+        """
+        return self.__molecule_names
+
+    @molecule_names.setter
+    def molecule_names(self, molecule_names):
+        molecule_names = np.asarray(molecule_names)
+        if molecule_names.ndim != 1:
+            raise pv_error.InputError('molecule_names',
+                                      'Expected 1-dimensional array.')
+        if self.molecule_idx is not None:
+            if molecule_names.shape != self.molecule_idx.shape:
+                raise pv_error.InputError('molecule_names',
+                                          'Expected `molecule_names` to have'
+                                          'the same shape as `molecule_idx`.')
+        self.__molecule_names = molecule_names
+
     @property
     def ndof_per_molecule(self):
         """nd-array: List of number of degrees of freedom per molecule
@@ -260,3 +288,71 @@ class SystemData(object):
     @constrained_bonds.setter
     def constrained_bonds(self, constrained_bonds):
         self.__constrained_bonds = constrained_bonds
+
+    def molecule_atoms(self, molecules):
+        r"""Indices of the atoms belonging to a set of molecules
+
+        Parameters
+        ----------
+        molecules : array-like
+            Indices of the molecules
+
+        Returns
+        -------
+        atoms : nd-array
+            Sorted indices of all atoms of the selected molecules
+
+        """
+        if self.molecule_idx is None or self.natoms is None:
+            raise pv_error.InputError('molecules',
+                                      'Selecting molecules requires `molecule_idx` and `natoms`.')
+        molecules = np.unique(np.asarray(molecules, dtype=int))
+        molecule_end = np.append(self.molecule_idx[1:], [self.natoms])
+        start = self.molecule_idx[molecules]
+        length = molecule_end[molecules] - start
+        # arange from start to end of every molecule, concatenated
+        offset = np.repeat(start - np.cumsum(length) + length, length)
+        return offset + np.arange(length.sum())
+
+    def select_molecules(self, molecules):
+        r"""Create the SystemData of a subset of the molecules
+
+        The global reduction of degrees of freedom is distributed
+        proportionally to the number of selected molecules.
+
+        Parameters
+        ----------
+        molecules : array-like
+            Indices of the molecules
+
+        Returns
+        -------
+        system : SystemData
+            System consisting only of the selected molecules
+
+        """
+        molecules = np.unique(np.asarray(molecules, dtype=int))
+        atoms = self.molecule_atoms(molecules)
+        molecule_end = np.append(self.molecule_idx[1:], [self.natoms])
+        length = molecule_end[molecules] - self.molecule_idx[molecules]
+
+        system = SystemData()
+        system.natoms = atoms.size
+        if self.mass is not None:
+            system.mass = self.mass[atoms]
+        system.molecule_idx = np.cumsum(length) - length
+        if self.nconstraints_per_molecule is not None:
+            system.nconstraints_per_molecule = self.nconstraints_per_molecule[molecules]
+            system.nconstraints = np.sum(system.nconstraints_per_molecule)
+        if self.molecule_names is not None:
+            system.molecule_names = self.molecule_names[molecules]
+        fraction = float(molecules.size) / self.molecule_idx.size
+        if self.ndof_reduction_tra is not None:
+            system.ndof_reduction_tra = self.ndof_reduction_tra * fraction
+        if self.ndof_reduction_rot is not None:
+            system.ndof_reduction_rot = self.ndof_reduction_rot * fraction
+        if self.bonds is not None:
+            system.bonds = [self.bonds[m] for m in molecules]
+        if self.constrained_bonds is not None:
+            system.constrained_bonds = [self.constrained_bonds[m] for m in molecules]
+        return system
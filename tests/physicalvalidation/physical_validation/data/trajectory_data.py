@@ -41,44 +41,83 @@ class TrajectoryData(object):
     As they are used in connection, the position and velocity trajectories are expected
     to have the same shape and number of frames.
 
+    Optionally, the simulation box can be stored along the trajectory. It is used to
+    reassemble molecules broken across periodic boundaries. Boxes are stored as
+    (nframes x 3 x 3) arrays of box vectors, a single (3 x 3) array is taken as the
+    box vectors of all frames. Rectangular boxes can be given as (nframes x 3) or
+    (3,) arrays of box lengths. As a (3 x 3) array is read as box vectors, box
+    lengths of three frames need to be given as box vectors.
+
     The position and velocity trajectories can be accessed either using the getters
     of an object, as in
 
         * trajectory.position
         * trajectory.velocity
+        * trajectory.box
 
     or using the key notation, as in
 
         * trajectory['position']
         * trajectory['velocity']
+        * trajectory['box']
+
+    Array-like inputs are adopted without copying whenever possible. By default,
+    the precision of the input is kept (e.g. single-precision trajectories are
+    stored as float32). Setting `dtype` converts all trajectories to the given
+    precision instead. Analysis functions accumulate in double precision
+    independently of the storage precision.
 
     """
 
     @staticmethod
     def trajectories():
         return ('position',
-                'velocity')
+                'velocity',
+                'box')
 
-    def __init__(self, position=None, velocity=None):
+    def __init__(self, position=None, velocity=None, dtype=None, box=None):
         self.__position = None
         self.__velocity = None
+        self.__box = None
         self.__nframes = 0
+        self.__dtype = None
+
+        if dtype is not None:
+            self.dtype = dtype
 
         if position is not None:
             self.position = position
         if velocity is not None:
             self.velocity = velocity
+        if box is not None:
+            self.box = box
 
+        self.__init_accessors()
+
+    def __init_accessors(self):
         self.__getters = {
             'position': TrajectoryData.position.__get__,
-            'velocity': TrajectoryData.velocity.__get__
+            'velocity': TrajectoryData.velocity.__get__,
+            'box': TrajectoryData.box.__get__
         }
 
         self.__setters = {
             'position': TrajectoryData.position.__set__,
-            'velocity': TrajectoryData.velocity.__set__
+            'velocity': TrajectoryData.velocity.__set__,
+            'box': TrajectoryData.box.__set__
         }
 
+    def __getstate__(self):
+        # the accessors are bound to the class properties and can't be pickled
+        state = self.__dict__.copy()
+        del state['_TrajectoryData__getters']
+        del state['_TrajectoryData__setters']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__init_accessors()
+
     def get(self, key):
         return self[key]
 
@@ -103,10 +142,10 @@ class TrajectoryData(object):
     @position.setter
     def position(self, pos):
         """Set position"""
-        pos = np.array(pos)
+        pos = np.asarray(pos, dtype=self.__dtype)
         if pos.ndim == 2:
-            # create 3-dimensional array
-            pos = np.array([pos])
+            # create 3-dimensional view
+            pos = pos[np.newaxis]
         if pos.ndim != 3:
             warnings.warn('Expected 2- or 3-dimensional array.')
         if self.__nframes == 0 and self.__velocity is None:
@@ -124,10 +163,10 @@ class TrajectoryData(object):
     @velocity.setter
     def velocity(self, vel):
         """Set velocity"""
-        vel = np.array(vel)
+        vel = np.asarray(vel, dtype=self.__dtype)
         if vel.ndim == 2:
-            # create 3-dimensional array
-            vel = np.array([vel])
+            # create 3-dimensional view
+            vel = vel[np.newaxis]
         if vel.ndim != 3:
             warnings.warn('Expected 2- or 3-dimensional array.')
         if self.__nframes == 0 and self.__position is None:
@@ -137,6 +176,50 @@ class TrajectoryData(object):
                                       'Expected equal number of frames as in position trajectory.')
         self.__velocity = vel
 
+    @property
+    def box(self):
+        """Get box"""
+        return self.__box
+
+    @box.setter
+    def box(self, box):
+        """Set box"""
+        if box is None:
+            self.__box = None
+            return
+        box = np.asarray(box, dtype=np.float64)
+        if box.ndim == 1 or box.shape == (3, 3):
+            # single frame
+            box = box[np.newaxis]
+        if box.ndim == 2:
+            # box lengths of rectangular boxes
+            box = box[:, :, np.newaxis] * np.eye(3)
+        if box.ndim != 3 or box.shape[1:] != (3, 3):
+            raise pv_error.InputError(['box'],
+                                      'Expected box lengths or box vectors.')
+        if self.__nframes != 0 and box.shape[0] not in (1, self.__nframes):
+            raise pv_error.InputError(['box'],
+                                      'Expected equal number of frames as in trajectory.')
+        self.__box = box
+
+    @property
+    def dtype(self):
+        """Get storage precision of the trajectories (None: keep input precision)"""
+        return self.__dtype
+
+    @dtype.setter
+    def dtype(self, dtype):
+        """Set storage precision of the trajectories, converting stored trajectories"""
+        if dtype is not None:
+            dtype = np.dtype(dtype)
+        self.__dtype = dtype
+        if dtype is None:
+            return
+        if self.__position is not None:
+            self.__position = self.__position.astype(dtype, copy=False)
+        if self.__velocity is not None:
+            self.__velocity = self.__velocity.astype(dtype, copy=False)
+
     @property
     def nframes(self):
         """Get number of frames"""
@@ -40,6 +40,7 @@ from .util import error as pv_error
 def convergence(simulations,
                 convergence_test='max_deviation',
                 verbose=True, slope=False,
+                estimator=None, nblocks=4,
                 screen=False, filename=None):
     r"""
     Compares the convergence of the fluctuations of conserved quantities
@@ -55,6 +56,22 @@ def convergence(simulations,
         test is implemented:
         `max_deviation`
     verbose : bool, optional
+    slope : bool, optional
+        If True, the fluctuations are measured around a linear fit of the
+        constant of motion rather than around its average. Ignored if
+        `estimator` is given. Default: False.
+    estimator : str, optional
+        The estimator used to measure the fluctuations of the constant of
+        motion. All estimators are computed in a single pass over the
+        trajectories, see `util.integrator.convergence_report`:
+        `rmsd`: standard deviation;
+        `drift`: root-mean-square deviation from a linear fit
+        (drift-aware);
+        `block`: root-mean-square deviation from a linear fit, averaged
+        over `nblocks` blocks of the trajectory.
+        Default: `drift` if `slope` is set, `rmsd` otherwise.
+    nblocks : int, optional
+        Number of blocks used by the `block` estimator. Default: 4.
     screen : bool
         Plot convergence on screen. Default: False.
     filename : string
@@ -95,6 +112,10 @@ def convergence(simulations,
 
     convergence_test = convergence_tests[convergence_test]
 
+    if estimator is not None and estimator not in ['rmsd', 'drift', 'block']:
+        raise pv_error.InputError('estimator',
+                                  'Unknown estimator.')
+
     for s in simulations:
         if not isinstance(s, SimulationData):
             raise pv_error.InputError('simulations',
@@ -113,4 +134,5 @@ def convergence(simulations,
     return util_integ.check_convergence(constant_of_motion,
                                         convergence_test=convergence_test,
                                         verbose=verbose, slope=slope,
+                                        estimator=estimator, nblocks=nblocks,
                                         screen=screen, filename=filename)
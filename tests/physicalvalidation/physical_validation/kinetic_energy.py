@@ -34,6 +34,7 @@ from __future__ import print_function
 from __future__ import division
 
 from .util import kinetic_energy as util_kin
+from .util import selection
 from .data import SimulationData
 
 
@@ -106,6 +107,8 @@ def mb_ensemble(data, alpha=None, verbosity=1,
 def equipartition(data, dtemp=0.1, distribution=False, alpha=0.05,
                   molec_groups=None,
                   random_divisions=0, random_groups=0,
+                  chunk_frames=None, max_memory=None, buffer_file=None,
+                  unwrap=True,
                   verbosity=2,
                   screen=False, filename=None):
     r"""Checks the equipartition of a simulation trajectory.
@@ -122,18 +125,36 @@ def equipartition(data, dtemp=0.1, distribution=False, alpha=0.05,
         Default: False.
     alpha : float, optional
         Confidence for Maxwell-Boltzmann test. Default: 0.05 (5%).
-    molec_groups : list of array-like (ngroups x ?), optional
-        List of 1d arrays containing molecule indeces defining groups. Useful to pre-define
-        groups of molecules (e.g. solute / solvent, liquid mixture species, ...). If None,
-        no pre-defined molecule groups will be tested. Default: None.
+    molec_groups : list of array-like or str (ngroups x ?), optional
+        List of 1d arrays containing molecule indeces or boolean masks defining groups.
+        Useful to pre-define groups of molecules (e.g. solute / solvent, liquid mixture
+        species, ...). Groups can also be given as selection expressions, such as
+        `'name SOL'` or `'natoms 3 and index :100'`, see
+        `physical_validation.util.selection`. If None, no pre-defined molecule groups
+        will be tested. Default: None.
 
         *Note:* If an empty 1d array is found as last element in the list, the remaining
         molecules are collected in this array. This allows, for example, to only
-        specify the solute, and indicate the solvent by giving an empty array.
+        specify the solute, and indicate the solvent by giving an empty array (or
+        an empty string).
     random_divisions : int, optional
         Number of random division tests attempted. Default: 0 (random division tests off).
     random_groups : int, optional
         Number of groups the system is randomly divided in. Default: 2.
+    chunk_frames : int, optional
+        Number of trajectory frames processed at once. Default: None (determined
+        from `max_memory`, or all frames at once).
+    max_memory : int, optional
+        Approximate memory budget (in bytes) for the positions and velocities
+        processed at once. Ignored if `chunk_frames` is given. Default: None.
+    buffer_file : string, optional
+        If given, the kinetic energy per molecule is accumulated in a memory-mapped
+        buffer stored in `buffer_file`. Default: None (kept in memory).
+    unwrap : bool, optional
+        If the trajectory contains the simulation box, reassemble molecules broken
+        across periodic boundaries before decomposing the kinetic energy. This makes
+        a `gmx trjconv -pbc mol` preprocessing of the trajectory unnecessary.
+        Default: True.
     verbosity : int, optional
         Verbosity level, where 0 is quiet and 3 very chatty. Default: 2.
     screen : bool
@@ -184,6 +205,13 @@ def equipartition(data, dtemp=0.1, distribution=False, alpha=0.05,
     else:
         temp = None
 
+    boxes = None
+    if unwrap:
+        boxes = data.trajectory['box']
+
+    if molec_groups is not None:
+        molec_groups = [_resolve_group(data.system, g) for g in molec_groups]
+
     (result,
      data.system.ndof_per_molecule,
      data.observables.kinetic_energy_per_molecule) = util_kin.check_equipartition(
@@ -202,9 +230,84 @@ def equipartition(data, dtemp=0.1, distribution=False, alpha=0.05,
         random_groups=random_groups,
         ndof_molec=data.system.ndof_per_molecule,
         kin_molec=data.observables.kinetic_energy_per_molecule,
+        chunk_frames=chunk_frames,
+        max_memory=max_memory,
+        buffer_file=buffer_file,
+        boxes=boxes,
         verbosity=verbosity,
         screen=screen,
         filename=filename
     )
 
     return result
+
+
+def _resolve_group(system, group):
+    try:
+        basestring
+    except NameError:
+        basestring = str
+    if isinstance(group, basestring):
+        if not group.strip():
+            return []
+        return selection.select(system, group)
+    return group
+
+
+def constraints(data, tolerance=None, chunk_frames=None,
+                unwrap=True, verbosity=1):
+    r"""Checks whether there is kinetic energy in constrained degrees of freedom.
+
+    Parameters
+    ----------
+    data : SimulationData
+        Simulation data object
+    tolerance : float, optional
+        If a tolerance is given and verbosity > 0, the test outputs a
+        passed / failed message.
+    chunk_frames : int, optional
+        Number of trajectory frames processed at once. Default: None (all
+        frames at once).
+    unwrap : bool, optional
+        If the trajectory contains the simulation box, bond vectors are
+        calculated as minimum image. Default: True.
+    verbosity : int, optional
+        Verbosity level, where 0 is quiet and 3 very chatty. Default: 1.
+
+    Returns
+    -------
+    result : float
+        Root-mean-square relative velocity along the constrained bonds,
+        relative to the root-mean-square relative velocity per dimension.
+
+    Notes
+    -----
+    For every constrained bond between atoms :math:`i` and :math:`j`, the
+    component of the relative velocity along the bond,
+
+    .. math::
+        v_\parallel = (\mathbf{v}_i - \mathbf{v}_j) \cdot
+                      \frac{\mathbf{r}_i - \mathbf{r}_j}{|\mathbf{r}_i - \mathbf{r}_j|} \, ,
+
+    vanishes if the constraint is satisfied. The test compares the mean
+    square of :math:`v_\parallel` over all bonds and frames to the mean
+    square relative velocity per dimension, which it would be expected to
+    equal in the absence of constraints. The result is hence expected to be
+    close to 0 for accurately constrained simulations (e.g. using LINCS or
+    SETTLE), and close to 1 if the constraints are not effective.
+
+    All bonds are evaluated at once for blocks of `chunk_frames` frames.
+
+    """
+    bonds = util_kin.constrained_bond_atoms(data.system.constrained_bonds,
+                                            data.system.molecule_idx)
+    boxes = None
+    if unwrap:
+        boxes = data.trajectory['box']
+
+    return util_kin.check_constraints(positions=data.trajectory['position'],
+                                      velocities=data.trajectory['velocity'],
+                                      bonds=bonds, boxes=boxes,
+                                      chunk_frames=chunk_frames,
+                                      tolerance=tolerance,
+                                      verbosity=verbosity)
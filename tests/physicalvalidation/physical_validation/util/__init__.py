@@ -36,3 +36,6 @@ from . import trajectory
 from . import plot
 from . import error
 from . import gromacs_interface
+from . import selection
+from . import kernels
+from . import profiling
@@ -0,0 +1,597 @@
+###########################################################################
+#                                                                         #
+#    physical_validation,                                                 #
+#    a python package to test the physical validity of MD results         #
+#                                                                         #
+#    Written by Michael R. Shirts <michael.shirts@colorado.edu>           #
+#               Pascal T. Merz <pascal.merz@colorado.edu>                 #
+#                                                                         #
+#    Copyright (C) 2012 University of Virginia                            #
+#              (C) 2017 University of Colorado Boulder                    #
+#                                                                         #
+#    This library is free software; you can redistribute it and/or        #
+#    modify it under the terms of the GNU Lesser General Public           #
+#    License as published by the Free Software Foundation; either         #
+#    version 2.1 of the License, or (at your option) any later version.   #
+#                                                                         #
+#    This library is distributed in the hope that it will be useful,      #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of       #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU    #
+#    Lesser General Public License for more details.                      #
+#                                                                         #
+#    You should have received a copy of the GNU Lesser General Public     #
+#    License along with this library; if not, write to the                #
+#    Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,     #
+#    Boston, MA 02110-1301 USA                                            #
+#                                                                         #
+###########################################################################
+r"""
+Benchmarks of the physical_validation analysis on synthetic data.
+
+The inputs are generated to resemble simulation output, such that no
+GROMACS installation (or any other MD engine) is needed:
+
+* Maxwell-Boltzmann distributed velocities of `N` molecules of `M` atoms,
+* kinetic energy samples of the corresponding ensemble,
+* correlated (AR(1)) potential energy series at two temperatures,
+* correlated NPT potential energy / volume pairs at two state points,
+* constant of motion series of NVE simulations at decreasing time steps,
+* edr and trr files of the `fake_gmx` stand-in for the GROMACS tools.
+
+The energies at the second state point are generated such that they are
+exactly related to the first state point by Boltzmann reweighting, so
+the ensemble checks work on data which is expected to pass.
+
+The benchmarks time `check_mb_ensemble`, `check_equipartition`,
+`check_1d`, `check_2d` and `integrator.convergence`, as well as the
+parsing of GROMACS output (`GromacsInterface.get_quantities` and
+`read_trr`) at a number of scaling points (samples per trajectory, or
+molecules for the equipartition check and the trajectory parsing). The
+`import` benchmark times the import of the package in a fresh interpreter.
+The results are stored as JSON, and can be compared to results obtained on
+a different commit::
+
+    python -m physical_validation.util.benchmark -o new.json --compare old.json
+"""
+from __future__ import print_function
+from __future__ import division
+
+import argparse
+import atexit
+import json
+import platform
+import subprocess
+import sys
+import os
+import shutil
+import tempfile
+import time
+import timeit
+
+import numpy as np
+import scipy
+import scipy.signal
+
+from . import kinetic_energy
+from . import ensemble
+from . import kernels
+from . import fake_gmx
+from .gromacs_interface import GromacsInterface
+from .. import integrator
+from ..data import SimulationData, ObservableData
+
+# Boltzmann constant in kJ/mol/K, and conversion from bar * nm^3 to kJ/mol
+kb = 8.314462e-3
+pvconvert = 0.0602214
+
+# scaling points: number of samples per trajectory, number of molecules
+# (the equilibration detection of the 1d / 2d checks scales quadratically
+# with the number of samples, see `max_time` of `run()`)
+samples = [10**3, 10**4, 10**5]
+molecules = [10**2, 10**3, 10**4, 10**5]
+samples_full = samples + [10**6, 10**7]
+molecules_full = molecules + [10**6]
+
+# modules timed by the import benchmark (numpy as reference)
+import_modules = ['numpy', 'physical_validation', 'physical_validation.data.gromacs_parser']
+
+# masses of H, C, N, O
+_masses = np.array([1.008, 12.011, 14.007, 15.999])
+
+
+def ar1(nsamples, tau=10, ndim=None, rng=None):
+    r"""
+    Generates a stationary AR(1) process with zero mean and unit variance.
+
+    Parameters
+    ----------
+    nsamples : int
+        Number of samples.
+    tau : float, optional
+        Correlation time in samples. Default: 10.
+    ndim : int, optional
+        If given, `ndim` independent series are generated. Default: None.
+    rng : np.random.RandomState, optional
+        Random number generator.
+
+    Returns
+    -------
+    series : nd-array (nsamples) or (ndim x nsamples)
+    """
+    if rng is None:
+        rng = np.random.RandomState()
+    shape = (nsamples,) if ndim is None else (ndim, nsamples)
+    phi = np.exp(-1 / tau)
+    # start from the stationary distribution
+    zi = phi * rng.normal(size=shape[:-1] + (1,))
+    series, _ = scipy.signal.lfilter([np.sqrt(1 - phi**2)], [1, -phi],
+                                     rng.normal(size=shape), zi=zi)
+    return series
+
+
+def mb_velocities(nmolecs, molec_size=3, nframes=5, temp=300, rng=None):
+    r"""
+    Generates a trajectory of compact molecules with Maxwell-Boltzmann
+    distributed velocities.
+
+    Parameters
+    ----------
+    nmolecs : int
+        Number of molecules.
+    molec_size : int, optional
+        Number of atoms per molecule. Default: 3.
+    nframes : int, optional
+        Number of frames. Default: 5.
+    temp : float, optional
+        Temperature. Default: 300.
+    rng : np.random.RandomState, optional
+        Random number generator.
+
+    Returns
+    -------
+    positions : nd-array (nframes x natoms x 3)
+    velocities : nd-array (nframes x natoms x 3)
+    masses : nd-array (natoms)
+    molec_idx : nd-array (nmolecs)
+        Index of the first atom of every molecule.
+    """
+    if rng is None:
+        rng = np.random.RandomState()
+    natoms = nmolecs * molec_size
+    masses = np.tile(rng.choice(_masses, size=molec_size), nmolecs)
+    box = (natoms / 100.)**(1 / 3)
+    centers = rng.uniform(0, box, size=(nframes, nmolecs, 1, 3))
+    positions = (centers +
+                 rng.normal(0, 0.1, size=(nframes, nmolecs, molec_size, 3))).reshape(nframes, natoms, 3)
+    velocities = rng.normal(size=(nframes, natoms, 3)) * np.sqrt(kb * temp / masses)[:, np.newaxis]
+    molec_idx = np.arange(0, natoms, molec_size)
+    return positions, velocities, masses, molec_idx
+
+
+def mb_kinetic_energy(nsamples, ndof, temp=300, rng=None):
+    r"""
+    Generates Maxwell-Boltzmann distributed kinetic energy samples.
+
+    Parameters
+    ----------
+    nsamples : int
+        Number of samples.
+    ndof : float
+        Number of degrees of freedom.
+    temp : float, optional
+        Temperature. Default: 300.
+    rng : np.random.RandomState, optional
+        Random number generator.
+
+    Returns
+    -------
+    kin : nd-array (nsamples)
+    """
+    if rng is None:
+        rng = np.random.RandomState()
+    return rng.gamma(ndof / 2, kb * temp, size=nsamples)
+
+
+def nvt_energies(nsamples, temps=(300, 310), mean=-10000., std=80., tau=10, rng=None):
+    r"""
+    Generates correlated potential energy series at two temperatures.
+
+    Parameters
+    ----------
+    nsamples : int
+        Number of samples per series.
+    temps : tuple of float, optional
+        Temperatures of the two series. Default: (300, 310).
+    mean : float, optional
+        Average energy at the first temperature. Default: -10000.
+    std : float, optional
+        Standard deviation of the energy. Default: 80.
+    tau : float, optional
+        Correlation time in samples. Default: 10.
+    rng : np.random.RandomState, optional
+        Random number generator.
+
+    Returns
+    -------
+    ene1, ene2 : nd-array (nsamples)
+    """
+    if rng is None:
+        rng = np.random.RandomState()
+    dbeta = 1 / (kb * temps[1]) - 1 / (kb * temps[0])
+    means = [mean, mean - std**2 * dbeta]
+    return tuple(m + std * ar1(nsamples, tau=tau, rng=rng) for m in means)
+
+
+def npt_energies_volumes(nsamples, temps=(300, 310), pressures=(1, 100),
+                         mean=(-10000., 27.), std=(80., 0.4), corr=0.3,
+                         tau=10, rng=None):
+    r"""
+    Generates correlated potential energy / volume pairs at two state points.
+
+    Parameters
+    ----------
+    nsamples : int
+        Number of samples per series.
+    temps : tuple of float, optional
+        Temperatures of the two series. Default: (300, 310).
+    pressures : tuple of float, optional
+        Pressures of the two series. Default: (1, 100).
+    mean : tuple of float, optional
+        Average energy and volume at the first state point.
+        Default: (-10000, 27).
+    std : tuple of float, optional
+        Standard deviation of energy and volume. Default: (80, 0.4).
+    corr : float, optional
+        Correlation coefficient of energy and volume. Default: 0.3.
+    tau : float, optional
+        Correlation time in samples. Default: 10.
+    rng : np.random.RandomState, optional
+        Random number generator.
+
+    Returns
+    -------
+    traj1, traj2 : nd-array (2 x nsamples)
+        Energy (first row) and volume (second row).
+    """
+    if rng is None:
+        rng = np.random.RandomState()
+    cov = np.array([[std[0]**2, corr * std[0] * std[1]],
+                    [corr * std[0] * std[1], std[1]**2]])
+    chol = np.linalg.cholesky(cov)
+    betas = [np.array([1, p * pvconvert]) / (kb * t) for t, p in zip(temps, pressures)]
+    means = [np.array(mean), np.array(mean) - cov.dot(betas[1] - betas[0])]
+    return tuple(m[:, np.newaxis] + chol.dot(ar1(nsamples, tau=tau, ndim=2, rng=rng))
+                 for m in means)
+
+
+def nve_simulations(nsamples, dts=(0.004, 0.002, 0.001), mean=-8000., std=2.,
+                    drift=1e-5, tau=10, rng=None):
+    r"""
+    Generates NVE simulations whose constant of motion fluctuates
+    proportional to the squared time step, on top of a linear drift.
+
+    Parameters
+    ----------
+    nsamples : int
+        Number of samples per simulation.
+    dts : tuple of float, optional
+        Time steps. Default: (0.004, 0.002, 0.001).
+    mean : float, optional
+        Average constant of motion. Default: -8000.
+    std : float, optional
+        Fluctuation of the constant of motion at the first time step.
+        Default: 2.
+    drift : float, optional
+        Drift per sample. Default: 1e-5.
+    tau : float, optional
+        Correlation time in samples. Default: 10.
+    rng : np.random.RandomState, optional
+        Random number generator.
+
+    Returns
+    -------
+    simulations : list of SimulationData
+    """
+    if rng is None:
+        rng = np.random.RandomState()
+    result = []
+    for dt in dts:
+        fluctuation = std * (dt / dts[0])**2
+        conserved = (mean + drift * np.arange(nsamples) +
+                     fluctuation * ar1(nsamples, tau=tau, rng=rng))
+        result.append(SimulationData(dt=dt,
+                                     observables=ObservableData(constant_of_motion=conserved)))
+    return result
+
+
+def _bench_mb_ensemble(size, rng):
+    ndof = 3000
+    kin = mb_kinetic_energy(size, ndof, rng=rng)
+    return lambda: kinetic_energy.check_mb_ensemble(kin, temp=300, ndof=ndof, alpha=None,
+                                                    kb=kb, verbosity=0)
+
+
+def _bench_equipartition(size, rng):
+    positions, velocities, masses, molec_idx = mb_velocities(size, rng=rng)
+    natoms = masses.size
+    return lambda: kinetic_energy.check_equipartition(
+        positions, velocities, masses,
+        molec_idx=molec_idx, molec_nbonds=np.zeros(size, dtype=int),
+        natoms=natoms, nmolecs=size,
+        random_divisions=2, random_groups=2,
+        verbosity=0)
+
+
+def _bench_1d(size, rng):
+    ene1, ene2 = nvt_energies(size, rng=rng)
+    return lambda: ensemble.check_1d(ene1, ene2, param1=300, param2=310, kb=kb,
+                                     quantity='U', dtemp=True, verbosity=0)
+
+
+def _bench_2d(size, rng):
+    traj1, traj2 = npt_energies_volumes(size, rng=rng)
+    return lambda: ensemble.check_2d(traj1, traj2, param1=[300, 1], param2=[310, 100],
+                                     kb=kb, pvconvert=pvconvert, quantity=['U', 'V'],
+                                     dtempdpress=True, verbosity=0)
+
+
+def _bench_convergence(size, rng):
+    simulations = nve_simulations(size, rng=rng)
+    return lambda: integrator.convergence(simulations, verbose=False)
+
+
+def _tmpdir():
+    tmpdir = tempfile.mkdtemp(prefix='pv_benchmark_')
+    atexit.register(shutil.rmtree, tmpdir, True)
+    return tmpdir
+
+
+def _bench_get_quantities(size, rng):
+    edr = os.path.join(_tmpdir(), 'ener.edr')
+    fake_gmx.write_edr(edr, natoms=3000, nsamples=size, pressure=1.,
+                       seed=rng.randint(2**31))
+    interface = GromacsInterface(backend=fake_gmx.FakeBackend())
+    quantities = ['Kinetic-En.', 'Potential', 'Total-Energy', 'Volume',
+                  'Pressure', 'Temperature', 'Conserved-En.']
+    return lambda: interface.get_quantities(edr, quantities, args=['-dp'])
+
+
+def _bench_read_trr(size, rng):
+    trr = os.path.join(_tmpdir(), 'traj.trr')
+    fake_gmx.write_trr(trr, natoms=3 * size, nframes=5, seed=rng.randint(2**31))
+    interface = GromacsInterface(backend=fake_gmx.FakeBackend())
+    return lambda: interface.read_trr(trr, fields=['position', 'velocity', 'box'])
+
+
+# name -> (input generator, scaling variable)
+benchmarks = {
+    'check_mb_ensemble': (_bench_mb_ensemble, 'samples'),
+    'check_equipartition': (_bench_equipartition, 'molecules'),
+    'check_1d': (_bench_1d, 'samples'),
+    'check_2d': (_bench_2d, 'samples'),
+    'convergence': (_bench_convergence, 'samples'),
+    'get_quantities': (_bench_get_quantities, 'samples'),
+    'read_trr': (_bench_read_trr, 'molecules'),
+}
+
+
+def import_times(modules=None, repeat=1):
+    r"""
+    Times the import of modules, each in a fresh Python interpreter.
+
+    Parameters
+    ----------
+    modules : List[str], optional
+        Modules to import. Default: `import_modules`.
+    repeat : int, optional
+        Number of timed repetitions, the fastest is reported. Default: 1.
+
+    Returns
+    -------
+    result : dict
+        Import time (in seconds) per module.
+    """
+    if modules is None:
+        modules = import_modules
+    # make sure this copy of the package is imported
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([root] + [p for p in [env.get('PYTHONPATH')] if p])
+    code = ('import timeit; t = timeit.default_timer(); import {:s}; '
+            'print(timeit.default_timer() - t)')
+    result = {}
+    for module in modules:
+        result[module] = min(
+            float(subprocess.check_output([sys.executable, '-c', code.format(module)],
+                                          env=env).decode().strip().split()[-1])
+            for _ in range(repeat))
+    return result
+
+
+def metadata():
+    r"""
+    Returns
+    -------
+    metadata : dict
+        Description of the environment the benchmarks are ran in.
+    """
+    result = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+        'kernels': kernels.backend,
+        'commit': None
+    }
+    try:
+        import pymbar
+        result['pymbar'] = getattr(pymbar, '__version__', None)
+    except ImportError:
+        result['pymbar'] = None
+    try:
+        with open(os.devnull, 'w') as devnull:
+            result['commit'] = subprocess.check_output(
+                ['git', 'rev-parse', 'HEAD'], stderr=devnull,
+                cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    return result
+
+
+def run(names=None, sizes=None, repeat=1, seed=42, max_time=None, verbose=True):
+    r"""
+    Runs the benchmarks.
+
+    Parameters
+    ----------
+    names : List[str], optional
+        Benchmarks to run, see `benchmarks`, and `import` to time the import
+        of `import_modules`. Default: all.
+    sizes : dict, optional
+        Scaling points per scaling variable ('samples', 'molecules').
+        Default: `samples` and `molecules`.
+    repeat : int, optional
+        Number of timed repetitions, the fastest is reported. Default: 1.
+    seed : int, optional
+        Seed of the input generation. Default: 42.
+    max_time : float, optional
+        If a scaling point of a benchmark takes longer than `max_time`
+        seconds, the larger scaling points of this benchmark are skipped
+        and reported as None. Default: None (no limit).
+    verbose : bool, optional
+        Print the timings. Default: True.
+
+    Returns
+    -------
+    result : dict
+        Dictionary with the keys 'metadata' (see `metadata()`) and
+        'results', mapping the benchmark names to dictionaries of timings
+        (in seconds) keyed by the scaling point (or by the module for the
+        import benchmark).
+    """
+    if names is None:
+        names = sorted(benchmarks) + ['import']
+    if sizes is None:
+        sizes = {'samples': samples, 'molecules': molecules}
+
+    result = {'metadata': metadata(), 'results': {}}
+    for name in names:
+        if name == 'import':
+            result['results'][name] = import_times(repeat=repeat)
+            if verbose:
+                for module, timing in sorted(result['results'][name].items()):
+                    print('{:20s} {:40s} {:12.4f} s'.format(name, module, timing))
+            continue
+        generator, variable = benchmarks[name]
+        result['results'][name] = {}
+        skip = False
+        for size in sorted(sizes[variable]):
+            if skip:
+                result['results'][name][str(size)] = None
+                if verbose:
+                    print('{:20s} {:>10s} {:9d} {:>14s}'.format(name, variable, size, 'skipped'))
+                continue
+            rng = np.random.RandomState(seed)
+            func = generator(size, rng)
+            # suppress the printing of the checks
+            stdout = sys.stdout
+            try:
+                with open(os.devnull, 'w') as sys.stdout:
+                    timing = min(timeit.repeat(func, repeat=repeat, number=1))
+            finally:
+                sys.stdout = stdout
+            result['results'][name][str(size)] = timing
+            if verbose:
+                print('{:20s} {:>10s} {:9d} {:12.4f} s'.format(name, variable, size, timing))
+                sys.stdout.flush()
+            skip = max_time is not None and timing > max_time
+    return result
+
+
+def compare(reference, result, verbose=True):
+    r"""
+    Compares benchmark results, e.g. obtained on different commits.
+
+    Parameters
+    ----------
+    reference : dict
+        Reference results, as returned by `run()`.
+    result : dict
+        Results, as returned by `run()`.
+    verbose : bool, optional
+        Print the comparison. Default: True.
+
+    Returns
+    -------
+    speedup : dict
+        Ratio of the reference timing and the timing per benchmark and
+        scaling point, for all points present in both results.
+    """
+    speedup = {}
+    for name, timings in result['results'].items():
+        for size, timing in timings.items():
+            try:
+                ref = reference['results'][name][size]
+            except KeyError:
+                continue
+            if ref is None or timing is None:
+                continue
+            speedup.setdefault(name, {})[size] = ref / timing if timing > 0 else float('inf')
+            if verbose:
+                print('{:20s} {:>9s} {:12.4f} s {:12.4f} s {:8.2f}x'.format(
+                    name, size, ref, timing, speedup[name][size]))
+    return speedup
+
+
+def main(args):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the physical_validation analysis on synthetic data.',
+        prog='python -m physical_validation.util.benchmark'
+    )
+    parser.add_argument('-o', '--output', type=str, metavar='file.json', default=None,
+                        help='Store the results in file.json.')
+    parser.add_argument('--compare', type=str, metavar='file.json', default=None,
+                        help='Compare the results to the results stored in file.json.')
+    parser.add_argument('-b', '--benchmarks', nargs='+', choices=sorted(benchmarks) + ['import'],
+                        default=None, help='Benchmarks to run. Default: all.')
+    parser.add_argument('--samples', nargs='+', type=int, default=None,
+                        help='Scaling points in samples per trajectory.')
+    parser.add_argument('--molecules', nargs='+', type=int, default=None,
+                        help='Scaling points in molecules.')
+    parser.add_argument('--full', default=False, action='store_true',
+                        help=('Use the full range of scaling points (up to 10^7 samples and\n'
+                              '10^6 molecules). Needs several GB of memory.'))
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='Number of timed repetitions. Default: 1.')
+    parser.add_argument('--max_time', type=float, default=60,
+                        help=('Skip the larger scaling points of a benchmark once a scaling point\n'
+                              'took longer than max_time seconds. Default: 60.'))
+    parser.add_argument('--seed', type=int, default=42,
+                        help='Seed of the synthetic data. Default: 42.')
+    args = parser.parse_args(args)
+
+    sizes = {
+        'samples': samples_full if args.full else samples,
+        'molecules': molecules_full if args.full else molecules
+    }
+    if args.samples:
+        sizes['samples'] = args.samples
+    if args.molecules:
+        sizes['molecules'] = args.molecules
+
+    result = run(names=args.benchmarks, sizes=sizes, repeat=args.repeat, seed=args.seed,
+                 max_time=args.max_time)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            reference = json.load(f)
+        print()
+        compare(reference, result)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -33,13 +33,12 @@ serves as the low-level functionality of the high-level module
 """
 from __future__ import division
 import numpy as np
-import scipy.optimize
-
-import pymbar
 
 from . import trajectory
 from . import error as pv_error
 from . import plot
+from . import kernels
+from . import profiling
 
 
 def generate_histograms(traj1, traj2, g1, g2, bins):
@@ -129,9 +128,11 @@ def do_linear_fit(traj1, traj2, g1, g2, bins,
     return a, da
 
 
+@profiling.profiled()
 def do_max_likelihood_fit(traj1, traj2, g1, g2,
                           init_params=None,
                           verbose=False):
+    import scipy.optimize
 
     # ============================================================= #
     # Define (negative) log-likelihood function and its derivatives #
@@ -145,15 +146,8 @@ def do_max_likelihood_fit(traj1, traj2, g1, g2,
         # form (a) -> 0 for x->-inf, -> inf for x->inf
         # form (b) -> NaN for x->-inf, -> x for x->inf
         # combined: -> 0 for x-> -inf, -> x for x-> inf
-        def log_1_plus_exp(y):
-            def f(yy):
-                with np.errstate(over='raise'):
-                    try:
-                        xx = np.log(1 + np.exp(yy))
-                    except FloatingPointError:
-                        xx = yy + np.log(1 + np.exp(-yy))
-                    return xx
-            return np.vectorize(f)(y)
+        # (see `kernels.log_1_plus_exp`)
+        log_1_plus_exp = kernels.log_1_plus_exp
 
         if a.size == 2:
             return (np.sum(log_1_plus_exp(a[0] + a[1]*ene1)) +
@@ -169,15 +163,8 @@ def do_max_likelihood_fit(traj1, traj2, g1, g2,
         #                               == 1 / (1 + exp(-a0 - a1*E))
         # d/da1 log(1 + exp(a0 + a1*E)) == E * exp(a0 + a1*E) / (1 + exp(a0 + a1*E))
         #                               == E / (1 + exp(-a0 - a1*E))
-        def inv_1_plus_exp(y):
-            def f(yy):
-                with np.errstate(over='raise'):
-                    try:
-                        xx = 1. / (1 + np.exp(yy))
-                    except FloatingPointError:
-                        xx = 0.
-                    return xx
-            return np.vectorize(f)(y)
+        # (see `kernels.inv_1_plus_exp`)
+        inv_1_plus_exp = kernels.inv_1_plus_exp
 
         if a.size == 2:
             d = np.zeros(2)
@@ -551,6 +538,7 @@ def check_1d(traj1, traj2, param1, param2, kb,
     -------
 
     """
+    import pymbar
 
     if (not (dtemp or dpress or dmu) or
        (dtemp and dpress) or
@@ -654,7 +642,8 @@ def check_1d(traj1, traj2, param1, param2, kb,
 
     if verbosity > 2:
         print('Computing log of partition functions using pymbar.BAR...')
-    df, ddf = pymbar.BAR(w_f, w_r)
+    with profiling.timer('pymbar.BAR'):
+        df, ddf = pymbar.BAR(w_f, w_r)
     if verbosity > 2:
         print('Using {:.5f} for log of partition functions as computed from BAR.'.format(df))
         print('Uncertainty in quantity is {:.5f}.'.format(ddf))
@@ -781,6 +770,7 @@ def check_2d(traj1, traj2, param1, param2, kb, pvconvert,
     -------
 
     """
+    import pymbar
 
     if not (dtempdpress or dtempdmu) or (dtempdpress and dtempdmu):
         raise pv_error.InputError(['dtempdpress', 'dtempdmu'],
@@ -880,7 +870,8 @@ def check_2d(traj1, traj2, param1, param2, kb, pvconvert,
 
     if verbosity > 2:
         print('Computing log of partition functions using pymbar.BAR...')
-    df, ddf = pymbar.BAR(w_f, w_r)
+    with profiling.timer('pymbar.BAR'):
+        df, ddf = pymbar.BAR(w_f, w_r)
     if verbosity > 2:
         print('Using {:.5f} for log of partition functions as computed from BAR.'.format(df))
         print('Uncertainty in quantity is {:.5f}.'.format(ddf))
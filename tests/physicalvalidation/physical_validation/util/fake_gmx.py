@@ -0,0 +1,561 @@
+#!/usr/bin/env python
+###########################################################################
+#                                                                         #
+#    physical_validation,                                                 #
+#    a python package to test the physical validity of MD results         #
+#                                                                         #
+#    Written by Michael R. Shirts <michael.shirts@colorado.edu>           #
+#               Pascal T. Merz <pascal.merz@colorado.edu>                 #
+#                                                                         #
+#    Copyright (C) 2012 University of Virginia                            #
+#              (C) 2017 University of Colorado Boulder                    #
+#                                                                         #
+#    This library is free software; you can redistribute it and/or        #
+#    modify it under the terms of the GNU Lesser General Public           #
+#    License as published by the Free Software Foundation; either         #
+#    version 2.1 of the License, or (at your option) any later version.   #
+#                                                                         #
+#    This library is distributed in the hope that it will be useful,      #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of       #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU    #
+#    Lesser General Public License for more details.                      #
+#                                                                         #
+#    You should have received a copy of the GNU Lesser General Public     #
+#    License along with this library; if not, write to the                #
+#    Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,     #
+#    Boston, MA 02110-1301 USA                                            #
+#                                                                         #
+###########################################################################
+r"""
+Stand-in for the GROMACS `gmx` executable, allowing to exercise and
+benchmark the parsing and the simulation driver without a GROMACS
+installation.
+
+The script implements the subset of `gmx` used by physical_validation:
+
+* `gmx --version`
+* `gmx grompp`: reads the mdp and gro files, writes a synthetic tpr file
+  and `mdout.mdp`,
+* `gmx mdrun`: writes synthetic edr, trr and log files,
+* `gmx energy`: writes xvg files of synthetic energy time series,
+* `gmx dump`: prints synthetic trr frames in the format of `gmx dump`.
+
+The synthetic edr and trr files only store the parameters of the
+simulation (number of atoms, frames, temperature, ...) and a random seed,
+from which `gmx energy` and `gmx dump` generate the data. The output is
+hence reproducible, and its size is independent of the size of the
+files.
+
+It can be used as executable (e.g. `gmx_physicalvalidation.py --gmx
+path/to/fake_gmx.py`) or as backend of `GromacsInterface` via
+`FakeBackend`. The size and the latency of the output are configured
+using the following environment variables (or the arguments of
+`FakeBackend`):
+
+* `PHYSICAL_VALIDATION_FAKE_GMX_LATENCY`: seconds every tool invocation
+  sleeps before starting, default 0,
+* `PHYSICAL_VALIDATION_FAKE_GMX_MDRUN_TIME`: seconds `mdrun` sleeps to
+  simulate the run, default 0,
+* `PHYSICAL_VALIDATION_FAKE_GMX_NATOMS`: number of atoms, default: read
+  from the gro file passed to `grompp`,
+* `PHYSICAL_VALIDATION_FAKE_GMX_NFRAMES`: number of trajectory frames,
+  default: from `nsteps` and `nstxout` of the mdp file,
+* `PHYSICAL_VALIDATION_FAKE_GMX_NSAMPLES`: number of energy samples,
+  default: from `nsteps` and `nstenergy` of the mdp file,
+* `PHYSICAL_VALIDATION_FAKE_GMX_SEED`: random seed of `mdrun`, default 1,
+* `PHYSICAL_VALIDATION_FAKE_GMX_MPI`: if set to a non-empty value, the
+  stand-in behaves like a build using an external MPI library, which
+  supports multi-simulations (`mdrun -multidir`). Default: thread-MPI.
+"""
+from __future__ import print_function
+from __future__ import division
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+version = '2018-fake'
+
+_env_prefix = 'PHYSICAL_VALIDATION_FAKE_GMX_'
+
+# Boltzmann constant in kJ/mol/K, and conversion from bar * nm^3 to kJ/mol
+_kb = 8.314462e-3
+_pvconvert = 0.0602214
+# atom masses of a water molecule
+_masses = np.array([15.999, 1.008, 1.008])
+
+
+class FakeBackend(object):
+    r"""
+    Backend of `GromacsInterface` running the GROMACS tools using this
+    stand-in instead of a GROMACS executable.
+
+    Parameters
+    ----------
+    latency : float, optional
+        Seconds every tool invocation sleeps before starting.
+    mdrun_time : float, optional
+        Seconds `mdrun` sleeps to simulate the run.
+    natoms : int, optional
+        Number of atoms of the simulated systems.
+    nframes : int, optional
+        Number of trajectory frames written by `mdrun`.
+    nsamples : int, optional
+        Number of energy samples written by `mdrun`.
+    seed : int, optional
+        Random seed of `mdrun`.
+    mpi : bool, optional
+        Behave like a build using an external MPI library.
+
+    Options which are not given are taken from the environment, see the
+    module documentation.
+    """
+    def __init__(self, latency=None, mdrun_time=None, natoms=None,
+                 nframes=None, nsamples=None, seed=None, mpi=None):
+        self.__env = {}
+        if mpi is not None:
+            mpi = '1' if mpi else ''
+        for key, value in [('LATENCY', latency), ('MDRUN_TIME', mdrun_time),
+                           ('NATOMS', natoms), ('NFRAMES', nframes),
+                           ('NSAMPLES', nsamples), ('SEED', seed), ('MPI', mpi)]:
+            if value is not None:
+                self.__env[_env_prefix + key] = str(value)
+
+    def run(self, command, cwd=None, stdin=None, stdout=None, stderr=None, mpicmd=None,
+            env=None):
+        # the executable name (command[0]) and the MPI launcher are ignored
+        return subprocess.Popen(self.__command(command), cwd=cwd, env=self.__environment(env),
+                                stdin=stdin, stdout=stdout, stderr=stderr)
+
+    def run_async(self, command, cwd=None, stdin=None, stdout=None, stderr=None, mpicmd=None,
+                  env=None):
+        import asyncio
+        return asyncio.create_subprocess_exec(*self.__command(command), cwd=cwd,
+                                              env=self.__environment(env),
+                                              stdin=stdin, stdout=stdout, stderr=stderr)
+
+    @staticmethod
+    def __command(command):
+        script = os.path.splitext(os.path.abspath(__file__))[0] + '.py'
+        return [sys.executable, script] + list(command[1:])
+
+    def __environment(self, env=None):
+        result = dict(os.environ)
+        result.update(self.__env)
+        if env:
+            result.update(env)
+        return result
+
+
+def _env(key, default=None, conv=int):
+    value = os.environ.get(_env_prefix + key)
+    if value is None or value == '':
+        return default
+    return conv(value)
+
+
+def _fatal(message):
+    sys.stderr.write('\n-------------------------------------------------------\n'
+                     'Fatal error:\n' + message + '\n'
+                     '-------------------------------------------------------\n')
+    sys.exit(1)
+
+
+def _options(args):
+    # gmx style options: `-opt value` or boolean `-opt`
+    options = {}
+    n = 0
+    while n < len(args):
+        if n + 1 < len(args) and not args[n + 1].startswith('-'):
+            options[args[n]] = args[n + 1]
+            n += 2
+        else:
+            options[args[n]] = True
+            n += 1
+    return options
+
+
+def _read_json(filename, kind):
+    if not os.path.exists(filename):
+        _fatal("File '" + filename + "' does not exist or is not accessible.")
+    with open(filename) as f:
+        try:
+            content = json.load(f)
+        except ValueError:
+            content = {}
+    if content.get('fake_gmx') != kind:
+        _fatal("File '" + filename + "' is not a " + kind + ' file written by fake_gmx.')
+    return content
+
+
+def _write_json(filename, kind, content):
+    content = dict(content, fake_gmx=kind)
+    with open(filename, 'w') as f:
+        json.dump(content, f, indent=2, sort_keys=True)
+
+
+def _read_mdp(mdp):
+    options = {}
+    with open(mdp) as f:
+        for line in f:
+            line = line.split(';')[0].strip()
+            if '=' not in line:
+                continue
+            key, value = line.split('=', 1)
+            options[key.strip().replace('_', '-').lower()] = value.strip()
+    return options
+
+
+def _ar1(rng, nsamples, tau=10.):
+    # stationary AR(1) process with zero mean and unit variance, as
+    # exponentially weighted sum of white noise (truncated at 20 tau)
+    phi = np.exp(-1 / tau)
+    kernel = np.sqrt(1 - phi**2) * phi**np.arange(int(20 * tau))
+    return np.convolve(rng.normal(size=nsamples + kernel.size - 1), kernel, mode='valid')
+
+
+def gmx_version(args):
+    print('                :-) GROMACS - gmx, ' + version + ' (-:\n\n'
+          'GROMACS version:    ' + version + '\n'
+          'Precision:          single\n'
+          'MPI library:        ' + ('MPI' if _env('MPI', '', str) else 'thread_mpi') + '\n'
+          'Executable:         ' + os.path.abspath(__file__))
+    return 0
+
+
+def grompp(args):
+    options = _options(args)
+    mdp = options.get('-f', 'grompp.mdp')
+    top = options.get('-p', 'topol.top')
+    gro = options.get('-c', 'conf.gro')
+    tpr = options.get('-o', 'topol.tpr')
+    for filename in [mdp, top, gro]:
+        if not os.path.exists(filename):
+            _fatal("File '" + filename + "' does not exist or is not accessible.")
+    mdp_options = _read_mdp(mdp)
+    with open(gro) as f:
+        f.readline()
+        natoms = int(f.readline().split()[0])
+    natoms = _env('NATOMS', natoms)
+
+    def option(key, default, conv=float):
+        try:
+            return conv(mdp_options.get(key, str(default)).split()[0])
+        except (ValueError, IndexError):
+            return conv(default)
+
+    pcoupl = mdp_options.get('pcoupl', 'no').lower() not in ['no', '']
+    tcoupl = (mdp_options.get('tcoupl', 'no').lower() not in ['no', ''] or
+              mdp_options.get('integrator', 'md').lower() in ['sd', 'bd'])
+    _write_json(tpr, 'tpr', {
+        'natoms': natoms,
+        'nsteps': option('nsteps', 0, int),
+        'dt': option('dt', 0.001),
+        'nstenergy': option('nstenergy', 1000, int),
+        'nstxout': option('nstxout', 0, int),
+        'ref-t': option('ref-t', 300),
+        'ref-p': option('ref-p', 1),
+        'pcoupl': pcoupl,
+        'tcoupl': tcoupl
+    })
+    with open(options.get('-po', 'mdout.mdp'), 'w') as f:
+        for key, value in sorted(mdp_options.items()):
+            f.write('{:24s} = {:s}\n'.format(key, value))
+    return 0
+
+
+def mdrun(args):
+    if '-multidir' in args:
+        # the directories are the arguments following -multidir
+        n = args.index('-multidir') + 1
+        dirs = []
+        while n < len(args) and not args[n].startswith('-'):
+            dirs.append(args[n])
+            n += 1
+        if not _env('MPI', '', str):
+            _fatal('mdrun -multidir is not supported with the thread-MPI library. '
+                   'Please compile GROMACS with a proper external MPI library.')
+        if not dirs:
+            _fatal('Expected directories after -multidir.')
+        args = args[:args.index('-multidir')] + args[n:]
+        cwd = os.getcwd()
+        for d in dirs:
+            os.chdir(os.path.join(cwd, d))
+            mdrun(args)
+        os.chdir(cwd)
+        return 0
+
+    options = _options(args)
+    tpr = options.get('-s', 'topol.tpr')
+    deffnm = options.get('-deffnm')
+    parameters = _read_json(tpr, 'tpr')
+
+    def output(flag, default, ext):
+        if flag in options:
+            return options[flag]
+        if deffnm is not None:
+            return deffnm + '.' + ext
+        return default
+
+    time.sleep(_env('MDRUN_TIME', 0., float))
+
+    nsteps = max(parameters['nsteps'], 0)
+    nstenergy = parameters['nstenergy']
+    nstxout = parameters['nstxout']
+    nsamples = nsteps // nstenergy + 1 if nstenergy > 0 else 0
+    nframes = nsteps // nstxout + 1 if nstxout > 0 else 0
+    seed = _env('SEED', 1)
+    write_edr(output('-e', 'ener.edr', 'edr'), parameters['natoms'],
+              _env('NSAMPLES', nsamples),
+              dt=parameters['dt'] * max(nstenergy, 1),
+              timestep=parameters['dt'],
+              temperature=parameters['ref-t'],
+              pressure=parameters['ref-p'] if parameters['pcoupl'] else None,
+              thermostat=parameters['tcoupl'], seed=seed)
+    write_trr(output('-o', 'traj.trr', 'trr'), parameters['natoms'],
+              _env('NFRAMES', nframes),
+              dt=parameters['dt'] * max(nstxout, 1),
+              temperature=parameters['ref-t'],
+              seed=seed)
+    with open(output('-g', 'md.log', 'log'), 'w') as log:
+        log.write('GROMACS version:    ' + version + '\n\n'
+                  'Finished mdrun on rank 0\n')
+    return 0
+
+
+def write_edr(filename, natoms, nsamples, dt=1., timestep=0.002,
+              temperature=300., pressure=None, thermostat=True, seed=1):
+    r"""
+    Writes a synthetic edr file.
+
+    Parameters
+    ----------
+    filename : str
+    natoms : int
+        Number of atoms.
+    nsamples : int
+        Number of energy samples.
+    dt : float, optional
+        Time between samples. Default: 1.
+    timestep : float, optional
+        Integration time step, the fluctuations of the constant of motion
+        scale with its square. Default: 0.002.
+    temperature : float, optional
+        Reference temperature. Default: 300.
+    pressure : float, optional
+        Reference pressure. If None, the volume is constant and not written
+        to the edr file. Default: None.
+    thermostat : bool, optional
+        If False, the total energy is the constant of motion (NVE).
+        Default: True.
+    seed : int, optional
+        Random seed. Default: 1.
+    """
+    _write_json(filename, 'edr', {
+        'natoms': natoms, 'nsamples': nsamples, 'dt': dt, 'timestep': timestep,
+        'ref-t': temperature, 'ref-p': pressure if pressure is not None else 1.,
+        'pcoupl': pressure is not None, 'tcoupl': thermostat, 'seed': seed
+    })
+
+
+def write_trr(filename, natoms, nframes, dt=1., temperature=300., seed=1):
+    r"""
+    Writes a synthetic trr file.
+
+    Parameters
+    ----------
+    filename : str
+    natoms : int
+        Number of atoms.
+    nframes : int
+        Number of frames.
+    dt : float, optional
+        Time between frames. Default: 1.
+    temperature : float, optional
+        Temperature of the Maxwell-Boltzmann distributed velocities.
+        Default: 300.
+    seed : int, optional
+        Random seed. Default: 1.
+    """
+    _write_json(filename, 'trr', {
+        'natoms': natoms, 'nframes': nframes, 'dt': dt,
+        'ref-t': temperature, 'seed': seed
+    })
+
+
+def energy_terms(edr):
+    r"""
+    Generates the synthetic energy time series of an edr file.
+
+    Parameters
+    ----------
+    edr : dict
+        Content of the synthetic edr file.
+
+    Returns
+    -------
+    time : nd-array
+    terms : list of (str, nd-array)
+        Name and time series of the energy terms.
+
+    Notes
+    -----
+    The potential energy is modeled as the one of a harmonic solid
+    (average and variance as for the kinetic energy), the volume as
+    Gaussian with the isothermal compressibility of water. The
+    distributions at different state points are hence (approximately)
+    related by Boltzmann reweighting.
+    """
+    natoms = edr['natoms']
+    nsamples = edr['nsamples']
+    temp = edr['ref-t']
+    ndof = 3 * natoms - 3
+    rng = np.random.RandomState(edr['seed'])
+
+    kinetic = rng.gamma(ndof / 2, _kb * temp, size=nsamples)
+    potential = (-12. * natoms + ndof / 2 * _kb * temp +
+                 np.sqrt(ndof / 2) * _kb * temp * _ar1(rng, nsamples))
+    # drift and fluctuations of the constant of motion scale with the
+    # squared time step
+    scale = 1e-2 * np.sqrt(natoms) * (edr.get('timestep', 0.002) / 0.002)**2
+    conserved = (-12. * natoms + ndof * _kb * temp +
+                 scale * (np.linspace(0, 1, nsamples) + _ar1(rng, nsamples)))
+    if edr.get('tcoupl', True):
+        total = potential + kinetic
+    else:
+        # NVE: the total energy is the constant of motion
+        total = conserved
+        potential = total - kinetic
+    terms = [('Potential', potential),
+             ('Kinetic En.', kinetic),
+             ('Total Energy', total),
+             ('Conserved En.', conserved),
+             ('Temperature', 2 * kinetic / (ndof * _kb)),
+             ('Pressure', edr['ref-p'] + 200 * rng.normal(size=nsamples)),
+             ('Constr. rmsd', np.abs(1e-6 * rng.normal(size=nsamples)))]
+    if edr['pcoupl']:
+        # isothermal compressibility of water (1/bar)
+        kappa = 4.5e-5
+        volume0 = natoms / 100.
+        sigma = np.sqrt(_kb * temp / _pvconvert * volume0 * kappa)
+        volume = (volume0 * (1 - kappa * (edr['ref-p'] - 1)) +
+                  sigma * _ar1(rng, nsamples))
+        terms += [('Box-X', volume**(1 / 3)),
+                  ('Box-Y', volume**(1 / 3)),
+                  ('Box-Z', volume**(1 / 3)),
+                  ('Volume', volume),
+                  ('Density', 6.0 * natoms / volume)]
+    return edr['dt'] * np.arange(nsamples), terms
+
+
+def energy(args):
+    options = _options(args)
+    edr = _read_json(options.get('-f', 'ener.edr'), 'edr')
+    xvg = options.get('-o', 'energy.xvg')
+    times, terms = energy_terms(edr)
+
+    def normalize(name):
+        return name.strip().lower().replace(' ', '-')
+
+    sys.stderr.write('Select the terms you want from the following list by\n'
+                     'selecting either (part of) the name or the number or a combination.\n'
+                     'End your selection with an empty line or a zero.\n'
+                     '-------------------------------------------------------------------\n')
+    for n, (name, _) in enumerate(terms):
+        sys.stderr.write('{:3d}  {:<16s}\n'.format(n + 1, name.replace(' ', '-')))
+    sys.stderr.write('\n')
+
+    selected = []
+    for line in sys.stdin.read().split('\n'):
+        for item in line.split():
+            if item == '0':
+                break
+            matches = [n for n, (name, _) in enumerate(terms)
+                       if normalize(name) == normalize(item)]
+            if not matches:
+                matches = [n for n, (name, _) in enumerate(terms)
+                           if normalize(name).startswith(normalize(item))]
+            if item.isdigit() and 0 < int(item) <= len(terms):
+                matches = [int(item) - 1]
+            if matches:
+                selected.append(matches[0])
+            else:
+                sys.stderr.write("String '" + item + "' does not match anything\n")
+    if not selected:
+        _fatal('No energy terms selected.')
+
+    mask = np.ones(times.size, dtype=bool)
+    if '-b' in options:
+        mask &= times >= float(options['-b'])
+    if '-e' in options:
+        mask &= times <= float(options['-e'])
+
+    fmt = '%.12g' if '-dp' in options else '%.6f'
+    with open(xvg, 'w') as f:
+        f.write('# This file was created by fake_gmx ' + version + '\n'
+                '@    title "GROMACS Energies"\n'
+                '@    xaxis  label "Time (ps)"\n'
+                '@    yaxis  label "(kJ/mol)"\n'
+                '@TYPE xy\n')
+        for n, idx in enumerate(selected):
+            f.write('@ s{:d} legend "{:s}"\n'.format(n, terms[idx][0]))
+        data = np.column_stack([times[mask]] + [terms[idx][1][mask] for idx in selected])
+        np.savetxt(f, data, fmt='%12.6f' + ('  ' + fmt) * len(selected))
+    return 0
+
+
+def dump(args):
+    options = _options(args)
+    trr_name = options.get('-f')
+    if trr_name is None:
+        _fatal('gmx dump requires an input file.')
+    trr = _read_json(trr_name, 'trr')
+    natoms = trr['natoms']
+    rng = np.random.RandomState(trr['seed'])
+    box = (natoms / 100.)**(1 / 3)
+    masses = np.resize(_masses, natoms)
+    velocity_scale = np.sqrt(_kb * trr['ref-t'] / masses)[:, np.newaxis]
+    index = np.arange(natoms)[:, np.newaxis]
+
+    out = sys.stdout
+    for frame in range(trr['nframes']):
+        out.write('{:s} frame {:d}:\n'
+                  '   natoms={:10d}  step={:10d}  time={:.7e}  lambda={:10d}\n'
+                  '   box (3x3):\n'.format(trr_name, frame, natoms, frame,
+                                           frame * trr['dt'], 0))
+        for d in range(3):
+            vector = np.zeros(3)
+            vector[d] = box
+            out.write('      box[{:5d}]={{{:12.5e}, {:12.5e}, {:12.5e}}}\n'.format(d, *vector))
+        for key, values in [('x', rng.uniform(0, box, size=(natoms, 3))),
+                            ('v', velocity_scale * rng.normal(size=(natoms, 3))),
+                            ('f', 100 * rng.normal(size=(natoms, 3)))]:
+            out.write('   {:s} ({:d}x3):\n'.format(key, natoms))
+            np.savetxt(out, np.hstack([index, values]),
+                       fmt=('      ' + key + '[%5d]={%12.5e, %12.5e, %12.5e}'))
+    return 0
+
+
+tools = {
+    'grompp': grompp,
+    'mdrun': mdrun,
+    'energy': energy,
+    'dump': dump
+}
+
+
+def main(args):
+    if not args or args[0] in ['--version', '-version']:
+        return gmx_version(args)
+    if args[0] not in tools:
+        _fatal("'" + args[0] + "' is not a GROMACS command.")
+    time.sleep(_env('LATENCY', 0., float))
+    return tools[args[0]](args[1:])
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
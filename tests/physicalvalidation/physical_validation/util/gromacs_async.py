@@ -0,0 +1,188 @@
+###########################################################################
+#                                                                         #
+#    physical_validation,                                                 #
+#    a python package to test the physical validity of MD results         #
+#                                                                         #
+#    Written by Michael R. Shirts <michael.shirts@colorado.edu>           #
+#               Pascal T. Merz <pascal.merz@colorado.edu>                 #
+#                                                                         #
+#    Copyright (C) 2012 University of Virginia                            #
+#              (C) 2017 University of Colorado Boulder                    #
+#                                                                         #
+#    This library is free software; you can redistribute it and/or        #
+#    modify it under the terms of the GNU Lesser General Public           #
+#    License as published by the Free Software Foundation; either         #
+#    version 2.1 of the License, or (at your option) any later version.   #
+#                                                                         #
+#    This library is distributed in the hope that it will be useful,      #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of       #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU    #
+#    Lesser General Public License for more details.                      #
+#                                                                         #
+#    You should have received a copy of the GNU Lesser General Public     #
+#    License along with this library; if not, write to the                #
+#    Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,     #
+#    Boston, MA 02110-1301 USA                                            #
+#                                                                         #
+###########################################################################
+r"""
+Asynchronous invocation of the GROMACS tools.
+
+`AsyncGromacsInterface` extends `GromacsInterface` by coroutine versions
+of the methods starting GROMACS tools, based on
+`asyncio.create_subprocess_exec`. The number of concurrently running
+tools is bounded by a semaphore. This allows, for example, to extract the
+energies of all simulations of a system at once::
+
+    interface = AsyncGromacsInterface(max_concurrent=4)
+    loop = asyncio.get_event_loop()
+    results = loop.run_until_complete(asyncio.gather(
+        *[interface.get_quantities_async(edr, ['Potential', 'Volume'])
+          for edr in edr_files]))
+
+The synchronous methods of `GromacsInterface` remain available.
+
+.. note:: This module requires Python 3.5 or newer, and is therefore not
+   imported by `physical_validation.util`.
+"""
+import asyncio
+import os
+import shutil
+import subprocess
+
+from .gromacs_interface import GromacsInterface, _DumpParser
+
+
+class AsyncGromacsInterface(GromacsInterface):
+    r"""
+    GromacsInterface with coroutine versions of `get_quantities`,
+    `read_trr`, `grompp` and `mdrun`.
+
+    Parameters
+    ----------
+    exe, dp, includepath, backend : optional
+        See `GromacsInterface`. The backend needs to implement `run_async()`,
+        see `SubprocessBackend`.
+    max_concurrent : int, optional
+        Maximal number of concurrently running GROMACS tools (per event
+        loop). Default: Number of CPUs.
+    """
+    def __init__(self, exe=None, dp=None, includepath=None, backend=None,
+                 max_concurrent=None):
+        super().__init__(exe=exe, dp=dp, includepath=includepath, backend=backend)
+        if max_concurrent is None:
+            max_concurrent = os.cpu_count() or 1
+        self._max_concurrent = max_concurrent
+        self._semaphores = {}
+
+    @property
+    def max_concurrent(self):
+        """max_concurrent is the maximal number of concurrently running GROMACS tools"""
+        return self._max_concurrent
+
+    async def get_quantities_async(self, edr, quantities, cwd=None,
+                                   begin=None, end=None, args=None):
+        r"""
+        Coroutine version of `get_quantities`. The quantities are extracted
+        concurrently.
+        """
+        tmp_dir = self._mkdtemp(cwd)
+        name = os.path.basename(edr).replace('.edr', '')
+
+        async def extract(n, q):
+            xvg = os.path.join(tmp_dir, name + '_' + str(n) + '.xvg')
+            reader = self._open_xvg(xvg)
+            try:
+                not_found = (await self._create_xvg_async(edr, xvg, [q], cwd=cwd,
+                                                          begin=begin, end=end, args=args))[1]
+            finally:
+                times, values = await asyncio.get_event_loop().run_in_executor(
+                    None, self._close_xvg, xvg, reader)
+            if q in not_found:
+                return q, None, None
+            return q, times, values
+
+        try:
+            extracted = await asyncio.gather(*[extract(n, q) for n, q in enumerate(quantities)])
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        return self._quantities_dict(edr, extracted)
+
+    async def read_trr_async(self, trr, fields=None, atoms=None, dtype=None):
+        r"""
+        Coroutine version of `read_trr`. The output of `gmx dump` is parsed
+        while it is being written.
+        """
+        if fields is None:
+            fields = self.trr_fields()
+        parser = _DumpParser(fields, atoms, dtype)
+
+        async with self._semaphore():
+            proc = await self._run_async('dump', ['-f', trr],
+                                         stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            while True:
+                line = await proc.stdout.readline()
+                if not line:
+                    break
+                parser.feed(line.decode('ascii', errors='replace'))
+            await proc.wait()
+
+        return parser.finish()
+
+    async def grompp_async(self, mdp, top, gro, tpr=None,
+                           cwd='.', args=None,
+                           stdin=None, stdout=None, stderr=None):
+        r"""
+        Coroutine version of `grompp`. Returns the return code of grompp.
+        `resource_usage` is not recorded.
+        """
+        cwd, args = self._grompp_args(mdp, top, gro, tpr, cwd, args)
+        async with self._semaphore():
+            proc = await self._run_async('grompp', args, cwd=cwd,
+                                         stdin=stdin, stdout=stdout, stderr=stderr)
+            return await proc.wait()
+
+    async def mdrun_async(self, tpr, edr=None, deffnm=None, cwd='.', args=None,
+                          stdin=None, stdout=None, stderr=None, mpicmd=None):
+        r"""
+        Coroutine version of `mdrun`. Returns the return code of mdrun.
+        `resource_usage` is not recorded.
+        """
+        cwd, args = self._mdrun_args(tpr, edr, deffnm, cwd, args)
+        async with self._semaphore():
+            proc = await self._run_async('mdrun', args, cwd=cwd,
+                                         stdin=stdin, stdout=stdout, stderr=stderr,
+                                         mpicmd=mpicmd)
+            return await proc.wait()
+
+    def _semaphore(self):
+        # asyncio primitives are bound to an event loop
+        loop = asyncio.get_event_loop()
+        if loop not in self._semaphores:
+            self._semaphores = {loop: asyncio.Semaphore(self._max_concurrent)}
+        return self._semaphores[loop]
+
+    async def _run_async(self, cmd, args, cwd=None, stdin=None, stdout=None, stderr=None,
+                         mpicmd=None, env=None):
+        if self.exe is None:
+            raise RuntimeError('Tried to use GromacsParser before setting gmx executable.')
+        command = [self.exe, cmd] + list(args)
+        if env:
+            return await self.backend.run_async(command, cwd=cwd,
+                                                stdin=stdin, stdout=stdout, stderr=stderr,
+                                                mpicmd=mpicmd, env=env)
+        return await self.backend.run_async(command, cwd=cwd,
+                                            stdin=stdin, stdout=stdout, stderr=stderr,
+                                            mpicmd=mpicmd)
+
+    async def _create_xvg_async(self, edr, xvg, quantities, cwd=None,
+                                begin=None, end=None, args=None):
+        args = self._energy_args(edr, xvg, begin, end, args)
+        async with self._semaphore():
+            proc = await self._run_async('energy', args, cwd=cwd,
+                                         stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                         stderr=subprocess.PIPE, env=self._energy_env)
+            err = (await proc.communicate(self._energy_input(quantities)))[1]
+
+        return proc.returncode, self._not_found(err, quantities)
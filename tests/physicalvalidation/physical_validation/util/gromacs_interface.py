@@ -33,22 +33,338 @@ GROMACS python interface.
    probably neither especially elegant nor especially safe. Use of this
    module in any remotely critical application is strongly discouraged.
 """
+import errno
+import hashlib
+import json
 import os
+import shutil
 import sys
 import subprocess
+import tempfile
+import threading
 import re
 import numpy as np
 
+from . import profiling
+
+
+class SubprocessBackend(object):
+    r"""
+    Default backend of `GromacsInterface`, running the GROMACS tools as
+    subprocesses.
+
+    A backend defines a method `run()` with the signature below, returning
+    a `subprocess.Popen` object (or an object with the same interface) of
+    the started process. See `fake_gmx.FakeBackend` for a backend which
+    does not need a GROMACS installation.
+    """
+    def run(self, command, cwd=None, stdin=None, stdout=None, stderr=None, mpicmd=None,
+            env=None):
+        r"""
+        Starts a GROMACS tool.
+
+        Parameters
+        ----------
+        command : List[str]
+            Executable, tool name and arguments.
+        cwd : str, optional
+            Working directory.
+        stdin, stdout, stderr : optional
+            Standard streams, see `subprocess.Popen`.
+        mpicmd : str, optional
+            MPI launcher the command is prefixed with.
+        env : dict, optional
+            Environment variables set in addition to the current environment.
+
+        Returns
+        -------
+        proc : subprocess.Popen
+        """
+        if mpicmd:
+            command = [mpicmd] + list(command)
+        if env:
+            env = dict(os.environ, **env)
+        return subprocess.Popen(command, cwd=cwd, env=env,
+                                stdin=stdin, stdout=stdout, stderr=stderr)
+
+    def run_async(self, command, cwd=None, stdin=None, stdout=None, stderr=None, mpicmd=None,
+                  env=None):
+        r"""
+        Starts a GROMACS tool from within an asyncio event loop (Python 3
+        only), see `gromacs_async`.
+
+        Parameters are as for `run()`.
+
+        Returns
+        -------
+        proc : coroutine
+            Coroutine returning an `asyncio.subprocess.Process`.
+        """
+        import asyncio
+        if mpicmd:
+            command = [mpicmd] + list(command)
+        if env:
+            env = dict(os.environ, **env)
+        return asyncio.create_subprocess_exec(*command, cwd=cwd, env=env,
+                                              stdin=stdin, stdout=stdout, stderr=stderr)
+
+
+def _parse_xvg(lines):
+    # parses the first data column of xvg lines
+    times = []
+    values = []
+    for line in lines:
+        if line[:1] in ('#', '@'):
+            continue
+        line = line.split()
+        if len(line) < 2:
+            continue
+        times.append(float(line[0]))
+        values.append(float(line[1]))
+    return np.array(times), np.array(values)
+
+
+# capabilities of gmx executables, see probe()
+# (backend class, executable, modification time) -> capabilities or None
+_capabilities = {}
+_capabilities_lock = threading.Lock()
+# information of `gmx --version` which is not a property of the build
+_volatile_info = ('Executable', 'Working dir', 'Command line')
+
+
+def probe(exe, backend=None, cache_file=None):
+    r"""
+    Determines version, precision and features of a gmx executable.
+
+    The executable is only started once per process: the result is cached
+    keyed by the location and modification time of the executable. When
+    running GROMACS as subprocesses, results can additionally be stored in
+    a JSON file shared between processes and invocations.
+
+    Parameters
+    ----------
+    exe : str
+        Path to a gmx executable (or simply the executable name, if it is in the path)
+    backend : object, optional
+        Backend running the executable, see `SubprocessBackend`.
+        Default: None - executable is ran as subprocess.
+    cache_file : str, optional
+        On-disk cache of the capabilities.
+        Default: None - use the file given by the environment variable
+                 `PHYSICAL_VALIDATION_GMX_CACHE`, if set.
+
+    Returns
+    -------
+    capabilities : dict or None
+        None if `exe` could not be found or is not a gmx executable. Otherwise,
+        a dict containing the GROMACS version ('version'), the precision as
+        reported by the executable ('precision'), whether it is a double
+        precision build ('double'), and further build information reported by
+        `gmx --version` such as 'MPI library', 'GPU support' or
+        'SIMD instructions' ('features').
+    """
+    if backend is None:
+        backend = SubprocessBackend()
+    path = _which(exe)
+    try:
+        mtime = os.path.getmtime(path) if path is not None else None
+    except OSError:
+        mtime = None
+    key = (type(backend), path if path is not None else exe, mtime)
+    with _capabilities_lock:
+        if key in _capabilities:
+            return _capabilities[key]
+
+    # the on-disk cache only applies to executables ran as subprocesses
+    if cache_file is None:
+        cache_file = os.environ.get('PHYSICAL_VALIDATION_GMX_CACHE')
+    if type(backend) is not SubprocessBackend or mtime is None:
+        cache_file = None
+
+    capabilities = None
+    stored = False
+    if cache_file is not None:
+        entry = _read_capabilities(cache_file).get(path)
+        if entry is not None and entry.get('mtime') == mtime:
+            capabilities = entry['capabilities']
+            stored = True
+    if capabilities is None:
+        capabilities = _probe_exe(exe, backend)
+    if capabilities is not None and cache_file is not None and not stored:
+        _write_capabilities(cache_file, path, mtime, capabilities)
+
+    with _capabilities_lock:
+        _capabilities[key] = capabilities
+    return capabilities
+
+
+def _which(exe):
+    # absolute path of the executable, None if not found
+    if os.path.dirname(exe):
+        return os.path.abspath(exe) if os.path.isfile(exe) else None
+    for directory in os.environ.get('PATH', '').split(os.pathsep):
+        candidate = os.path.join(directory, exe)
+        if os.path.isfile(candidate) and os.access(candidate, os.X_OK):
+            return os.path.abspath(candidate)
+    return None
+
+
+def _probe_exe(exe, backend):
+    try:
+        with open(os.devnull, 'w') as devnull:
+            proc = backend.run([exe, '--version'],
+                               stdout=subprocess.PIPE, stderr=devnull)
+            exe_out = proc.communicate()[0]
+    except OSError as e:
+        if e.errno == errno.ENOENT:
+            # file not found error.
+            return None
+        else:
+            raise e
+    # check that output is as expected
+    exe_out = exe_out.decode('utf-8', 'replace')
+    if not re.search(r':-\) GROMACS - gmx.* \(-:', exe_out):
+        return None
+
+    # build information is printed as `Key:   value`
+    info = {}
+    for line in exe_out.splitlines():
+        match = re.match(r'(\w[^:]*):\s\s+(\S.*)$', line)
+        if match and match.group(1) not in _volatile_info:
+            info[match.group(1)] = match.group(2).strip()
+    precision = info.pop('Precision', 'mixed').split()[0]
+    return {
+        'version': info.pop('GROMACS version', None),
+        'precision': precision,
+        'double': precision == 'double',
+        'features': info
+    }
+
+
+def _read_capabilities(cache_file):
+    try:
+        with open(cache_file) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def _write_capabilities(cache_file, path, mtime, capabilities):
+    # failing to write the cache is not an error, the executable will
+    # simply be probed again
+    cache = _read_capabilities(cache_file)
+    cache[path] = {'mtime': mtime, 'capabilities': capabilities}
+    try:
+        fd, tmp = tempfile.mkstemp(prefix='.gmxpy_', dir=os.path.dirname(os.path.abspath(cache_file)))
+        with os.fdopen(fd, 'w') as f:
+            json.dump(cache, f, indent=2, sort_keys=True)
+        os.rename(tmp, cache_file)
+    except (IOError, OSError):
+        pass
+
+
+class _FifoReader(threading.Thread):
+    # parses an xvg file written to a named pipe while it is being written
+    def __init__(self, fifo):
+        super(_FifoReader, self).__init__()
+        self.daemon = True
+        self.fifo = fifo
+        self.result = None
+        self.error = None
+        self.start()
+
+    def run(self):
+        try:
+            with open(self.fifo) as f:
+                self.result = _parse_xvg(f)
+        except Exception as e:
+            self.error = e
+
+    def close(self):
+        # to be called after the writing process has finished: if the
+        # writer never opened the pipe, unblock the reader by opening
+        # (and closing) it for writing
+        while self.is_alive():
+            try:
+                os.close(os.open(self.fifo, os.O_WRONLY | os.O_NONBLOCK))
+            except OSError:
+                # reader not waiting (yet or anymore)
+                pass
+            self.join(0.01)
+        if self.error is not None:
+            raise self.error
+
+
+class _DumpParser(object):
+    # incremental parser of the output of `gmx dump` for trr files, see
+    # GromacsInterface.read_trr
+    def __init__(self, fields, atoms, dtype=None):
+        # frames are converted to `dtype` as they are read, such that no
+        # double precision copy of the trajectory is held
+        # vector lines of the dump look like `   x[    0]={ 1.0e+00, ...}`
+        prefixes = {'box[': 'box', 'x[': 'position',
+                    'v[': 'velocity', 'f[': 'force'}
+        self.prefixes = {p: key for p, key in prefixes.items() if key in fields}
+        self.selected = None
+        if atoms is not None:
+            atoms = np.unique(np.asarray(atoms, dtype=int))
+            self.selected = np.zeros(atoms[-1] + 1 if atoms.size else 0, dtype=bool)
+            self.selected[atoms] = True
+        self.nselected = self.selected.size if self.selected is not None else 0
+        self.result = {key: [] for key in GromacsInterface.trr_fields()}
+        self.frame = None
+        self.dtype = dtype
+
+    def feed(self, line):
+        if 'frame' in line:
+            # new frame
+            self.store()
+            self.frame = {key: [] for key in self.prefixes.values()}
+            return
+        line = line.lstrip()
+        bracket = line.find('[')
+        if bracket < 0:
+            return
+        key = self.prefixes.get(line[:bracket + 1])
+        if key is None:
+            return
+        if self.selected is not None and key != 'box':
+            idx = int(line[bracket + 1:line.index(']')])
+            if idx >= self.nselected or not self.selected[idx]:
+                return
+        self.frame[key].append([float(l) for l in
+                                line.split('{', 1)[1].split('}')[0].split(',')])
+
+    def store(self):
+        if self.frame is not None:
+            for key in self.frame:
+                self.result[key].append(np.array(self.frame[key], dtype=self.dtype))
+        self.frame = None
+
+    def finish(self):
+        # save last frame
+        self.store()
+        result = {}
+        for key, vector in self.result.items():
+            vector = np.array(vector)
+            if vector.size > 0:
+                result[key] = vector
+            else:
+                result[key] = None
+        return result
+
 
 class GromacsInterface(object):
-    def __init__(self, exe=None, dp=None, includepath=None):
+    def __init__(self, exe=None, dp=None, includepath=None, backend=None):
 
         self._exe = None
-        self._dp = False
+        self._dp = None
         self._includepath = None
+        self._usage = threading.local()
+        self._backend = backend if backend is not None else SubprocessBackend()
 
         if dp is not None:
-            self.dp = dp
+            self.double = dp
 
         if exe is None:
             # check whether 'gmx' / 'gmx_d' is in the path
@@ -78,7 +394,11 @@ class GromacsInterface(object):
 
     @property
     def double(self):
-        """double is a bool defining whether the simulation was ran at double precision"""
+        """double is a bool defining whether the simulation was ran at double precision.
+        Defaults to the precision of the gmx executable."""
+        if self._dp is None:
+            capabilities = self.capabilities
+            return capabilities is not None and capabilities['double']
         return self._dp
 
     @double.setter
@@ -86,6 +406,31 @@ class GromacsInterface(object):
         assert isinstance(dp, bool)
         self._dp = dp
 
+    @property
+    def capabilities(self):
+        """capabilities of the gmx executable (version, precision and
+        features), None if no executable is set. See `probe()`."""
+        if self._exe is None:
+            return None
+        return probe(self._exe, backend=self._backend)
+
+    @property
+    def version(self):
+        """version of the gmx executable, None if no executable is set"""
+        capabilities = self.capabilities
+        if capabilities is None:
+            return None
+        return capabilities['version']
+
+    @property
+    def backend(self):
+        """backend runs the GROMACS tools, see `SubprocessBackend`"""
+        return self._backend
+
+    @backend.setter
+    def backend(self, backend):
+        self._backend = backend
+
     @property
     def includepath(self):
         """includepath defines a path the parser looks for system files"""
@@ -101,104 +446,83 @@ class GromacsInterface(object):
             path = [path]
         self._includepath = path
 
+    @profiling.profiled()
     def get_quantities(self, edr, quantities, cwd=None,
                        begin=None, end=None, args=None):
 
         if args is None:
             args = []
 
-        tmp_xvg = 'gmxpy_' + os.path.basename(edr).replace('.edr', '') + '.xvg'
-        if cwd is not None:
-            tmp_xvg = os.path.join(cwd, tmp_xvg)
+        # unique temporary directory, such that concurrent extractions
+        # from equally named edr files don't collide
+        tmp_dir = self._mkdtemp(cwd)
+        tmp_xvg = os.path.join(tmp_dir, os.path.basename(edr).replace('.edr', '') + '.xvg')
 
-        q_dict = {}
+        extracted = []
+        try:
+            for q in quantities:
+                reader = self._open_xvg(tmp_xvg)
+                try:
+                    not_found = self._create_xvg(edr, tmp_xvg, [q], cwd=cwd,
+                                                 begin=begin, end=end, args=args)[1]
+                finally:
+                    times, values = self._close_xvg(tmp_xvg, reader)
+                if q in not_found:
+                    extracted.append((q, None, None))
+                    continue
+                extracted.append((q, times, values))
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
 
-        for q in quantities:
-            not_found = self._create_xvg(edr, tmp_xvg, [q], cwd=cwd,
-                                         begin=begin, end=end, args=args)[1]
-            if q in not_found:
-                q_dict[q] = None
-                continue
+        return self._quantities_dict(edr, extracted)
 
-            skip_line = re.compile("^[#,@]")
-            values = []
-            times = []
-            with open(tmp_xvg, 'r') as xvg:
-                for line in xvg:
-                    if skip_line.match(line):
-                        continue
-                    times.append(float(line.split()[0]))
-                    values.append(float(line.split()[1]))
+    @staticmethod
+    def trr_fields():
+        return ('position', 'velocity', 'force', 'box')
 
-            if 'time' in q_dict:
-                if not np.array_equal(np.array(times), q_dict['time']):
-                    print('WARNING: Time discrepancy in ' + edr)
-            else:
-                q_dict['time'] = np.array(times)
-            q_dict[q] = np.array(values)
+    @profiling.profiled()
+    def read_trr(self, trr, fields=None, atoms=None, dtype=None):
+        r"""
+        Reads a trr trajectory.
 
-            os.remove(tmp_xvg)
+        Parameters
+        ----------
+        trr : str
+            Trajectory file
+        fields : iterable of str, optional
+            Fields to be read, subset of ['position', 'velocity', 'force', 'box'].
+            Fields not selected are not decoded and returned as None.
+            Default: all fields.
+        atoms : array-like, optional
+            Indices of the atoms to be read. Only the lines of the selected atoms
+            are decoded, and the returned positions, velocities and forces only
+            contain the selected atoms (sorted by index). Default: all atoms.
+        dtype : data-type, optional
+            Precision of the returned arrays. Default: float64.
 
-        return q_dict
+        Returns
+        -------
+        result : dict
+            Dictionary with keys 'position', 'velocity', 'force', 'box'
+        """
+        if fields is None:
+            fields = self.trr_fields()
+        parser = _DumpParser(fields, atoms, dtype)
 
-    def read_trr(self, trr):
-        tmp_dump = 'gmxpy_' + os.path.basename(trr).replace('.trr', '') + '.dump'
-        with open(tmp_dump, 'w') as dump_file:
-            proc = self._run('dump', ['-f', trr], stdout=dump_file, stderr=subprocess.PIPE)
-            proc.wait()
-
-        position = []
-        velocity = []
-        force = []
-        box = []
-        with open(tmp_dump) as dump:
-            x = []
-            v = []
-            f = []
-            b = []
-            for line in dump:
-                if 'frame' in line:
-                    # new frame
-                    if len(x) > 0:
-                        # not the first frame - nothing to save there
-                        position.append(np.array(x))
-                        velocity.append(np.array(v))
-                        force.append(np.array(f))
-                        box.append(np.array(b))
-                    x = []
-                    v = []
-                    f = []
-                    b = []
-                    continue
-                if 'x[' in line:
-                    x.append([float(l.strip()) for l in
-                              line.split('{', 1)[1].split('}')[0].split(',')])
-                if 'v[' in line:
-                    v.append([float(l.strip()) for l in
-                              line.split('{', 1)[1].split('}')[0].split(',')])
-                if 'f[' in line:
-                    f.append([float(l.strip()) for l in
-                              line.split('{', 1)[1].split('}')[0].split(',')])
-                if 'box[' in line:
-                    b.append([float(l.strip()) for l in
-                              line.split('{', 1)[1].split('}')[0].split(',')])
-            # end loop over file - save last arrays
-            position.append(np.array(x))
-            velocity.append(np.array(v))
-            force.append(np.array(f))
-            box.append(np.array(b))
+        # the dump is parsed from the pipe while gmx dump is writing it
+        with open(os.devnull, 'w') as devnull:
+            proc = self._run('dump', ['-f', trr], stdout=subprocess.PIPE, stderr=devnull)
+            try:
+                for line in proc.stdout:
+                    parser.feed(line.decode('ascii', 'replace'))
+            finally:
+                proc.stdout.close()
+                proc.wait()
 
-        result = {}
-        for key, vector in zip(['position', 'velocity', 'force', 'box'],
-                               [position, velocity, force, box]):
-            vector = np.array(vector)
-            if vector.size > 0:
-                result[key] = vector
-            else:
-                result[key] = None
-        return result
+        return parser.finish()
 
     @staticmethod
+    @profiling.profiled()
     def read_gro(gro):
         with open(gro) as conf:
             x = []
@@ -229,6 +553,7 @@ class GromacsInterface(object):
         return result
 
     @staticmethod
+    @profiling.profiled()
     def read_mdp(mdp):
         result = {}
         with open(mdp) as f:
@@ -252,6 +577,7 @@ class GromacsInterface(object):
             for key, value in options.items():
                 f.write('{:24s} = {:s}\n'.format(key, value))
 
+    @profiling.profiled()
     def read_system_from_top(self, top, define=None, include=None):
         if not define:
             define = []
@@ -375,7 +701,166 @@ class GromacsInterface(object):
 
     def grompp(self, mdp, top, gro, tpr=None,
                cwd='.', args=None,
-               stdin=None, stdout=None, stderr=None):
+               stdin=None, stdout=None, stderr=None, reuse=False):
+        # reuse: skip grompp if the tpr file was generated from identical
+        # inputs, see _grompp_hash
+        cwd, args = self._grompp_args(mdp, top, gro, tpr, cwd, args)
+        inputs = None
+        if reuse:
+            inputs = self._grompp_hash(cwd, args)
+            if inputs is not None and self._grompp_current(cwd, args, inputs):
+                self._usage.last = None
+                if hasattr(stdout, 'write'):
+                    stdout.write('Re-using ' + self._grompp_option(cwd, args, '-o') +
+                                 ', grompp inputs did not change.\n')
+                return 0
+        proc = self._run('grompp', args, cwd=cwd,
+                         stdin=stdin, stdout=stdout, stderr=stderr)
+        returncode = self._wait(proc)
+        if inputs is not None and returncode == 0:
+            self._write_grompp_hash(cwd, args, inputs)
+        return returncode
+
+    def mdrun(self, tpr, edr=None, deffnm=None, cwd='.', args=None,
+              stdin=None, stdout=None, stderr=None, mpicmd=None):
+        cwd, args = self._mdrun_args(tpr, edr, deffnm, cwd, args)
+        proc = self._run('mdrun', args, cwd=cwd,
+                         stdin=stdin, stdout=stdout, stderr=stderr,
+                         mpicmd=mpicmd)
+        return self._wait(proc)
+
+    @property
+    def supports_multisim(self):
+        """whether the gmx executable supports multi-simulations (`mdrun
+        -multidir`), which requires a build using an external MPI library"""
+        capabilities = self.capabilities
+        if capabilities is None:
+            return False
+        return capabilities['features'].get('MPI library', '').split(' ')[0] == 'MPI'
+
+    def mdrun_multi(self, dirs, tpr='topol.tpr', deffnm=None, cwd='.', args=None,
+                    stdin=None, stdout=None, stderr=None, mpicmd=None):
+        r"""
+        Runs the simulations in several directories as a single
+        multi-simulation (`mdrun -multidir`). The MPI ranks started by
+        `mpicmd` are divided equally between the simulations.
+
+        Parameters
+        ----------
+        dirs : List[str]
+            Simulation directories, relative to `cwd`.
+        tpr : str, optional
+            Name of the run input file in every directory.
+        deffnm : str, optional
+            Default file name of the output in every directory.
+        cwd : str, optional
+            Working directory.
+        args : List[str], optional
+            Further mdrun arguments.
+        stdin, stdout, stderr : optional
+            Standard streams, see `subprocess.Popen`.
+        mpicmd : str, optional
+            MPI launcher.
+
+        Returns
+        -------
+        returncode : int
+        """
+        cwd = os.path.abspath(cwd)
+        for d in dirs:
+            assert os.path.exists(os.path.join(cwd, d, tpr))
+        args = ['-multidir'] + list(dirs) + ['-s', tpr] + (list(args) if args else [])
+        if deffnm is not None:
+            args += ['-deffnm', deffnm]
+        proc = self._run('mdrun', args, cwd=cwd,
+                         stdin=stdin, stdout=stdout, stderr=stderr,
+                         mpicmd=mpicmd)
+        return self._wait(proc)
+
+    # grompp options naming input files
+    _grompp_inputs = ('-f', '-p', '-c', '-r', '-rb', '-n', '-t', '-e', '-ref', '-qmi')
+
+    @staticmethod
+    def _grompp_option(cwd, args, option, default=None):
+        # file given to grompp as `option`, relative to cwd
+        if option in args[:-1]:
+            return os.path.join(cwd, args[args.index(option) + 1])
+        if default is None:
+            return None
+        return os.path.join(cwd, default)
+
+    def _grompp_hash(self, cwd, args):
+        # hash of everything determining the grompp output: the input files
+        # (including the files included by the topology), the arguments
+        # and the GROMACS version. None if the included files can't be
+        # resolved.
+        files = [os.path.join(cwd, args[n + 1]) for n, arg in enumerate(args[:-1])
+                 if arg in self._grompp_inputs]
+        mdp = self._grompp_option(cwd, args, '-f')
+        top = self._grompp_option(cwd, args, '-p')
+        try:
+            options = self.read_mdp(mdp)
+            define = [d.strip() for d in options.get('define', '').split('-D') if d.strip()]
+            include = [os.path.dirname(top), cwd]
+            include += [os.path.join(cwd, i.strip())
+                        for i in options.get('include', '').split('-I') if i.strip()]
+            include += self._gmx_include_dirs()
+            with open(top) as f:
+                self._read_top(f, include=include, define=define, files=files)
+            h = hashlib.sha256()
+            h.update(json.dumps([self.version, list(args)]).encode('utf-8'))
+            for filename in files:
+                with open(filename, 'rb') as f:
+                    for block in iter(lambda: f.read(1 << 20), b''):
+                        h.update(block)
+        except (IOError, OSError):
+            return None
+        return h.hexdigest()
+
+    def _gmx_include_dirs(self):
+        # default include locations of grompp
+        dirs = [d for d in os.environ.get('GMXLIB', '').split(os.pathsep) if d]
+        capabilities = self.capabilities
+        if capabilities is not None and 'Data prefix' in capabilities['features']:
+            dirs.append(os.path.join(capabilities['features']['Data prefix'],
+                                     'share', 'gromacs', 'top'))
+        return dirs
+
+    @staticmethod
+    def _grompp_sidecar(cwd, args):
+        return GromacsInterface._grompp_option(cwd, args, '-o') + '.grompp.json'
+
+    @staticmethod
+    def _grompp_outputs(cwd, args):
+        return [GromacsInterface._grompp_option(cwd, args, '-o'),
+                GromacsInterface._grompp_option(cwd, args, '-po', 'mdout.mdp')]
+
+    def _grompp_current(self, cwd, args, inputs):
+        # whether the outputs of grompp exist, and were generated from the
+        # inputs with hash `inputs`
+        try:
+            with open(self._grompp_sidecar(cwd, args)) as f:
+                recorded = json.load(f)
+            tpr = os.stat(self._grompp_option(cwd, args, '-o'))
+            if not all(os.path.exists(f) for f in self._grompp_outputs(cwd, args)):
+                return False
+        except (IOError, OSError, ValueError):
+            return False
+        # the tpr file could have been regenerated without recording its inputs
+        return (recorded.get('inputs') == inputs and
+                recorded.get('tpr') == [tpr.st_size, tpr.st_mtime])
+
+    def _write_grompp_hash(self, cwd, args, inputs):
+        try:
+            tpr = os.stat(self._grompp_option(cwd, args, '-o'))
+            with open(self._grompp_sidecar(cwd, args), 'w') as f:
+                json.dump({'inputs': inputs, 'tpr': [tpr.st_size, tpr.st_mtime]}, f)
+        except (IOError, OSError):
+            # grompp will simply be ran again next time
+            pass
+
+    @staticmethod
+    def _grompp_args(mdp, top, gro, tpr, cwd, args):
         cwd = os.path.abspath(cwd)
         assert os.path.exists(os.path.join(cwd, mdp))
         assert os.path.exists(os.path.join(cwd, top))
@@ -389,14 +874,10 @@ class GromacsInterface(object):
         else:
             assert os.path.exists(os.path.join(cwd, os.path.dirname(tpr)))
 
-        args = ['-f', mdp, '-p', top, '-c', gro, '-o', tpr] + args
-        proc = self._run('grompp', args, cwd=cwd,
-                         stdin=stdin, stdout=stdout, stderr=stderr)
-        proc.wait()
-        return proc.returncode
+        return cwd, ['-f', mdp, '-p', top, '-c', gro, '-o', tpr] + args
 
-    def mdrun(self, tpr, edr=None, deffnm=None, cwd='.', args=None,
-              stdin=None, stdout=None, stderr=None, mpicmd=None):
+    @staticmethod
+    def _mdrun_args(tpr, edr, deffnm, cwd, args):
         cwd = os.path.abspath(cwd)
         tpr = os.path.join(cwd, tpr)
         assert os.path.exists(cwd)
@@ -411,79 +892,156 @@ class GromacsInterface(object):
         args = ['-s', tpr, '-deffnm', deffnm] + args
         if edr is not None:
             args += ['-e', edr]
-        proc = self._run('mdrun', args, cwd=cwd,
-                         stdin=stdin, stdout=stdout, stderr=stderr,
-                         mpicmd=mpicmd)
-        proc.wait()
-        return proc.returncode
+        return cwd, args
+
+    @property
+    def resource_usage(self):
+        """Resource usage (as returned by `os.wait4`) of the last grompp or
+        mdrun call of the current thread, None if not available."""
+        return getattr(self._usage, 'last', None)
+
+    def _wait(self, proc):
+        # wait for process to finish, recording its resource usage where
+        # the platform supports it
+        self._usage.last = None
+        if hasattr(os, 'wait4'):
+            try:
+                _, status, usage = os.wait4(proc.pid, 0)
+            except OSError:
+                # process was already reaped
+                pass
+            else:
+                self._usage.last = usage
+                if os.WIFSIGNALED(status):
+                    proc.returncode = -os.WTERMSIG(status)
+                else:
+                    proc.returncode = os.WEXITSTATUS(status)
+        return proc.wait()
 
     def _check_exe(self, quiet=False, exe=None):
         if exe is None:
             exe = self._exe
-        try:
-            devnull = open(os.devnull)
-            exe_out = subprocess.check_output([exe, '--version'], stderr=devnull)
-        except OSError as e:
-            if e.errno == os.errno.ENOENT:
-                # file not found error.
-                if not quiet:
-                    print('ERROR: gmx executable not found')
-                    print(exe)
-                return False
-            else:
-                raise e
-        # check that output is as expected
-        return re.search(br':-\) GROMACS - gmx.* \(-:', exe_out)
+        capabilities = probe(exe, backend=self._backend)
+        if capabilities is None and not quiet:
+            print('ERROR: gmx executable not found')
+            print(exe)
+        return capabilities is not None
 
-    def _run(self, cmd, args, cwd=None, stdin=None, stdout=None, stderr=None, mpicmd=None):
+    def _run(self, cmd, args, cwd=None, stdin=None, stdout=None, stderr=None, mpicmd=None,
+             env=None):
         if self.exe is None:
             raise RuntimeError('Tried to use GromacsParser before setting gmx executable.')
-        if mpicmd:
-            command = [mpicmd, self.exe, cmd]
-        else:
-            command = [self.exe, cmd]
-        command.extend(args)
-        return subprocess.Popen(command, cwd=cwd,
-                                stdin=stdin, stdout=stdout, stderr=stderr)
+        command = [self.exe, cmd] + list(args)
+        if env:
+            return self._backend.run(command, cwd=cwd,
+                                     stdin=stdin, stdout=stdout, stderr=stderr,
+                                     mpicmd=mpicmd, env=env)
+        return self._backend.run(command, cwd=cwd,
+                                 stdin=stdin, stdout=stdout, stderr=stderr,
+                                 mpicmd=mpicmd)
 
     def _create_xvg(self, edr, xvg, quantities, cwd=None,
                     begin=None, end=None, args=None):
+        args = self._energy_args(edr, xvg, begin, end, args)
+        proc = self._run('energy', args, cwd=cwd,
+                         stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                         env=self._energy_env)
+
+        err = proc.communicate(self._energy_input(quantities))[1]
+
+        return proc.wait(), self._not_found(err, quantities)
+
+    def _energy_args(self, edr, xvg, begin, end, args):
         assert os.path.exists(edr)
         assert os.path.exists(os.path.abspath(os.path.dirname(xvg)))
 
-        if args is None:
-            args = []
+        args = list(args) if args is not None else []
 
-        if self._dp:
+        # gmx rejects options given twice
+        if self.double and '-dp' not in args:
             args.append('-dp')
         if begin is not None:
             args.extend(['-b', str(begin)])
         if end is not None:
             args.extend(['-e', str(end)])
 
+        return ['-f', edr, '-o', xvg] + args
+
+    @staticmethod
+    def _energy_input(quantities):
         quants = ''
         for q in quantities:
             quants += str(q) + '\n'
 
-        args = ['-f', edr, '-o', xvg] + args
-        proc = self._run('energy', args, cwd=cwd,
-                         stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-        err = proc.communicate(quants.encode(sys.stdin.encoding))[1]
+        encoding = sys.stdin.encoding
+        if encoding is None:
+            encoding = 'UTF-8'
+        return quants.encode(encoding)
 
+    @staticmethod
+    def _not_found(err, quantities):
         encoding = sys.stderr.encoding
         if encoding is None:
             encoding = 'UTF-8'
+        err = err.decode(encoding)
 
         not_found = []
-        if 'does not match anything' in err.decode(encoding):
+        if 'does not match anything' in err:
             for q in quantities:
-                if "String '" + q + "' does not match anything" in err.decode(encoding):
+                if "String '" + q + "' does not match anything" in err:
                     not_found.append(q)
+        return not_found
+
+    @staticmethod
+    def _mkdtemp(cwd=None):
+        return os.path.abspath(tempfile.mkdtemp(prefix='gmxpy_', dir=cwd))
+
+    # gmx energy writes the xvg to a named pipe (where available), such that
+    # it is parsed while it is being written and never hits the disk.
+    # GROMACS would back up the existing pipe, this is disabled using
+    # GMX_MAXBACKUP.
+    _use_fifo = hasattr(os, 'mkfifo')
+    _energy_env = {'GMX_MAXBACKUP': '-1'} if _use_fifo else None
+
+    def _open_xvg(self, xvg):
+        if not self._use_fifo:
+            return None
+        os.mkfifo(xvg)
+        return _FifoReader(xvg)
 
-        return proc.wait(), not_found
+    def _close_xvg(self, xvg, reader):
+        # returns times and values of the xvg file (empty if not written)
+        try:
+            if reader is not None:
+                reader.close()
+                return reader.result
+            if os.path.exists(xvg):
+                with open(xvg) as f:
+                    return _parse_xvg(f)
+            return np.array([]), np.array([])
+        finally:
+            if os.path.exists(xvg):
+                os.remove(xvg)
+
+    @staticmethod
+    def _quantities_dict(edr, extracted):
+        # extracted: list of (quantity, times, values), with values None
+        # if the quantity was not found
+        q_dict = {}
+        for q, times, values in extracted:
+            if values is None:
+                q_dict[q] = None
+                continue
+            if 'time' in q_dict:
+                if not np.array_equal(times, q_dict['time']):
+                    print('WARNING: Time discrepancy in ' + edr)
+            else:
+                q_dict['time'] = times
+            q_dict[q] = values
+        return q_dict
 
-    def _read_top(self, filehandler, include, define):
+    def _read_top(self, filehandler, include, define, files=None):
+        # files: if given, the paths of the included files are appended
         read = [True]
         content = []
         include_dirs = include
@@ -528,9 +1086,12 @@ class GromacsInterface(object):
                                'Include directories: ' + str(include_dirs))
                         raise IOError(msg)
                     if ifile:
-                        subcontent = self._read_top(ifile,
-                                                    [os.path.dirname(ifile.name)] + include,
-                                                    define)
+                        if files is not None:
+                            files.append(os.path.abspath(ifile.name))
+                        with ifile:
+                            subcontent = self._read_top(ifile,
+                                                        [os.path.dirname(ifile.name)] + include,
+                                                        define, files)
                         content.extend(subcontent)
                 elif all(read):
                     raise IOError('Unknown preprocessor directive in .top file: ' +
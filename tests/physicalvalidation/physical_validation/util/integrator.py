@@ -47,19 +47,149 @@ def calculate_rmsd(data, time=None, slope=False):
 
     fit = np.polyfit(time, data, 1)
 
-    def f(x): return fit[0]*x + fit[1]
-
     if slope:
-        rmsd = 0
-        for t, d in zip(time, data):
-            rmsd += (d - f(t))**2
-        rmsd = np.sqrt(rmsd / data.size)
+        residual = data - (fit[0]*time + fit[1])
+        rmsd = np.sqrt(np.mean(residual**2))
     else:
         rmsd = data.std()
 
     return avg, rmsd, fit[0]
 
 
+def stack_trajectories(trajs):
+    r"""
+    Stacks a list of (possibly differently long) trajectories into a
+    common 2d array.
+
+    Parameters
+    ----------
+    trajs : List[nd-array]
+        List of 1d arrays (values only) or 2d arrays (times, values).
+
+    Returns
+    -------
+    time : nd-array (ntrajs x nframes)
+        Time stamps of the trajectories. Frame indices are used for
+        trajectories given without times.
+    data : nd-array (ntrajs x nframes)
+        Values of the trajectories. Shorter trajectories are padded
+        with NaN.
+    """
+    nframes = max(traj.shape[-1] for traj in trajs)
+    time = np.full((len(trajs), nframes), np.nan)
+    data = np.full((len(trajs), nframes), np.nan)
+    for n, traj in enumerate(trajs):
+        if traj.ndim == 1:
+            data[n, :traj.size] = traj
+            time[n, :traj.size] = np.arange(traj.size)
+        else:
+            time[n, :traj.shape[1]] = traj[0]
+            data[n, :traj.shape[1]] = traj[1]
+    return time, data
+
+
+def _group_fit(time, data, group, ngroups):
+    # Linear least-squares fit of the data in every group. Sums are
+    # taken over values centered on their group mean to avoid loss of
+    # precision for large constants of motion with small fluctuations.
+    count = np.bincount(group, minlength=ngroups).astype(float)
+    t_avg = np.bincount(group, weights=time, minlength=ngroups) / count
+    d_avg = np.bincount(group, weights=data, minlength=ngroups) / count
+    tc = time - t_avg[group]
+    dc = data - d_avg[group]
+    tt = np.bincount(group, weights=tc*tc, minlength=ngroups)
+    td = np.bincount(group, weights=tc*dc, minlength=ngroups)
+    dd = np.bincount(group, weights=dc*dc, minlength=ngroups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        slope = np.where(tt > 0, td / tt, 0)
+    residual = dc - slope[group]*tc
+    rr = np.bincount(group, weights=residual*residual, minlength=ngroups)
+    return d_avg, slope, np.sqrt(dd / count), np.sqrt(rr / count)
+
+
+def calculate_rmsds(time, data, nblocks=4):
+    r"""
+    Calculates averages and fluctuation estimators of a set of stacked
+    trajectories in a single vectorized pass.
+
+    Parameters
+    ----------
+    time : nd-array (ntrajs x nframes)
+        Time stamps of the trajectories, as returned by
+        `stack_trajectories`.
+    data : nd-array (ntrajs x nframes)
+        Values of the trajectories, padded with NaN.
+    nblocks : int, optional
+        Number of blocks every trajectory is divided in for the block-
+        averaged estimator. Default: 4.
+
+    Returns
+    -------
+    result : dict
+        Dictionary of 1d arrays (ntrajs x 1). Keys:
+        'avg': average, 'slope': slope of the linear fit,
+        'rmsd': standard deviation,
+        'drift': root-mean-square deviation from the linear fit,
+        'block': average over `nblocks` blocks of the root-mean-square
+        deviation from the linear fit within each block.
+    """
+    ntrajs = data.shape[0]
+    mask = np.isfinite(data)
+    length = mask.sum(axis=1)
+    row = np.broadcast_to(np.arange(ntrajs)[:, None], data.shape)[mask]
+    frame = np.broadcast_to(np.arange(data.shape[1])[None, :], data.shape)[mask]
+    t = time[mask]
+    d = data[mask]
+
+    avg, slope, rmsd, drift = _group_fit(t, d, row, ntrajs)
+
+    nblocks = max(1, min(int(nblocks), int(length.min())))
+    block = row*nblocks + frame*nblocks // length[row]
+    block_drift = _group_fit(t, d, block, ntrajs*nblocks)[3]
+    block_drift = block_drift.reshape(ntrajs, nblocks).mean(axis=1)
+
+    return {'avg': avg,
+            'slope': slope,
+            'rmsd': rmsd,
+            'drift': drift,
+            'block': block_drift}
+
+
+def convergence_report(const_traj, nblocks=4):
+    r"""
+    Calculates all fluctuation estimators for trajectories of a constant
+    of motion obtained at different time steps.
+
+    Parameters
+    ----------
+    const_traj : dict
+        Dictionary of trajectories of the constant of motion, keyed by
+        time step.
+    nblocks : int, optional
+        Number of blocks used by the block-averaged estimator. Default: 4.
+
+    Returns
+    -------
+    report : dict
+        Dictionary of 1d arrays sorted by decreasing time step. Keys:
+        'dt' and the keys returned by `calculate_rmsds`.
+    """
+    assert isinstance(const_traj, dict)
+    assert len(const_traj) >= 2
+
+    items = sorted(const_traj.items(), key=lambda x: float(x[0]), reverse=True)
+    trajs = []
+    for _, traj in items:
+        assert isinstance(traj, np.ndarray)
+        assert traj.ndim == 1 or traj.ndim == 2
+        trajs.append(traj)
+
+    time, data = stack_trajectories(trajs)
+    report = calculate_rmsds(time, data, nblocks=nblocks)
+    report['dt'] = np.array([float(dt) for dt, _ in items])
+    return report
+
+
 def max_deviation(dts, rmsds):
     dt_ratio_2 = (dts[:-1] / dts[1:])**2
     rmsds = rmsds[:-1] / rmsds[1:]
@@ -69,52 +199,32 @@ def max_deviation(dts, rmsds):
 def check_convergence(const_traj,
                       convergence_test=max_deviation,
                       verbose=True, slope=False,
+                      estimator=None, nblocks=4,
                       screen=False, filename=None):
 
-    assert isinstance(const_traj, dict)
-    assert len(const_traj) >= 2
+    if estimator is None:
+        estimator = 'drift' if slope else 'rmsd'
+    assert estimator in ['rmsd', 'drift', 'block']
+
+    report = convergence_report(const_traj, nblocks=nblocks)
+    dts = report['dt']
+    rmsds = report[estimator]
 
     if verbose:
         print('{:65s}'.format('-'*65))
         print('{:>10s} {:>10s} {:>10s} {:>10s} {:^21s}'.format('dt', 'avg', 'rmsd', 'slope', 'ratio'))
         print('{:43s} {:>10s} {:>10s}'.format('', 'dt^2', 'rmsd'))
         print('{:65s}'.format('-'*65))
-
-    prev = None
-
-    results = {}
-    for dt, traj in sorted(const_traj.items(), key=lambda x: float(x[0]), reverse=True):
-        assert isinstance(traj, np.ndarray)
-        assert traj.ndim == 1 or traj.ndim == 2
-        dt = float(dt)
-
-        if traj.ndim == 1:
-            data = traj
-            time = None
-        else:
-            data = traj[1]
-            time = traj[0]
-
-        results[dt] = calculate_rmsd(data, time, slope)
-
-        if verbose:
-            if prev is None:
-                print('{:10.4g} {:10.2f} {:10.2e} {:10.2e} {:>10s} {:>10s}'.format(dt, results[dt][0], results[dt][1],
-                                                                                   results[dt][2], '--', '--'))
-                prev = [dt, results[dt][1]]
+        for n, dt in enumerate(dts):
+            if n == 0:
+                print('{:10.4g} {:10.2f} {:10.2e} {:10.2e} {:>10s} {:>10s}'.format(
+                    dt, report['avg'][n], rmsds[n], report['slope'][n], '--', '--'))
             else:
-                print('{:10.4g} {:10.2f} {:10.2e} {:10.2e} {:10.2f} {:10.2f}'.format(dt, results[dt][0], results[dt][1],
-                                                                                     results[dt][2],
-                                                                                     prev[0]**2/dt**2,
-                                                                                     prev[1]/results[dt][1]))
-                prev = [dt, results[dt][1]]
-
-    if verbose:
+                print('{:10.4g} {:10.2f} {:10.2e} {:10.2e} {:10.2f} {:10.2f}'.format(
+                    dt, report['avg'][n], rmsds[n], report['slope'][n],
+                    dts[n-1]**2/dt**2, rmsds[n-1]/rmsds[n]))
         print('{:65s}'.format('-'*65))
 
-    dts = np.sort(np.array([float(dt) for dt in results.keys()]))[::-1]
-    rmsds = np.array([float(results[dt][1]) for dt in dts])
-
     do_plot = screen or filename is not None
 
     if do_plot:
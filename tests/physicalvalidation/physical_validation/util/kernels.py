@@ -0,0 +1,371 @@
+###########################################################################
+#                                                                         #
+#    physical_validation,                                                 #
+#    a python package to test the physical validity of MD results         #
+#                                                                         #
+#    Written by Michael R. Shirts <michael.shirts@colorado.edu>           #
+#               Pascal T. Merz <pascal.merz@colorado.edu>                 #
+#                                                                         #
+#    Copyright (C) 2012 University of Virginia                            #
+#              (C) 2017 University of Colorado Boulder                    #
+#                                                                         #
+#    This library is free software; you can redistribute it and/or        #
+#    modify it under the terms of the GNU Lesser General Public           #
+#    License as published by the Free Software Foundation; either         #
+#    version 2.1 of the License, or (at your option) any later version.   #
+#                                                                         #
+#    This library is distributed in the hope that it will be useful,      #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of       #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU    #
+#    Lesser General Public License for more details.                      #
+#                                                                         #
+#    You should have received a copy of the GNU Lesser General Public     #
+#    License along with this library; if not, write to the                #
+#    Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,     #
+#    Boston, MA 02110-1301 USA                                            #
+#                                                                         #
+###########################################################################
+r"""
+Compute kernels of the inner loops of the physical_validation analysis.
+
+Two backends implement the kernels:
+
+* `numpy`: vectorized NumPy implementation, always available.
+* `numba`: loops compiled just-in-time using Numba_, used if Numba is
+  installed.
+
+The backend is selected at import time, but only built (imported and
+compiled) when a kernel is first called. The environment variable
+`PHYSICAL_VALIDATION_BACKEND` can be set to `numpy` or `numba` to
+override the default choice. All backends implement the same functions
+with identical signatures, see `get_backend()`. The functions exposed at
+module level are the ones of the selected backend.
+
+.. _Numba: https://numba.pydata.org
+"""
+from __future__ import print_function
+from __future__ import division
+
+import os
+import timeit
+import warnings
+
+import numpy as np
+
+from . import error as pv_error
+
+
+# =============== #
+# NumPy backend   #
+# =============== #
+def _np_molec_sums(pos, vel, masses, molec_idx):
+    # molecules are stored contiguously, so the per-molecule sums
+    # are reductions over the atom slices starting at molec_idx
+    m = masses[:, np.newaxis]
+    com_m = np.add.reduceat(masses, molec_idx)
+    kin_tot = .5 * np.add.reduceat(masses * np.sum(vel * vel, axis=1), molec_idx)
+    com_r = np.add.reduceat(m * pos, molec_idx) / com_m[:, np.newaxis]
+    com_v = np.add.reduceat(m * vel, molec_idx) / com_m[:, np.newaxis]
+    kin_tra = .5 * com_m * np.sum(com_v * com_v, axis=1)
+
+    # relative positions and velocities
+    length = np.diff(np.append(molec_idx, [len(masses)]))
+    rr = pos - np.repeat(com_r, length, axis=0)
+    rv = vel - np.repeat(com_v, length, axis=0)
+    rr2 = np.sum(rr * rr, axis=1)
+    # inertia tensor:
+    #   (i,i) = m*(r*r - r(i)*r(i))
+    #   (i,j) = m*r(i)*r(j) (i != j)
+    atm_inertia = -rr[:, :, np.newaxis] * rr[:, np.newaxis, :]
+    atm_inertia[:, [0, 1, 2], [0, 1, 2]] += rr2[:, np.newaxis]
+    inertia = np.add.reduceat(m[:, :, np.newaxis] * atm_inertia, molec_idx)
+    # angular momentum: r x p
+    angular_mom = np.add.reduceat(m * np.cross(rr, rv), molec_idx)
+
+    return kin_tot, kin_tra, inertia, angular_mom
+
+
+def _np_log_1_plus_exp(y):
+    # log(1 + e^y), stable for large |y|
+    return np.logaddexp(0, y)
+
+
+def _np_inv_1_plus_exp(y):
+    # 1 / (1 + e^y), tends to 0 for large y
+    with np.errstate(over='ignore'):
+        return 1. / (1 + np.exp(y))
+
+
+_backends = {
+    'numpy': {
+        'molec_sums': _np_molec_sums,
+        'log_1_plus_exp': _np_log_1_plus_exp,
+        'inv_1_plus_exp': _np_inv_1_plus_exp
+    }
+}
+
+
+# =============== #
+# Numba backend   #
+# =============== #
+def _numba_backend():
+    try:
+        import numba
+    except ImportError:
+        return None
+
+    @numba.njit(cache=True)
+    def molec_sums(pos, vel, masses, molec_idx):
+        nmolecs = molec_idx.size
+        natoms = masses.size
+        kin_tot = np.zeros(nmolecs)
+        kin_tra = np.zeros(nmolecs)
+        inertia = np.zeros((nmolecs, 3, 3))
+        angular_mom = np.zeros((nmolecs, 3))
+        com_r = np.zeros(3)
+        com_v = np.zeros(3)
+        for n in range(nmolecs):
+            begin = molec_idx[n]
+            end = molec_idx[n + 1] if n + 1 < nmolecs else natoms
+            com_m = 0.
+            for d in range(3):
+                com_r[d] = 0.
+                com_v[d] = 0.
+            for a in range(begin, end):
+                m = masses[a]
+                com_m += m
+                for d in range(3):
+                    com_r[d] += m * pos[a, d]
+                    com_v[d] += m * vel[a, d]
+                    kin_tot[n] += .5 * m * vel[a, d] * vel[a, d]
+            for d in range(3):
+                com_r[d] /= com_m
+                com_v[d] /= com_m
+                kin_tra[n] += .5 * com_m * com_v[d] * com_v[d]
+            for a in range(begin, end):
+                m = masses[a]
+                rr0 = pos[a, 0] - com_r[0]
+                rr1 = pos[a, 1] - com_r[1]
+                rr2 = pos[a, 2] - com_r[2]
+                rv0 = vel[a, 0] - com_v[0]
+                rv1 = vel[a, 1] - com_v[1]
+                rv2 = vel[a, 2] - com_v[2]
+                r2 = rr0 * rr0 + rr1 * rr1 + rr2 * rr2
+                inertia[n, 0, 0] += m * (r2 - rr0 * rr0)
+                inertia[n, 1, 1] += m * (r2 - rr1 * rr1)
+                inertia[n, 2, 2] += m * (r2 - rr2 * rr2)
+                inertia[n, 0, 1] -= m * rr0 * rr1
+                inertia[n, 0, 2] -= m * rr0 * rr2
+                inertia[n, 1, 2] -= m * rr1 * rr2
+                angular_mom[n, 0] += m * (rr1 * rv2 - rr2 * rv1)
+                angular_mom[n, 1] += m * (rr2 * rv0 - rr0 * rv2)
+                angular_mom[n, 2] += m * (rr0 * rv1 - rr1 * rv0)
+            inertia[n, 1, 0] = inertia[n, 0, 1]
+            inertia[n, 2, 0] = inertia[n, 0, 2]
+            inertia[n, 2, 1] = inertia[n, 1, 2]
+        return kin_tot, kin_tra, inertia, angular_mom
+
+    @numba.vectorize(['float64(float64)'], cache=True)
+    def log_1_plus_exp(y):
+        if y > 0:
+            return y + np.log1p(np.exp(-y))
+        return np.log1p(np.exp(y))
+
+    @numba.vectorize(['float64(float64)'], cache=True)
+    def inv_1_plus_exp(y):
+        if y > 0:
+            e = np.exp(-y)
+            return e / (1 + e)
+        return 1. / (1 + np.exp(y))
+
+    def molec_sums_wrapper(pos, vel, masses, molec_idx):
+        return molec_sums(np.ascontiguousarray(pos, dtype=np.float64),
+                          np.ascontiguousarray(vel, dtype=np.float64),
+                          np.ascontiguousarray(masses, dtype=np.float64),
+                          np.ascontiguousarray(molec_idx, dtype=np.int64))
+
+    return {
+        'molec_sums': molec_sums_wrapper,
+        'log_1_plus_exp': log_1_plus_exp,
+        'inv_1_plus_exp': inv_1_plus_exp
+    }
+
+
+def _module_available(name):
+    # checks whether a module can be imported without importing it
+    try:
+        from importlib.util import find_spec
+    except ImportError:  # Python 2
+        import imp
+        try:
+            imp.find_module(name)
+        except ImportError:
+            return False
+        return True
+    return find_spec(name) is not None
+
+
+# backends which are expensive to build, built on first use
+# name -> (availability check, builder)
+_deferred_backends = {
+    'numba': (lambda: _module_available('numba'), _numba_backend)
+}
+
+
+def _load_backend(name):
+    # returns the kernels of a backend, None if it could not be built
+    if name not in _backends and name in _deferred_backends:
+        kernels = _deferred_backends.pop(name)[1]()
+        if kernels is not None:
+            _backends[name] = kernels
+    return _backends.get(name)
+
+
+def available_backends():
+    r"""
+    Returns
+    -------
+    backends : List[str]
+        Names of the backends available in the current environment.
+    """
+    for name in list(_deferred_backends):
+        _load_backend(name)
+    return sorted(_backends.keys())
+
+
+def get_backend(name=None):
+    r"""
+    Returns the kernels of a backend.
+
+    Parameters
+    ----------
+    name : str, optional
+        Name of the backend. Default: None (the backend selected at
+        import time).
+
+    Returns
+    -------
+    kernels : dict
+        Dictionary mapping the kernel names to their implementation.
+    """
+    if name is None:
+        name = backend
+    if _load_backend(name) is None:
+        raise pv_error.InputError('name',
+                                  'Backend `' + name + '` is not available. '
+                                  'Available backends: ' + ', '.join(available_backends()))
+    return _backends[name]
+
+
+def _available(name):
+    if name in _backends:
+        return True
+    return name in _deferred_backends and _deferred_backends[name][0]()
+
+
+def _select_backend():
+    requested = os.environ.get('PHYSICAL_VALIDATION_BACKEND')
+    if requested:
+        if _available(requested):
+            return requested
+        warnings.warn('PHYSICAL_VALIDATION_BACKEND: Backend `' + requested +
+                      '` is not available, using default backend.')
+    if _available('numba'):
+        return 'numba'
+    return 'numpy'
+
+
+backend = _select_backend()
+
+
+def _kernel(name):
+    global backend
+    kernels = _load_backend(backend)
+    if kernels is None:
+        warnings.warn('Backend `' + backend + '` could not be loaded, using numpy backend.')
+        backend = 'numpy'
+        kernels = _backends[backend]
+    return kernels[name]
+
+
+# kernels of the selected backend
+def molec_sums(pos, vel, masses, molec_idx):
+    return _kernel('molec_sums')(pos, vel, masses, molec_idx)
+
+
+def log_1_plus_exp(y):
+    return _kernel('log_1_plus_exp')(y)
+
+
+def inv_1_plus_exp(y):
+    return _kernel('inv_1_plus_exp')(y)
+
+
+def benchmark(natoms=30000, molec_size=3, nsamples=1000000,
+              repeat=3, rtol=1e-8, verbose=True):
+    r"""
+    Times the kernels of all available backends on synthetic data, and
+    checks that all backends agree numerically with the NumPy backend.
+
+    Parameters
+    ----------
+    natoms : int, optional
+        Number of atoms of the synthetic system. Default: 30000.
+    molec_size : int, optional
+        Number of atoms per molecule. Default: 3.
+    nsamples : int, optional
+        Number of samples passed to the likelihood kernels.
+        Default: 1000000.
+    repeat : int, optional
+        Number of timed repetitions, the fastest is reported. Default: 3.
+    rtol : float, optional
+        Relative tolerance of the agreement check. Default: 1e-8.
+    verbose : bool, optional
+        Print the timings. Default: True.
+
+    Returns
+    -------
+    result : dict
+        Dictionary with the timings (in seconds) per backend and kernel,
+        and the key 'agree' indicating whether all backends agree.
+    """
+    rng = np.random.RandomState(42)
+    natoms -= natoms % molec_size
+    pos = rng.uniform(0, 5, size=(natoms, 3))
+    # keep molecules compact
+    pos[1::molec_size] = pos[::molec_size] + rng.normal(0, 0.1, size=(natoms // molec_size, 3))
+    vel = rng.normal(size=(natoms, 3))
+    masses = rng.uniform(1, 16, size=natoms)
+    molec_idx = np.arange(0, natoms, molec_size)
+    y = rng.normal(0, 50, size=nsamples)
+
+    args = {
+        'molec_sums': (pos, vel, masses, molec_idx),
+        'log_1_plus_exp': (y,),
+        'inv_1_plus_exp': (y,)
+    }
+
+    result = {'agree': True}
+    reference = {name: get_backend('numpy')[name](*a) for name, a in args.items()}
+    for name in available_backends():
+        kernels = get_backend(name)
+        result[name] = {}
+        for kernel, a in args.items():
+            out = kernels[kernel](*a)
+            ref = reference[kernel]
+            if not isinstance(out, tuple):
+                out, ref = (out,), (ref,)
+            if not all(np.allclose(o, r, rtol=rtol, atol=0) for o, r in zip(out, ref)):
+                result['agree'] = False
+                if verbose:
+                    print('Backends disagree: {:s} ({:s})'.format(kernel, name))
+            result[name][kernel] = min(timeit.repeat(lambda: kernels[kernel](*a),
+                                                     repeat=repeat, number=1))
+            if verbose:
+                print('{:8s} {:16s} {:10.6f} s'.format(name, kernel, result[name][kernel]))
+
+    return result
+
+
+if __name__ == '__main__':
+    benchmark()
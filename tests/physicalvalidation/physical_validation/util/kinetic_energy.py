@@ -34,12 +34,14 @@ functions from `physical_validation.kinetic energy`.
 from __future__ import print_function
 from __future__ import division
 
-import scipy.stats as stats
 import numpy as np
 import multiprocessing as mproc
 
 from ..util import trajectory
 from . import plot
+from . import selection
+from . import kernels
+from . import profiling
 
 
 def isclose(a, b, rel_tol=1e-09, abs_tol=0.0):
@@ -120,6 +122,7 @@ def check_mb_ensemble(kin, temp, ndof, alpha, kb=8.314e-3, verbosity=1,
     --------
     physical_validation.kinetic_energy.check_mb_ensemble : High-level version
     """
+    import scipy.stats as stats
 
     # Discard burn-in period and time-correlated frames
     kin = trajectory.prepare(kin, verbosity=verbosity, name='Kinetic energy')
@@ -181,6 +184,8 @@ def check_equipartition(positions, velocities, masses,
                         molec_groups=None,
                         random_divisions=0, random_groups=2,
                         ndof_molec=None, kin_molec=None,
+                        chunk_frames=None, max_memory=None, buffer_file=None,
+                        boxes=None,
                         verbosity=2,
                         screen=False, filename=None):
     r"""
@@ -225,10 +230,11 @@ def check_equipartition(positions, velocities, masses,
     alpha : float, optional
         Confidence for Maxwell-Boltzmann test. Default: 0.05 (5%).
     molec_groups : List[array-like] (ngroups x ?), optional
-        List of 1d arrays containing molecule indeces defining groups.
-        Useful to pre-define groups of molecules (e.g. solute / solvent,
-        liquid mixture species, ...). If None, no pre-defined molecule
-        groups will be tested. Default: None.
+        List of 1d arrays containing molecule indeces or boolean masks
+        (nmolecs x 1) defining groups. Useful to pre-define groups of
+        molecules (e.g. solute / solvent, liquid mixture species, ...).
+        If None, no pre-defined molecule groups will be tested.
+        Default: None.
 
         *Note:* If an empty 1d array is found as last element in the list, the remaining
         molecules are collected in this array. This allows, for example, to only
@@ -238,12 +244,25 @@ def check_equipartition(positions, velocities, masses,
         division tests off).
     random_groups : int, optional
         Number of groups the system is randomly divided in. Default: 2.
-    ndof_molec : List[dict], optional
+    ndof_molec : dict, optional
         Pass in the degrees of freedom per molecule. Slightly increases speed of repeated
         analysis of the same simulation run.
     kin_molec : List[List[dict]], optional
         Pass in the kinetic energy per molecule. Greatly increases speed of repeated
         analysis of the same simulation run.
+    chunk_frames : int, optional
+        Number of frames of the position and velocity trajectories processed at once.
+        Default: None (determined from `max_memory`, or all frames at once).
+    max_memory : int, optional
+        Approximate memory budget (in bytes) for the raw positions and velocities
+        processed at once. Ignored if `chunk_frames` is given. Default: None.
+    buffer_file : string, optional
+        If given, the kinetic energy per molecule is accumulated in a memory-mapped
+        buffer stored in `buffer_file` rather than in memory. Default: None.
+    boxes : array-like (nframes x 3 x 3), optional
+        Box vectors for every frame. If given, molecules broken across periodic
+        boundaries are reassembled before calculating the kinetic energy
+        decomposition. Default: None.
     verbosity : int, optional
         Verbosity level, where 0 is quiet and 3 very chatty. Default: 2.
     screen : bool
@@ -255,12 +274,13 @@ def check_equipartition(positions, velocities, masses,
     -------
     result : int
         Number of equipartition violations. Tune up verbosity for details.
-    ndof_molec : List[dict]
-        List of the degrees of freedom per molecule. Can be saved to increase speed of
-        repeated analysis of the same simulation run.
-    kin_molec : List[List[dict]]
-        List of the kinetic energy per molecule per frame. Can be saved to increase speed
+    ndof_molec : dict
+        Dictionary of the degrees of freedom per molecule. Can be saved to increase speed
         of repeated analysis of the same simulation run.
+    kin_molec : nd-array (nframes x 1)
+        Structured array of the kinetic energy per molecule per frame (fields:
+        'tot', 'tra', 'rni', 'rot', 'int'). Can be saved to increase speed of
+        repeated analysis of the same simulation run.
 
     See Also
     --------
@@ -272,26 +292,23 @@ def check_equipartition(positions, velocities, masses,
 
     # for each molecule, calculate total / translational / rotational & internal /
     #   rotational / internal degrees of freedom
-    #   returns: List[dict] of floats (shape: nmolecs x 5 x 1)
+    #   returns: dict of arrays (shape: 5 x nmolecs)
     if ndof_molec is None:
         ndof_molec = calc_ndof(natoms, nmolecs, molec_idx, molec_nbonds,
                                ndof_reduction_tra, ndof_reduction_rot)
+    else:
+        ndof_molec = ndof_arrays(ndof_molec)
 
     # for each frame, calculate total / translational / rotational & internal /
     #   rotational / internal kinetic energy for each molecule
     if kin_molec is None:
-        try:
-            with mproc.Pool() as p:
-                kin_molec = p.starmap(calc_molec_kinetic_energy,
-                                      [(r, v, masses, molec_idx, natoms, nmolecs)
-                                       for r, v in zip(positions, velocities)])
-        except AttributeError:
-            # Parallel execution doesn't work in py2.7 for quite a number of reasons.
-            # Attribute error when opening the `with` region is the first error (and
-            # an easy one), but by far not the last. So let's just resort to non-parallel
-            # execution:
-            kin_molec = [calc_molec_kinetic_energy(r, v, masses, molec_idx, natoms, nmolecs)
-                         for r, v in zip(positions, velocities)]
+        kin_molec = calc_kinetic_energy_trajectory(positions, velocities, masses,
+                                                   molec_idx, natoms, nmolecs,
+                                                   chunk_frames=chunk_frames,
+                                                   max_memory=max_memory,
+                                                   buffer_file=buffer_file,
+                                                   dict_keys=dict_keys,
+                                                   boxes=boxes)
 
     result = []
 
@@ -349,20 +366,19 @@ def check_equipartition(positions, velocities, masses,
     # if no groups, return
     if not molec_groups:
         return result, ndof_molec, kin_molec
+    # groups can be given as boolean masks or as molecule indices
+    molec_groups = [selection.group_indices(g, nmolecs) for g in molec_groups]
     # is last group empty?
-    last_empty = not molec_groups[-1]
+    last_empty = molec_groups[-1].size == 0
     # get rid of empty groups
-    molec_groups = [g for g in molec_groups if g]
+    molec_groups = [g for g in molec_groups if g.size > 0]
     # if no groups now (all were empty), return now
     if not molec_groups:
         return result, ndof_molec, kin_molec
 
     if last_empty:
         # last group is [] -> insert remaining molecules
-        combined = []
-        for group in molec_groups:
-            combined.extend(group)
-        molec_groups[-1] = [m for m in range(nmolecs) if m not in combined]
+        molec_groups.append(selection.complement(molec_groups, nmolecs))
 
     for mg, group in enumerate(molec_groups):
         if verbosity > 0:
@@ -386,6 +402,251 @@ def check_equipartition(positions, velocities, masses,
     return result, ndof_molec, kin_molec
 
 
+@profiling.profiled()
+def calc_kinetic_energy_trajectory(positions, velocities, masses,
+                                   molec_idx, natoms, nmolecs,
+                                   chunk_frames=None, max_memory=None,
+                                   buffer_file=None, dict_keys=None,
+                                   boxes=None):
+    r"""
+    Calculates the total / translational / rotational & internal /
+    rotational / internal kinetic energy per molecule for every frame of
+    a trajectory.
+
+    The trajectory is processed in windows of `chunk_frames` frames, and
+    the result is accumulated in a preallocated buffer, such that only one
+    window of the raw positions and velocities needs to be held in memory
+    at once (provided `positions` and `velocities` are lazily loaded, e.g.
+    memory-mapped, arrays).
+
+    Parameters
+    ----------
+    positions : array-like (nframes x natoms x 3)
+        3d array containing the positions of all atoms for all frames
+    velocities : array-like (nframes x natoms x 3)
+        3d array containing the velocities of all atoms for all frames
+    masses : array-like (natoms x 1)
+        1d array containing the masses of all atoms
+    molec_idx : array-like (nmolecs x 1)
+        Index of first atom for every molecule
+    natoms : int
+        Total number of atoms in the system
+    nmolecs : int
+        Total number of molecules in the system
+    chunk_frames : int, optional
+        Number of frames processed at once. Default: None (determined from
+        `max_memory`, or all frames at once).
+    max_memory : int, optional
+        Approximate memory budget (in bytes) for the raw positions and
+        velocities processed at once. Ignored if `chunk_frames` is given.
+        Default: None.
+    buffer_file : string, optional
+        If given, the result is stored in a memory-mapped buffer in
+        `buffer_file`. Default: None.
+    dict_keys : List[str], optional
+        Partitions of the kinetic energy.
+        Default: ['tot', 'tra', 'rni', 'rot', 'int'].
+    boxes : array-like (nframes x 3 x 3), optional
+        Box vectors for every frame (or a single box for all frames). If
+        given, molecules broken across periodic boundaries are reassembled
+        before the decomposition, see `unwrap_molecules`. Default: None.
+
+    Returns
+    -------
+    kin_molec : nd-array (nframes x 1)
+        Structured array with one field (nmolecs x 1) per partition. Every
+        element can be indexed like the dictionaries returned by
+        `calc_molec_kinetic_energy`.
+    """
+    if dict_keys is None:
+        dict_keys = ['tot', 'tra', 'rni', 'rot', 'int']
+    nframes = len(positions)
+    if boxes is not None:
+        boxes = np.asarray(boxes, dtype=np.float64)
+
+    if chunk_frames is None:
+        if max_memory is None:
+            chunk_frames = nframes
+        else:
+            # positions and velocities, converted to double precision
+            frame_bytes = 2 * natoms * 3 * np.dtype(np.float64).itemsize
+            chunk_frames = int(max_memory // frame_bytes)
+    chunk_frames = max(1, min(int(chunk_frames), nframes))
+
+    dtype = np.dtype([(key, np.float64, (nmolecs,)) for key in dict_keys])
+    if buffer_file is not None:
+        kin_molec = np.memmap(buffer_file, dtype=dtype, mode='w+', shape=(nframes,))
+    else:
+        kin_molec = np.empty(nframes, dtype=dtype)
+
+    def calc_chunks(starmap):
+        for start in range(0, nframes, chunk_frames):
+            stop = min(start + chunk_frames, nframes)
+            # trajectories might be stored in single precision,
+            # accumulate in double precision
+            pos = np.asarray(positions[start:stop], dtype=np.float64)
+            vel = np.asarray(velocities[start:stop], dtype=np.float64)
+            if boxes is not None:
+                box = boxes[start:stop] if boxes.ndim == 3 and len(boxes) > 1 else boxes
+                pos = unwrap_molecules(pos, box, molec_idx, natoms)
+            kin = starmap(calc_molec_kinetic_energy,
+                          [(r, v, masses, molec_idx, natoms, nmolecs)
+                           for r, v in zip(pos, vel)])
+            # free raw chunk before next window is loaded
+            del pos, vel
+            for n, k in enumerate(kin):
+                for key in dict_keys:
+                    kin_molec[key][start + n] = k[key]
+            del kin
+
+    def serial_starmap(f, args):
+        return [f(*a) for a in args]
+
+    if mproc.current_process().daemon:
+        # daemonic processes (e.g. workers of a process pool running
+        # several analyses at once) are not allowed to have children
+        calc_chunks(serial_starmap)
+    else:
+        try:
+            with mproc.Pool() as p:
+                calc_chunks(p.starmap)
+        except AttributeError:
+            # Parallel execution doesn't work in py2.7 for quite a number of reasons.
+            # Attribute error when opening the `with` region is the first error (and
+            # an easy one), but by far not the last. So let's just resort to non-parallel
+            # execution:
+            calc_chunks(serial_starmap)
+
+    if buffer_file is not None:
+        kin_molec.flush()
+
+    return kin_molec
+
+
+def constrained_bond_atoms(constrained_bonds, molec_idx):
+    r"""
+    Converts the constrained bonds per molecule into global atom indices.
+
+    Parameters
+    ----------
+    constrained_bonds : List[List[List[int]]]
+        Constrained bonds of every molecule, given as pairs of atom indices
+        relative to the first atom of the molecule.
+    molec_idx : array-like (nmolecs x 1)
+        Index of first atom for every molecule
+
+    Returns
+    -------
+    bonds : nd-array (nbonds x 2)
+        Global atom indices of all constrained bonds.
+    """
+    nbonds = np.array([len(b) for b in constrained_bonds], dtype=int)
+    if nbonds.sum() == 0:
+        return np.zeros((0, 2), dtype=int)
+    local = np.concatenate([np.reshape(b, (-1, 2)) for b in constrained_bonds if len(b)])
+    return local + np.repeat(np.asarray(molec_idx), nbonds)[:, np.newaxis]
+
+
+def check_constraints(positions, velocities, bonds,
+                      boxes=None, chunk_frames=None, tolerance=None,
+                      verbosity=1):
+    r"""
+    Checks whether there is kinetic energy in constrained degrees of freedom.
+
+    .. warning: This is a low-level function. Additionally to being less
+       user-friendly, there is a higher probability of erroneous and / or
+       badly documented behavior due to unexpected inputs. Consider using
+       the high-level version based on the SimulationData object. See
+       physical_validation.kinetic_energy.constraints for more
+       information and full documentation.
+
+    Parameters
+    ----------
+    positions : array-like (nframes x natoms x 3)
+        3d array containing the positions of all atoms for all frames
+    velocities : array-like (nframes x natoms x 3)
+        3d array containing the velocities of all atoms for all frames
+    bonds : array-like (nbonds x 2)
+        Atom indices of the constrained bonds
+    boxes : array-like (nframes x 3 x 3), optional
+        Box vectors for every frame (or a single box for all frames). If
+        given, bond vectors are taken as minimum image. Default: None.
+    chunk_frames : int, optional
+        Number of frames processed at once. Default: None (all frames).
+    tolerance : float, optional
+        If given and verbosity > 0, the test outputs a passed / failed
+        message. Default: None.
+    verbosity : int, optional
+        Verbosity level, where 0 is quiet and 3 very chatty. Default: 1.
+
+    Returns
+    -------
+    result : float
+        Root-mean-square relative velocity along the constrained bonds,
+        relative to the root-mean-square relative velocity per dimension.
+        The result is expected to be 0 for perfectly satisfied constraints,
+        and 1 for unconstrained bonds.
+    """
+    bonds = np.asarray(bonds, dtype=int).reshape(-1, 2)
+    if bonds.shape[0] == 0:
+        if verbosity > 0:
+            print('No constrained bonds found.')
+        return 0.
+
+    nframes = len(positions)
+    if chunk_frames is None:
+        chunk_frames = nframes
+    chunk_frames = max(1, min(int(chunk_frames), nframes))
+    if boxes is not None:
+        boxes = np.asarray(boxes, dtype=np.float64)
+
+    # sums over frames for every bond
+    v_par2 = np.zeros(bonds.shape[0])
+    v_rel2 = np.zeros(bonds.shape[0])
+    for start in range(0, nframes, chunk_frames):
+        stop = min(start + chunk_frames, nframes)
+        pos = np.asarray(positions[start:stop], dtype=np.float64)
+        vel = np.asarray(velocities[start:stop], dtype=np.float64)
+        r = pos[:, bonds[:, 0]] - pos[:, bonds[:, 1]]
+        del pos
+        if boxes is not None:
+            box = boxes[start:stop] if boxes.ndim == 3 and len(boxes) > 1 else boxes
+            if box.ndim == 3:
+                box = box[:, np.newaxis]
+            frac = np.einsum('...j,...jk->...k', r, np.linalg.inv(box))
+            frac -= np.round(frac)
+            r = np.einsum('...j,...jk->...k', frac, box)
+        v = vel[:, bonds[:, 0]] - vel[:, bonds[:, 1]]
+        del vel
+        # velocity component along the bond
+        v_par = np.einsum('fbi,fbi->fb', v, r) / np.linalg.norm(r, axis=-1)
+        v_par2 += np.sum(v_par**2, axis=0)
+        v_rel2 += np.einsum('fbi,fbi->b', v, v)
+        del r, v, v_par
+
+    result = np.sqrt(3 * v_par2.sum() / v_rel2.sum())
+
+    if verbosity > 0:
+        message = ('Relative velocity along {:d} constrained bonds: {:g}\n'
+                   '(0: constraints perfectly satisfied, 1: no constraints)'.format(
+                       bonds.shape[0], result))
+        if verbosity > 1:
+            worst = np.argmax(v_par2 / v_rel2)
+            message += ('\nLargest deviation for bond {:d} - {:d}: {:g}'.format(
+                bonds[worst, 0], bonds[worst, 1],
+                np.sqrt(3 * v_par2[worst] / v_rel2[worst])))
+        if tolerance is not None:
+            if result <= tolerance:
+                message += ('\nTolerance = {:f}\n'
+                            'Result: Passed'.format(tolerance))
+            else:
+                message += ('\nTolerance = {:f}\n'
+                            'Result: Failed'.format(tolerance))
+        print(message)
+
+    return result
+
+
 def calc_system_ndof(natoms, nmolecs, nbonds,
                      stop_com_tra, stop_com_rot):
     r"""
@@ -452,6 +713,10 @@ def calc_ndof(natoms, nmolecs,
     Calculates the total / translational / rotational & internal /
     rotational / internal degrees of freedom per molecule.
 
+    Molecules with identical number of atoms and constraints share their
+    degrees of freedom, which are hence calculated once per molecule type
+    and broadcast to all molecules.
+
     Parameters
     ----------
     natoms : int
@@ -471,47 +736,137 @@ def calc_ndof(natoms, nmolecs,
 
     Returns
     -------
-    ndof_molec : List[dict]
-        List of dictionaries containing the degrees of freedom for each molecule
+    ndof_molec : dict
+        Dictionary containing the degrees of freedom of every molecule as
+        nd-arrays (nmolecs x 1).
         Keys: ['tot', 'tra', 'rni', 'rot', 'int']
     """
+    molec_natoms = np.diff(np.append(molec_idx, [natoms]))
+    molec_nbonds = np.asarray(molec_nbonds, dtype=float)
     # check whether there are monoatomic molecules:
-    nmono = (np.array(molec_idx[1:]) - np.array(molec_idx[:-1]) == 1).sum()
+    nmono = np.sum(molec_natoms == 1)
 
     # ndof to be deducted per molecule
     # ndof reduction due to COM motion constraining
     ndof_com_tra_pm = ndof_reduction_tra / nmolecs
-    ndof_com_rot_pm = ndof_reduction_rot / (nmolecs - nmono)
-
-    ndof_molec = []
-    # add last idx to molec_idx to ease looping
-    molec_idx = np.append(molec_idx, [natoms])
-    # loop over molecules
-    for idx_molec, (idx_atm_init, idx_atm_end) in enumerate(zip(molec_idx[:-1], molec_idx[1:])):
-        natoms = idx_atm_end - idx_atm_init
-        nbonds = molec_nbonds[idx_molec]
-        ndof_tot = 3*natoms - nbonds - ndof_com_tra_pm - ndof_com_rot_pm
-        ndof_tra = 3 - ndof_com_tra_pm
-        ndof_rni = ndof_tot - ndof_tra
-        ndof_rot = 3 - ndof_com_rot_pm
-        ndof_int = ndof_tot - ndof_tra - ndof_rot
-        if isclose(ndof_int, 0, abs_tol=1e-09):
-            ndof_int = 0
-        if natoms == 1:
-            ndof_tot = 3 - ndof_com_tra_pm
-            ndof_tra = 3 - ndof_com_tra_pm
-            ndof_rni = 0
-            ndof_rot = 0
-            ndof_int = 0
-        ndof_molec.append({'tot': ndof_tot,
-                           'tra': ndof_tra,
-                           'rni': ndof_rni,
-                           'rot': ndof_rot,
-                           'int': ndof_int})
-
-    return ndof_molec
+    ndof_com_rot_pm = 0
+    if nmolecs > nmono:
+        ndof_com_rot_pm = ndof_reduction_rot / (nmolecs - nmono)
+
+    # molecule types: unique combinations of number of atoms and bonds
+    types, molec_type = np.unique(np.stack([molec_natoms, molec_nbonds], axis=1),
+                                  axis=0, return_inverse=True)
+    molec_type = molec_type.reshape(-1)
+    type_natoms = types[:, 0]
+    type_nbonds = types[:, 1]
+
+    ndof_tot = 3*type_natoms - type_nbonds - ndof_com_tra_pm - ndof_com_rot_pm
+    ndof_tra = np.full(types.shape[0], 3 - ndof_com_tra_pm, dtype=float)
+    ndof_rni = ndof_tot - ndof_tra
+    ndof_rot = np.full(types.shape[0], 3 - ndof_com_rot_pm, dtype=float)
+    ndof_int = ndof_tot - ndof_tra - ndof_rot
+    ndof_int[np.abs(ndof_int) <= 1e-09] = 0
+    # monoatomic molecules
+    mono = type_natoms == 1
+    ndof_tot[mono] = 3 - ndof_com_tra_pm
+    ndof_tra[mono] = 3 - ndof_com_tra_pm
+    ndof_rni[mono] = 0
+    ndof_rot[mono] = 0
+    ndof_int[mono] = 0
+
+    return {'tot': ndof_tot[molec_type],
+            'tra': ndof_tra[molec_type],
+            'rni': ndof_rni[molec_type],
+            'rot': ndof_rot[molec_type],
+            'int': ndof_int[molec_type]}
+
+
+def ndof_arrays(ndof_molec):
+    r"""
+    Converts degrees of freedom per molecule given as list of dictionaries
+    (as returned by earlier versions of `calc_ndof`) to a dictionary of
+    arrays.
+
+    Parameters
+    ----------
+    ndof_molec : dict or List[dict]
+        Partitioned degrees of freedom per molecule.
+
+    Returns
+    -------
+    ndof_molec : dict
+        Dictionary of nd-arrays (nmolecs x 1).
+    """
+    if isinstance(ndof_molec, dict):
+        return ndof_molec
+    return {key: np.array([ndof[key] for ndof in ndof_molec])
+            for key in ['tot', 'tra', 'rni', 'rot', 'int']}
+
 
+def group_indicator(molec_group, nmolecs):
+    r"""
+    Creates the indicator vector of a group of molecules.
 
+    Parameters
+    ----------
+    molec_group : iterable
+        Indeces of the molecules in the group, or boolean mask (nmolecs x 1).
+    nmolecs : int
+        Total number of molecules in the system.
+
+    Returns
+    -------
+    indicator : nd-array (nmolecs x 1)
+        Number of times every molecule is part of the group.
+    """
+    molec_group = np.asarray(molec_group)
+    if molec_group.dtype == bool:
+        return molec_group.astype(float)
+    return np.bincount(molec_group.astype(int).reshape(-1),
+                       minlength=nmolecs).astype(float)
+
+
+def unwrap_molecules(pos, box, molec_idx, natoms):
+    r"""
+    Reassembles molecules which are broken across periodic boundaries.
+
+    Every atom is moved to the periodic image closest to the first atom of
+    its molecule. This assumes that molecules extend over less than half of
+    the box in every direction.
+
+    Parameters
+    ----------
+    pos : nd-array (nframes x natoms x 3)
+        Positions of all atoms. A single frame (natoms x 3) is accepted.
+    box : nd-array (nframes x 3 x 3)
+        Box vectors for every frame. A single box (3 x 3) is used for all
+        frames.
+    molec_idx : nd-array (nmolecs x 1)
+        Index of first atom for every molecule
+    natoms : int
+        Total number of atoms in the system
+
+    Returns
+    -------
+    pos : nd-array
+        Positions with whole molecules, same shape as the input.
+    """
+    pos = np.asarray(pos)
+    box = np.asarray(box, dtype=np.float64)
+    if box.ndim == 3 and pos.ndim == 3:
+        # broadcast boxes over atoms
+        box = box[:, np.newaxis]
+    molec_idx = np.asarray(molec_idx)
+    length = np.diff(np.append(molec_idx, [natoms]))
+    # first atom of the molecule of every atom
+    ref = pos[..., np.repeat(molec_idx, length), :]
+    # distance vectors in fractional coordinates, shifted to the closest image
+    frac = np.einsum('...j,...jk->...k', pos - ref, np.linalg.inv(box))
+    frac -= np.round(frac)
+    return ref + np.einsum('...j,...jk->...k', frac, box)
+
+
+@profiling.profiled()
 def calc_molec_kinetic_energy(pos, vel, masses,
                               molec_idx, natoms, nmolecs):
     r"""
@@ -539,89 +894,29 @@ def calc_molec_kinetic_energy(pos, vel, masses,
         List of dictionaries containing the kinetic energies for each molecule
         Keys: ['tot', 'tra', 'rni', 'rot', 'int']
     """
-    # add last idx to molec_idx to ease looping
-    molec_idx = np.append(molec_idx, [natoms])
-
-    # calculate kinetic energy
-    kin_tot = np.zeros(nmolecs)
-    kin_tra = np.zeros(nmolecs)
-    kin_rni = np.zeros(nmolecs)
+    molec_idx = np.asarray(molec_idx)
+    # sums over the atoms of every molecule
+    kin_tot, kin_tra, inertia, angular_mom = kernels.molec_sums(
+        np.asarray(pos, dtype=np.float64), np.asarray(vel, dtype=np.float64),
+        np.asarray(masses, dtype=np.float64), molec_idx)
+
+    # monoatomic molecules only have translational kinetic energy
+    poly = np.diff(np.append(molec_idx, [natoms])) > 1
+    kin_tra[~poly] = kin_tot[~poly]
+    # combined rotational and internal kinetic energy
+    kin_rni = kin_tot - kin_tra
+
+    # angular velocity of the molecules: inertia^{-1} * angular_mom
     kin_rot = np.zeros(nmolecs)
-    kin_int = np.zeros(nmolecs)
-    # loop over molecules
-    for idx_molec, (idx_atm_init, idx_atm_end) in enumerate(zip(molec_idx[:-1], molec_idx[1:])):
-        # if monoatomic molecule
-        if idx_atm_end == idx_atm_init + 1:
-            v = vel[idx_atm_init]
-            m = masses[idx_atm_init]
-            kin_tot[idx_molec] = .5 * m * np.dot(v, v)
-            kin_tra[idx_molec] = kin_tot[idx_molec]
-            kin_rni[idx_molec] = 0
-            kin_rot[idx_molec] = 0
-            kin_int[idx_molec] = 0
-            continue
-        # compute center of mass position, velocity and total mass
-        com_r = np.zeros(3)
-        com_v = np.zeros(3)
-        com_m = 0
-        # loop over atoms in molecule
-        for r, v, m in zip(pos[idx_atm_init:idx_atm_end],
-                           vel[idx_atm_init:idx_atm_end],
-                           masses[idx_atm_init:idx_atm_end]):
-            com_r += m*r
-            com_v += m*v
-            com_m += m
-
-            # total kinetic energy is straightforward
-            kin_tot[idx_molec] += .5 * m * np.dot(v, v)
-
-        com_r /= com_m
-        com_v /= com_m
-
-        # translational kinetic energy
-        kin_tra[idx_molec] = .5 * com_m * np.dot(com_v, com_v)
-        # combined rotational and internal kinetic energy
-        kin_rni[idx_molec] = kin_tot[idx_molec] - kin_tra[idx_molec]
-
-        # compute tensor of inertia and angular momentum
-        inertia = np.zeros((3, 3))
-        angular_mom = np.zeros(3)
-        # loop over atoms in molecule
-        for r, v, m in zip(pos[idx_atm_init:idx_atm_end],
-                           vel[idx_atm_init:idx_atm_end],
-                           masses[idx_atm_init:idx_atm_end]):
-            # relative positions and velocities
-            rr = r - com_r
-            rv = v - com_v
-            rr2 = np.dot(rr, rr)
-            # inertia tensor:
-            #   (i,i) = m*(r*r - r(i)*r(i))
-            #   (i,j) = m*r(i)*r(j) (i != j)
-            atm_inertia = -m*np.tensordot(rr, rr, axes=0)
-            for i in range(3):
-                atm_inertia[i][i] += m*rr2
-            inertia += atm_inertia
-            # angular momentum: r x p
-            angular_mom += m * np.cross(rr, rv)
-
-        # angular velocity of the molecule: inertia^{-1} * angular_mom
-        angular_v = np.dot(np.linalg.inv(inertia), angular_mom)
-
-        # test_kin = 0
-        # for r, v, m in zip(pos[idx_atm_init:idx_atm_end],
-        #                    vel[idx_atm_init:idx_atm_end],
-        #                    masses[idx_atm_init:idx_atm_end]):
-        #     # relative positions and velocities
-        #     rr = r - com_r
-        #     rv = v - com_v - np.cross(angular_v, rr)
-        #     test_kin += .5 * m * np.dot(rv, rv)
-        #
-        # print(test_kin)
-
-        kin_rot[idx_molec] = .5 * np.dot(angular_v, angular_mom)
-        kin_int[idx_molec] = kin_rni[idx_molec] - kin_rot[idx_molec]
-
-        # end loop over molecules
+    if np.any(poly):
+        try:
+            angular_v = np.linalg.solve(inertia[poly], angular_mom[poly, :, np.newaxis])
+        except np.linalg.LinAlgError:
+            # singular inertia tensor, e.g. linear molecules aligned with an axis
+            angular_v = np.matmul(np.linalg.pinv(inertia[poly]),
+                                  angular_mom[poly, :, np.newaxis])
+        kin_rot[poly] = .5 * np.sum(angular_v[:, :, 0] * angular_mom[poly], axis=1)
+    kin_int = kin_rni - kin_rot
 
     return {'tot': kin_tot,
             'tra': kin_tra,
@@ -650,19 +945,92 @@ def group_kinetic_energy(kin_molec, nmolecs, molec_group=None):
     kin : dict
         Dictionary of partitioned kinetic energy for the group.
     """
-    #
-    kin = {'tot': 0, 'tra': 0, 'rni': 0, 'rot': 0, 'int': 0}
-    #
+    keys = ['tot', 'tra', 'rni', 'rot', 'int']
     if molec_group is None:
-        molec_group = range(nmolecs)
-    # loop over molecules
-    for idx_molec in molec_group:
-        for key in kin.keys():
-            kin[key] += kin_molec[key][idx_molec]
+        return {key: np.sum(kin_molec[key]) for key in keys}
+    indicator = group_indicator(molec_group, nmolecs)
+    return {key: indicator.dot(kin_molec[key]) for key in keys}
 
+
+def group_kinetic_energy_trajectory(kin_molec, nmolecs, molec_group=None,
+                                    dict_keys=None):
+    r"""
+    Sums up the partitioned kinetic energy for a given group or the
+    entire system for every frame of a trajectory.
+
+    Parameters
+    ----------
+    kin_molec : nd-array or List[dict]
+        Partitioned kinetic energies per molecule for every frame, as
+        returned by `calc_kinetic_energy_trajectory`.
+    nmolecs : int
+        Total number of molecules in the system.
+    molec_group : iterable
+        Indeces of the group to be summed up. None defaults to all molecules
+        in the system. Default: None.
+    dict_keys : List[str], optional
+        Partitions of the kinetic energy.
+        Default: ['tot', 'tra', 'rni', 'rot', 'int'].
+
+    Returns
+    -------
+    kin : dict
+        Dictionary of partitioned kinetic energy trajectories (nframes x 1)
+        for the group.
+    """
+    if dict_keys is None:
+        dict_keys = ['tot', 'tra', 'rni', 'rot', 'int']
+    indicator = None
+    if molec_group is not None:
+        indicator = group_indicator(molec_group, nmolecs)
+    kin = {}
+    for key in dict_keys:
+        if isinstance(kin_molec, np.ndarray) and kin_molec.dtype.names is not None:
+            k = kin_molec[key]
+        else:
+            k = np.array([frame[key] for frame in kin_molec])
+        k = np.asarray(k, dtype=np.float64).reshape(len(kin_molec), nmolecs)
+        if indicator is None:
+            kin[key] = np.sum(k, axis=1)
+        else:
+            kin[key] = k.dot(indicator)
     return kin
 
 
+def calc_temperature_trajectory(kin_molec, ndof_molec, nmolecs, molec_group=None,
+                                dict_keys=None):
+    r"""
+    Calculates the partitioned temperature for a given group or the
+    entire system for every frame of a trajectory.
+
+    Parameters
+    ----------
+    kin_molec : nd-array or List[dict]
+        Partitioned kinetic energies per molecule for every frame.
+    ndof_molec : dict
+        Partitioned degrees of freedom per molecule.
+    nmolecs : int
+        Total number of molecules in the system.
+    molec_group : iterable
+        Indeces of the group to be summed up. None defaults to all molecules
+        in the system. Default: None.
+    dict_keys : List[str], optional
+        Partitions of the kinetic energy.
+        Default: ['tot', 'tra', 'rni', 'rot', 'int'].
+
+    Returns
+    -------
+    temp : dict
+        Dictionary of partitioned temperature trajectories (nframes x 1)
+        for the group.
+    """
+    kin = group_kinetic_energy_trajectory(kin_molec, nmolecs, molec_group, dict_keys)
+    ndof = group_ndof(ndof_molec, nmolecs, molec_group)
+
+    # temperature is linear in the kinetic energy
+    return {key: kin[key] * temperature(1, ndof[key]) for key in kin}
+
+
 def group_ndof(ndof_molec, nmolecs, molec_group=None):
     r"""
     Sums up the partitioned degrees of freedom for a
@@ -670,7 +1038,7 @@ def group_ndof(ndof_molec, nmolecs, molec_group=None):
 
     Parameters
     ----------
-    ndof_molec : List[dict]
+    ndof_molec : dict
         Partitioned degrees of freedom per molecule.
     nmolecs : int
         Total number of molecules in the system.
@@ -683,17 +1051,13 @@ def group_ndof(ndof_molec, nmolecs, molec_group=None):
     ndof : dict
         Dictionary of partitioned degrees of freedom for the group.
     """
-    #
-    ndof = {'tot': 0, 'tra': 0, 'rni': 0, 'rot': 0, 'int': 0}
-    #
+    ndof_molec = ndof_arrays(ndof_molec)
     if molec_group is None:
-        molec_group = range(nmolecs)
-    # loop over molecules
-    for idx_molec in molec_group:
-        for key in ndof.keys():
-            ndof[key] += ndof_molec[idx_molec][key]
-
-    return ndof
+        return {key: np.sum(ndof_molec[key])
+                for key in ['tot', 'tra', 'rni', 'rot', 'int']}
+    indicator = group_indicator(molec_group, nmolecs)
+    return {key: indicator.dot(ndof_molec[key])
+            for key in ['tot', 'tra', 'rni', 'rot', 'int']}
 
 
 def calc_temperatures(kin_molec, ndof_molec, nmolecs, molec_group=None):
@@ -705,7 +1069,7 @@ def calc_temperatures(kin_molec, ndof_molec, nmolecs, molec_group=None):
     ----------
     kin_molec : List[dict]
         Partitioned kinetic energies per molecule.
-    ndof_molec : List[dict]
+    ndof_molec : dict
         Partitioned degrees of freedom per molecule.
     nmolecs : int
         Total number of molecules in the system.
@@ -742,7 +1106,7 @@ def test_mb_dist(kin_molec, ndof_molec, nmolecs,
     ----------
     kin_molec : List[List[dict]]
         Partitioned kinetic energies per molecule for every frame.
-    ndof_molec : List[dict]
+    ndof_molec : dict
         Partitioned degrees of freedom per molecule.
     nmolecs : int
         Total number of molecules in the system.
@@ -770,14 +1134,9 @@ def test_mb_dist(kin_molec, ndof_molec, nmolecs,
     result : List[float]
         p value for every partition
     """
-    # save the partitioned kinetic energy trajectories
-    group_kin = {key: [] for key in dict_keys}
+    # partitioned kinetic energy trajectories
+    group_kin = group_kinetic_energy_trajectory(kin_molec, nmolecs, group, dict_keys)
     ndof = group_ndof(ndof_molec, nmolecs, group)
-    # loop over frames
-    for k in kin_molec:
-        frame_kin = group_kinetic_energy(k, nmolecs, group)
-        for key in dict_keys:
-            group_kin[key].append(frame_kin[key])
 
     result = []
     failed = 0
@@ -829,7 +1188,7 @@ def test_temp_diff(kin_molec, ndof_molec, nmolecs,
     ----------
     kin_molec : List[List[dict]]
         Partitioned kinetic energies per molecule for every frame.
-    ndof_molec : List[dict]
+    ndof_molec : dict
         Partitioned degrees of freedom per molecule.
     nmolecs : int
         Total number of molecules in the system.
@@ -855,13 +1214,9 @@ def test_temp_diff(kin_molec, ndof_molec, nmolecs,
     result : List[float]
         Temperature ratio to the total temperature for every partition.
     """
-    # save the partitioned temperature trajectories
-    group_temp = {key: [] for key in dict_keys}
-    # loop over frames
-    for k in kin_molec:
-        frame_temp = calc_temperatures(k, ndof_molec, nmolecs, group)
-        for key in dict_keys:
-            group_temp[key].append(frame_temp[key])
+    # partitioned temperature trajectories
+    group_temp = calc_temperature_trajectory(kin_molec, ndof_molec, nmolecs,
+                                             group, dict_keys)
     # average temperature
     group_temp_avg = {}
     for key in dict_keys:
@@ -933,7 +1288,7 @@ def test_temp_diff_groups(kin_molec, ndof_molec, nmolecs,
     ----------
     kin_molec : List[List[dict]]
         Partitioned kinetic energies per molecule for every frame.
-    ndof_molec : List[dict]
+    ndof_molec : dict
         Partitioned degrees of freedom per molecule.
     nmolecs : int
         Total number of molecules in the system.
@@ -954,24 +1309,16 @@ def test_temp_diff_groups(kin_molec, ndof_molec, nmolecs,
     result : List[float]
         Temperature ratio (first group / second group) for every partition.
     """
-    # save the partitioned temperature trajectories (group1)
-    group1_temp = {key: [] for key in dict_keys}
-    # loop over frames
-    for k in kin_molec:
-        frame_temp = calc_temperatures(k, ndof_molec, nmolecs, group1)
-        for key in dict_keys:
-            group1_temp[key].append(frame_temp[key])
+    # partitioned temperature trajectories (group1)
+    group1_temp = calc_temperature_trajectory(kin_molec, ndof_molec, nmolecs,
+                                              group1, dict_keys)
     # average temperature
     for key in dict_keys:
         group1_temp[key] = np.mean(group1_temp[key])
 
-    # save the partitioned temperature trajectories (group2)
-    group2_temp = {key: [] for key in dict_keys}
-    # loop over frames
-    for k in kin_molec:
-        frame_temp = calc_temperatures(k, ndof_molec, nmolecs, group2)
-        for key in dict_keys:
-            group2_temp[key].append(frame_temp[key])
+    # partitioned temperature trajectories (group2)
+    group2_temp = calc_temperature_trajectory(kin_molec, ndof_molec, nmolecs,
+                                              group2, dict_keys)
     # average temperature
     for key in dict_keys:
         group2_temp[key] = np.mean(group2_temp[key])
@@ -0,0 +1,215 @@
+###########################################################################
+#                                                                         #
+#    physical_validation,                                                 #
+#    a python package to test the physical validity of MD results         #
+#                                                                         #
+#    Written by Michael R. Shirts <michael.shirts@colorado.edu>           #
+#               Pascal T. Merz <pascal.merz@colorado.edu>                 #
+#                                                                         #
+#    Copyright (C) 2012 University of Virginia                            #
+#              (C) 2017 University of Colorado Boulder                    #
+#                                                                         #
+#    This library is free software; you can redistribute it and/or        #
+#    modify it under the terms of the GNU Lesser General Public           #
+#    License as published by the Free Software Foundation; either         #
+#    version 2.1 of the License, or (at your option) any later version.   #
+#                                                                         #
+#    This library is distributed in the hope that it will be useful,      #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of       #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU    #
+#    Lesser General Public License for more details.                      #
+#                                                                         #
+#    You should have received a copy of the GNU Lesser General Public     #
+#    License along with this library; if not, write to the                #
+#    Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,     #
+#    Boston, MA 02110-1301 USA                                            #
+#                                                                         #
+###########################################################################
+r"""
+Lightweight profiling of the physical_validation hot paths.
+
+Functions decorated with :func:`profiled` and blocks wrapped in a
+:class:`timer` context record their number of calls and cumulative run
+time in a process-wide registry once profiling is enabled. When disabled
+(the default), the overhead is a single flag check per call.
+
+Profiling is enabled by calling :func:`enable`, or by setting the
+environment variable `PHYSICAL_VALIDATION_PROFILE` to a non-empty value
+before importing physical_validation. Only calls in the current process
+are recorded; calls in worker processes (e.g. the per-frame kinetic
+energy decomposition) are accounted for by the calling function.
+
+Example::
+
+    from physical_validation.util import profiling
+    profiling.enable()
+    ...
+    profiling.report()
+"""
+from __future__ import print_function
+from __future__ import division
+
+import functools
+import os
+import sys
+import time
+
+try:
+    _clock = time.perf_counter
+except AttributeError:
+    _clock = time.time
+
+_enabled = bool(os.environ.get('PHYSICAL_VALIDATION_PROFILE'))
+# name -> [number of calls, cumulative time]
+_timers = {}
+
+
+def enable():
+    r"""Enables profiling."""
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    r"""Disables profiling. Recorded timings are kept."""
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    r"""
+    Returns
+    -------
+    enabled : bool
+        Whether profiling is enabled.
+    """
+    return _enabled
+
+
+def reset():
+    r"""Discards all recorded timings."""
+    _timers.clear()
+
+
+def record(name, elapsed, calls=1):
+    r"""
+    Adds a measurement to the registry.
+
+    Parameters
+    ----------
+    name : str
+        Name of the timer.
+    elapsed : float
+        Time in seconds.
+    calls : int, optional
+        Number of calls the measurement covers. Default: 1.
+    """
+    entry = _timers.get(name)
+    if entry is None:
+        _timers[name] = [calls, elapsed]
+    else:
+        entry[0] += calls
+        entry[1] += elapsed
+
+
+def results():
+    r"""
+    Returns
+    -------
+    results : dict
+        Dictionary mapping the timer names to dictionaries with keys
+        'calls' and 'time' (cumulative, in seconds).
+    """
+    return {name: {'calls': entry[0], 'time': entry[1]}
+            for name, entry in _timers.items()}
+
+
+def merge(other):
+    r"""
+    Adds timings recorded elsewhere (e.g. in a different process) to the
+    registry.
+
+    Parameters
+    ----------
+    other : dict
+        Timings in the format returned by :func:`results`.
+    """
+    for name, entry in other.items():
+        record(name, entry['time'], entry['calls'])
+
+
+def report(file=None):
+    r"""
+    Prints the recorded timings, sorted by cumulative time.
+
+    Parameters
+    ----------
+    file : file-like, optional
+        Output stream. Default: sys.stdout.
+    """
+    if file is None:
+        file = sys.stdout
+    print('{:52s} {:>10s} {:>12s} {:>12s}'.format('timer', 'calls', 'total [s]', 'per call [s]'),
+          file=file)
+    for name, entry in sorted(_timers.items(), key=lambda item: -item[1][1]):
+        print('{:52s} {:10d} {:12.4f} {:12.6f}'.format(name, entry[0], entry[1],
+                                                      entry[1] / max(entry[0], 1)),
+              file=file)
+
+
+class timer(object):
+    r"""
+    Context manager timing the enclosed block.
+
+    Parameters
+    ----------
+    name : str
+        Name of the timer.
+    """
+    __slots__ = ['name', 'start']
+
+    def __init__(self, name):
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        if _enabled:
+            self.start = _clock()
+        return self
+
+    def __exit__(self, *exc):
+        if self.start is not None:
+            record(self.name, _clock() - self.start)
+            self.start = None
+        return False
+
+
+def profiled(name=None):
+    r"""
+    Decorator timing every call of the decorated function.
+
+    Parameters
+    ----------
+    name : str, optional
+        Name of the timer. Default: Module (relative to the
+        physical_validation package) and name of the function.
+    """
+    def decorator(func):
+        timer_name = name
+        if timer_name is None:
+            module = func.__module__
+            if module.startswith('physical_validation.'):
+                module = module[len('physical_validation.'):]
+            timer_name = module + '.' + func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            start = _clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(timer_name, _clock() - start)
+        return wrapper
+    return decorator
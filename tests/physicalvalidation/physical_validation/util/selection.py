@@ -0,0 +1,259 @@
+###########################################################################
+#                                                                         #
+#    physical_validation,                                                 #
+#    a python package to test the physical validity of MD results         #
+#                                                                         #
+#    Written by Michael R. Shirts <michael.shirts@colorado.edu>           #
+#               Pascal T. Merz <pascal.merz@colorado.edu>                 #
+#                                                                         #
+#    Copyright (C) 2012 University of Virginia                            #
+#              (C) 2017 University of Colorado Boulder                    #
+#                                                                         #
+#    This library is free software; you can redistribute it and/or        #
+#    modify it under the terms of the GNU Lesser General Public           #
+#    License as published by the Free Software Foundation; either         #
+#    version 2.1 of the License, or (at your option) any later version.   #
+#                                                                         #
+#    This library is distributed in the hope that it will be useful,      #
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of       #
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU    #
+#    Lesser General Public License for more details.                      #
+#                                                                         #
+#    You should have received a copy of the GNU Lesser General Public     #
+#    License along with this library; if not, write to the                #
+#    Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,     #
+#    Boston, MA 02110-1301 USA                                            #
+#                                                                         #
+###########################################################################
+r"""
+Selection of groups of molecules from topology attributes.
+
+Groups are represented as boolean masks over all molecules of a system,
+such that set algebra (intersection, union, complement) is performed on
+NumPy arrays rather than on lists of indices.
+
+Selection expressions combine the following keywords:
+
+* `all`, `none`: all or no molecules
+* `name NAME [NAME ...]`: molecules of the given molecule type(s)
+* `natoms SPEC [SPEC ...]`: molecules with the given number of atoms
+* `index SPEC [SPEC ...]`: molecules with the given indices
+
+where `SPEC` is either a single number `n` or a range `a:b`
+(`a <= x < b`, either bound can be omitted). Selections can be combined
+using `and`, `or`, `not` and parentheses, e.g. `name SOL and index :100`
+or `not (name SOL or name NA CL)`.
+"""
+import numpy as np
+
+from . import error as pv_error
+
+
+def molecule_mask(system, name=None, natoms=None, index=None):
+    r"""
+    Creates a boolean mask over the molecules of a system. All given
+    criteria have to be fulfilled.
+
+    Parameters
+    ----------
+    system : SystemData
+        System the molecules are selected from.
+    name : str or List[str], optional
+        Molecule type name(s).
+    natoms : int, slice or List[int], optional
+        Number(s) of atoms per molecule.
+    index : int, slice or array-like, optional
+        Molecule indices.
+
+    Returns
+    -------
+    mask : nd-array (nmolecs x 1)
+        Boolean mask of the selected molecules.
+    """
+    nmolecs = system.molecule_idx.size
+    mask = np.ones(nmolecs, dtype=bool)
+    if name is not None:
+        if system.molecule_names is None:
+            raise pv_error.InputError('name',
+                                      'Selecting molecules by name requires `molecule_names`.')
+        mask &= np.isin(system.molecule_names, name)
+    if natoms is not None:
+        molec_natoms = np.diff(np.append(system.molecule_idx, [system.natoms]))
+        if isinstance(natoms, slice):
+            mask &= _range_mask(molec_natoms, natoms)
+        else:
+            mask &= np.isin(molec_natoms, natoms)
+    if index is not None:
+        selected = np.zeros(nmolecs, dtype=bool)
+        selected[index] = True
+        mask &= selected
+    return mask
+
+
+def _range_mask(values, rng):
+    mask = np.ones(values.shape, dtype=bool)
+    if rng.start is not None:
+        mask &= values >= rng.start
+    if rng.stop is not None:
+        mask &= values < rng.stop
+    return mask
+
+
+def _parse_spec(token):
+    try:
+        if ':' in token:
+            start, stop = token.split(':', 1)
+            return slice(int(start) if start else None,
+                         int(stop) if stop else None)
+        return int(token)
+    except ValueError:
+        raise pv_error.InputError('expression',
+                                  'Expected number or range, found `' + token + '`.')
+
+
+_keywords = ('all', 'none', 'name', 'natoms', 'index', 'and', 'or', 'not', '(', ')')
+
+
+class _Parser(object):
+    # Recursive descent parser for selection expressions
+    #   expr   := term ('or' term)*
+    #   term   := factor ('and' factor)*
+    #   factor := 'not' factor | '(' expr ')' | atom
+    def __init__(self, system, expression):
+        self.system = system
+        self.nmolecs = system.molecule_idx.size
+        self.tokens = expression.replace('(', ' ( ').replace(')', ' ) ').split()
+        self.pos = 0
+
+    def peek(self):
+        if self.pos < len(self.tokens):
+            return self.tokens[self.pos]
+        return None
+
+    def next(self):
+        token = self.peek()
+        if token is None:
+            raise pv_error.InputError('expression',
+                                      'Unexpected end of selection expression.')
+        self.pos += 1
+        return token
+
+    def arguments(self):
+        args = []
+        while self.peek() is not None and self.peek() not in _keywords:
+            args.append(self.next())
+        if not args:
+            raise pv_error.InputError('expression',
+                                      'Missing argument in selection expression.')
+        return args
+
+    def parse(self):
+        mask = self.expr()
+        if self.peek() is not None:
+            raise pv_error.InputError('expression',
+                                      'Unexpected `' + self.peek() + '` in selection expression.')
+        return mask
+
+    def expr(self):
+        mask = self.term()
+        while self.peek() == 'or':
+            self.next()
+            mask = mask | self.term()
+        return mask
+
+    def term(self):
+        mask = self.factor()
+        while self.peek() == 'and':
+            self.next()
+            mask = mask & self.factor()
+        return mask
+
+    def factor(self):
+        token = self.next()
+        if token == 'not':
+            return ~self.factor()
+        if token == '(':
+            mask = self.expr()
+            if self.next() != ')':
+                raise pv_error.InputError('expression',
+                                          'Missing `)` in selection expression.')
+            return mask
+        if token == 'all':
+            return np.ones(self.nmolecs, dtype=bool)
+        if token == 'none':
+            return np.zeros(self.nmolecs, dtype=bool)
+        if token == 'name':
+            return molecule_mask(self.system, name=self.arguments())
+        if token in ('natoms', 'index'):
+            mask = np.zeros(self.nmolecs, dtype=bool)
+            for spec in [_parse_spec(a) for a in self.arguments()]:
+                mask |= molecule_mask(self.system, **{token: spec})
+            return mask
+        raise pv_error.InputError('expression',
+                                  'Unknown keyword `' + token + '` in selection expression.')
+
+
+def select(system, expression):
+    r"""
+    Evaluates a selection expression.
+
+    Parameters
+    ----------
+    system : SystemData
+        System the molecules are selected from.
+    expression : str
+        Selection expression, see module documentation.
+
+    Returns
+    -------
+    mask : nd-array (nmolecs x 1)
+        Boolean mask of the selected molecules.
+    """
+    return _Parser(system, expression).parse()
+
+
+def group_indices(group, nmolecs):
+    r"""
+    Converts a group of molecules to an array of molecule indices.
+
+    Parameters
+    ----------
+    group : array-like
+        Boolean mask (nmolecs x 1) or molecule indices.
+    nmolecs : int
+        Total number of molecules in the system.
+
+    Returns
+    -------
+    indices : nd-array
+        Molecule indices of the group.
+    """
+    group = np.asarray(group)
+    if group.dtype == bool:
+        if group.size != nmolecs:
+            raise pv_error.InputError('group',
+                                      'Expected boolean mask of length nmolecs.')
+        return np.flatnonzero(group)
+    return group.astype(int).reshape(-1)
+
+
+def complement(groups, nmolecs):
+    r"""
+    Returns the molecules not contained in any of the given groups.
+
+    Parameters
+    ----------
+    groups : List[array-like]
+        Boolean masks or molecule indices.
+    nmolecs : int
+        Total number of molecules in the system.
+
+    Returns
+    -------
+    indices : nd-array
+        Molecule indices of the remaining molecules.
+    """
+    rest = np.ones(nmolecs, dtype=bool)
+    for group in groups:
+        rest[group_indices(group, nmolecs)] = False
+    return np.flatnonzero(rest)
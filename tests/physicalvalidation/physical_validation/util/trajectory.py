@@ -29,14 +29,15 @@
 from __future__ import division
 
 import numpy as np
-from scipy import stats
-
-from pymbar import timeseries
 
 from . import error as pv_error
+from . import profiling
 
 
+@profiling.profiled()
 def equilibrate(traj, verbose=False, name=None):
+    from pymbar import timeseries
+
     traj = np.array(traj)
     if traj.ndim == 1:
         t0, g, n_eff = timeseries.detectEquilibration(traj)
@@ -83,7 +84,10 @@ def equilibrate(traj, verbose=False, name=None):
     return res
 
 
+@profiling.profiled()
 def decorrelate(traj, facs=None, verbose=False, name=None):
+    from pymbar import timeseries
+
     traj = np.array(traj)
     if traj.ndim == 1:
         idx = timeseries.subsampleCorrelatedData(traj)
@@ -126,6 +130,8 @@ def decorrelate(traj, facs=None, verbose=False, name=None):
 
 
 def cut_tails(traj, cut, verbose=False, name=None):
+    from scipy import stats
+
     traj = np.array(traj)
     dc = 100 * cut
     if traj.ndim == 1:
@@ -155,6 +161,7 @@ def cut_tails(traj, cut, verbose=False, name=None):
     return t
 
 
+@profiling.profiled()
 def prepare(traj, cut=None, facs=None, verbosity=1, name=None):
     traj = np.array(traj)
     if not name:
@@ -202,6 +209,8 @@ def prepare(traj, cut=None, facs=None, verbosity=1, name=None):
 
 
 def overlap(traj1, traj2, cut=None, verbose=False, name=None):
+    from scipy import stats
+
     traj1 = np.array(traj1)
     traj2 = np.array(traj2)
     if traj1.ndim == traj2.ndim and traj2.ndim == 1: